@@ -0,0 +1,95 @@
+# Measures how much logging from a coroutine delays the event loop: a ticker coroutine sleeps 1ms in a loop and records
+# how late it wakes up, while another coroutine logs in bursts. Compares the threaded Logger with the AsyncLogger.
+#
+#   python -m benchmarks.bench_aio [--records 20000] [--burst 100] [--latency 0.02]
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy import Logger, BundlingHttpSink
+from loggingpy.aio import AsyncLogger, AsyncBundlingHttpSink
+
+TICK = 0.001
+
+
+async def ticker(lags, done):
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def produce(logger, records, burst):
+    for i in range(records):
+        logger.info('hello', payload_type='Record', payload={'index': i})
+        if i % burst == 0:
+            await asyncio.sleep(0)
+
+
+async def run(logger, records, burst, flush):
+    lags = []
+    done = asyncio.Event()
+    tick = asyncio.get_running_loop().create_task(ticker(lags, done))
+    start = time.perf_counter()
+    await produce(logger, records, burst)
+    await flush()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return lags, elapsed
+
+
+def report(name, lags, elapsed, records):
+    lags = sorted(lag * 1000 for lag in lags)
+    print('{:>10} {:>10.2f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10}'.format(
+        name, elapsed, statistics.median(lags), lags[int(len(lags) * 0.99)], lags[-1], records))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--burst', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency).start()
+    print('{:>10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'logger', 'seconds', 'p50 ms', 'p99 ms', 'max ms', 'delivered'))
+
+    sink = BundlingHttpSink('bench', 'bench', server.url, logs_drain_timeout=1)
+    Logger.with_sink(sink)
+    logger = Logger('Threaded')
+    logger.set_level(logging.DEBUG)
+
+    async def flush_threaded():
+        # the queue listener thread formats and hands the records to the sink in the background
+        while server.records < args.records:
+            Logger.flush()
+            await asyncio.sleep(0.01)
+
+    lags, elapsed = asyncio.run(run(logger, args.records, args.burst, flush_threaded))
+    report('threaded', lags, elapsed, server.records)
+    sink.close()
+
+    server.reset()
+    async_sink = AsyncBundlingHttpSink('bench', 'bench', server.url, logs_drain_timeout=1)
+    AsyncLogger.with_sink(async_sink)
+
+    async_logger = AsyncLogger('Async')
+    async_logger.set_level(logging.DEBUG)
+
+    async def run_async():
+        result = await run(async_logger, args.records, args.burst, AsyncLogger.flush)
+        await async_sink.close()
+        return result
+
+    lags, elapsed = asyncio.run(run_async())
+    report('async', lags, elapsed, server.records)
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
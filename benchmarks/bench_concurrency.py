@@ -0,0 +1,43 @@
+# Measures the upload throughput of HttpSender for a growing number of concurrent uploads against a stub endpoint
+# which answers every bulk after a fixed latency.
+#
+#   python -m benchmarks.bench_concurrency [--records 50000] [--latency 0.05] [--batch 500]
+import argparse
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy.sender import HttpSender
+
+RECORD = '{"level": "Info", "context": "Benchmark", "payload_type": "Benchmark.Record", "message": "hello"}'
+
+
+def run(server, records, batch, concurrency):
+    server.reset()
+    sender = HttpSender(server.url, flush_max_records=batch, concurrency=concurrency)
+    start = time.perf_counter()
+    for _ in range(records):
+        sender.append(RECORD)
+    sender.flush()
+    elapsed = time.perf_counter() - start
+    sender.close()
+    return server.records, server.requests, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency).start()
+    print('{:>11} {:>10} {:>10} {:>10} {:>12}'.format('concurrency', 'records', 'requests', 'seconds', 'records/s'))
+    for concurrency in (1, 2, 4, 8, 16):
+        records, requests, elapsed = run(server, args.records, args.batch, concurrency)
+        print('{:>11} {:>10} {:>10} {:>10.2f} {:>12.0f}'.format(
+            concurrency, records, requests, elapsed, records / elapsed))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
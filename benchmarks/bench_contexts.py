@@ -0,0 +1,62 @@
+# Measures the startup time, thread count and memory of creating many logger contexts. The shared dispatcher is
+# compared with the former setup, which started a queue and a QueueListener thread per sink for every context.
+#
+#   python -m benchmarks.bench_contexts [--contexts 5000] [--sinks 3]
+import argparse
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import tracemalloc
+
+from loggingpy import Logger
+
+
+class NullSink(logging.Handler):
+
+    def emit(self, record):
+        pass
+
+
+def per_context_listeners(name, sinks):
+    logger = logging.getLogger(name)
+    for sink in sinks:
+        log_queue = queue.Queue(-1)
+        logging.handlers.QueueListener(log_queue, sink).start()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+def shared_dispatcher(name, sinks):
+    Logger(name)
+
+
+def measure(create, prefix, contexts, sinks):
+    threads = threading.active_count()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(contexts):
+        create('{}{}'.format(prefix, i), sinks)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, threading.active_count() - threads, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contexts', type=int, default=5000)
+    parser.add_argument('--sinks', type=int, default=3)
+    args = parser.parse_args()
+
+    sinks = [NullSink() for _ in range(args.sinks)]
+    Logger.with_sinks(sinks)
+
+    print('{:>12} {:>10} {:>10} {:>10}'.format('setup', 'seconds', 'threads', 'peak MB'))
+    for name, create in (('shared', shared_dispatcher), ('per-context', per_context_listeners)):
+        elapsed, threads, peak = measure(create, name, args.contexts, sinks)
+        print('{:>12} {:>10.2f} {:>10} {:>10.1f}'.format(name, elapsed, threads, peak / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
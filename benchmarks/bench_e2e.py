@@ -0,0 +1,229 @@
+# End-to-end benchmark of Logger with the HTTP sinks against the local ingestion stub. For every scenario it measures
+# the delivered records per second, the latency of the logging calls on the caller, the delivery latency from the call
+# until the stub received the record, the CPU time and the resident memory. The results can be saved as JSON and
+# compared with the results of another version to spot regressions.
+#
+#   python -m benchmarks.bench_e2e [--records 20000] [--latency 0.02] [--error-rate 0] [--rate 0] [--settle 10]
+#                                  [--scenarios bundling,bundling-gzip,simple] [--output results.json]
+#                                  [--compare baseline.json]
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy import Logger, BundlingHttpSink, SimpleHttpSink
+
+SENT_NS = re.compile(rb'"sent_ns": (\d+)')
+
+# the simple sink posts every record on the dispatcher thread, a fraction of the records is enough
+SIMPLE_RECORDS_DIVISOR = 10
+
+# the metrics compared by --compare, and whether a higher value is better
+COMPARED_METRICS = (
+    ('records_per_second', True),
+    ('caller_p50_us', False),
+    ('caller_p99_us', False),
+    ('delivery_p50_ms', False),
+    ('delivery_p99_ms', False),
+    ('cpu_seconds', False),
+    ('rss_mb', False),
+)
+
+
+class DeliveryTracker:
+    """
+    Collects the delivery latencies of the records the stub accepted, from the sent_ns field of their payload.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+
+    def on_records(self, records):
+        received = time.time_ns()
+        latencies = [received - int(match.group(1)) for match in map(SENT_NS.search, records) if match]
+        with self.lock:
+            self.latencies.extend(latencies)
+
+    def reset(self):
+        with self.lock:
+            self.latencies = []
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        # not on linux, fall back to the peak
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def make_sink(scenario, url):
+    if scenario == 'bundling':
+        return BundlingHttpSink('bench', 'bench', url, logs_drain_timeout=1)
+    if scenario == 'bundling-gzip':
+        return BundlingHttpSink('bench', 'bench', url, logs_drain_timeout=1, compression='gzip')
+    if scenario == 'simple':
+        return SimpleHttpSink(url)
+    raise ValueError("Unknown scenario '{}'".format(scenario))
+
+
+def run_scenario(scenario, server, tracker, records, rate, timeout, settle):
+    server.reset()
+    tracker.reset()
+    sink = make_sink(scenario, server.url)
+    Logger.with_sink(sink)
+    logger = Logger('Benchmark')
+    logger.set_level(logging.DEBUG)
+
+    interval_ns = int(1e9 / rate) if rate else 0
+    caller = []
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    next_ns = time.perf_counter_ns()
+    for i in range(records):
+        if interval_ns:
+            next_ns += interval_ns
+            while time.perf_counter_ns() < next_ns:
+                pass
+        call_start = time.perf_counter_ns()
+        logger.info('hello', payload_type='Record', payload={'index': i, 'sent_ns': time.time_ns()})
+        caller.append(time.perf_counter_ns() - call_start)
+    logging_seconds = time.perf_counter() - start
+
+    # the records which are still buffered are sent by the sink's drain timer, wait for them like a service would.
+    # Records which failed for good never arrive, so stop once nothing arrived for settle seconds
+    deadline = time.perf_counter() + timeout
+    delivered, delivered_at = server.records, time.perf_counter()
+    while delivered < records and time.perf_counter() < min(deadline, delivered_at + settle):
+        time.sleep(0.001)
+        if server.records != delivered:
+            delivered, delivered_at = server.records, time.perf_counter()
+    elapsed = delivered_at - start
+    cpu_seconds = time.process_time() - cpu_start
+    rss = rss_mb()
+
+    sink.close()
+    Logger.shutdown()
+    Logger.sinks[:] = []
+
+    with tracker.lock:
+        delivery = list(tracker.latencies)
+    return {
+        'records': records,
+        'delivered': delivered,
+        'requests': server.requests,
+        'seconds': round(elapsed, 3),
+        'logging_seconds': round(logging_seconds, 3),
+        'records_per_second': round(delivered / elapsed, 1),
+        'caller_p50_us': round(percentile(caller, 0.5) / 1e3, 2),
+        'caller_p99_us': round(percentile(caller, 0.99) / 1e3, 2),
+        'delivery_p50_ms': round(percentile(delivery, 0.5) / 1e6, 2) if delivery else None,
+        'delivery_p99_ms': round(percentile(delivery, 0.99) / 1e6, 2) if delivery else None,
+        'cpu_seconds': round(cpu_seconds, 3),
+        'rss_mb': round(rss, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print()
+    print('{:<14} {:<20} {:>12} {:>12} {:>9}'.format('scenario', 'metric', 'baseline', 'current', 'change'))
+    for scenario, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(scenario)
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = change < 0 if higher_is_better else change > 0
+            print('{:<14} {:<20} {:>12} {:>12} {:>+8.1f}%{}'.format(
+                scenario, metric, before, after, change, ' *' if worse and abs(change) >= 10 else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds the stub delays every response')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of the requests the stub fails')
+    parser.add_argument('--error-status-codes', default='503', help='comma separated status codes of the failures')
+    parser.add_argument('--rate', type=float, default=0, help='records per second to log, 0 for as fast as possible')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for the delivery of the records')
+    parser.add_argument('--settle', type=float, default=10,
+                        help='seconds without a delivered record after which the remaining records count as lost')
+    parser.add_argument('--scenarios', default='bundling,bundling-gzip,simple')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', help='compare with the JSON results of an earlier run')
+    args = parser.parse_args()
+
+    tracker = DeliveryTracker()
+    server = StubServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status_codes=tuple(int(code) for code in args.error_status_codes.split(',')),
+        on_records=tracker.on_records).start()
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'args': vars(args),
+        },
+        'scenarios': {},
+    }
+    print('{:<14} {:>8} {:>9} {:>10} {:>9} {:>9} {:>10} {:>10} {:>8} {:>7}'.format(
+        'scenario', 'records', 'delivered', 'records/s', 'call p50', 'call p99', 'deliv p50', 'deliv p99', 'cpu s',
+        'rss MB'))
+    for scenario in args.scenarios.split(','):
+        records = args.records // SIMPLE_RECORDS_DIVISOR if scenario == 'simple' else args.records
+        result = results['scenarios'][scenario] = run_scenario(
+            scenario, server, tracker, records, args.rate, args.timeout, args.settle)
+        print('{:<14} {:>8} {:>9} {:>10.0f} {:>7.1f}us {:>7.1f}us {:>8}ms {:>8}ms {:>8.2f} {:>7.1f}'.format(
+            scenario, result['records'], result['delivered'], result['records_per_second'], result['caller_p50_us'],
+            result['caller_p99_us'], result['delivery_p50_ms'], result['delivery_p99_ms'], result['cpu_seconds'],
+            result['rss_mb']))
+    server.stop()
+    results['meta']['peak_rss_mb'] = round(peak_rss_mb(), 1)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
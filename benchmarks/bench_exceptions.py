@@ -0,0 +1,91 @@
+# Measures the cost of logger.error(exception=e) on the calling thread: its latency while the sink formats records on
+# the dispatcher thread, and the memory the queued records keep alive while the sink is stalled. The exception is
+# queued as is, as is with the formatting and copying of the stdlib QueueHandler, or as a snapshot.
+#
+#   python -m benchmarks.bench_exceptions [--calls 20000] [--depth 20]
+import argparse
+import logging
+import logging.handlers
+import statistics
+import threading
+import time
+import tracemalloc
+
+from loggingpy import Logger
+from loggingpy.dispatch import DispatchHandler
+from loggingpy.log import JsonFormatter
+
+
+class FormattingSink(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.setFormatter(JsonFormatter())
+        self.stalled = threading.Event()
+        self.stalled.set()
+
+    def emit(self, record):
+        self.stalled.wait()
+        self.format(record)
+
+
+def fail(depth):
+    buffer = bytearray(4096)  # noqa F841, a local which is kept alive as long as the frame
+    if depth:
+        fail(depth - 1)
+    raise ValueError('request failed')
+
+
+def log_exceptions(logger, calls, depth):
+    latencies = []
+    for i in range(calls):
+        try:
+            fail(depth)
+        except ValueError as e:
+            start = time.perf_counter_ns()
+            logger.error('failed', exception=e)
+            latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def queued_memory(sink, logger, depth):
+    sink.stalled.clear()
+    tracemalloc.start()
+    log_exceptions(logger, 200, depth)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sink.stalled.set()
+    Logger.flush()
+    return size / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--depth', type=int, default=20)
+    args = parser.parse_args()
+
+    sink = FormattingSink()
+    Logger.with_sink(sink)
+    logger = Logger('Benchmark')
+    logger.set_level(logging.DEBUG)
+
+    modes = (('queue handler', False, None), ('exception', False, None), ('snapshot', True, None),
+             ('snapshot 5', True, 5))
+    print('{:>14} {:>10} {:>10} {:>10} {:>18}'.format('mode', 'mean us', 'p50 us', 'p99 us', '200 queued MB'))
+    for name, snapshots, max_frames in modes:
+        Logger.with_exception_snapshots(snapshots, max_frames)
+        prepare = logging.handlers.QueueHandler.prepare if name == 'queue handler' else DispatchHandler.prepare
+        Logger.dispatcher.handler.prepare = prepare.__get__(Logger.dispatcher.handler)
+
+        latencies = sorted(log_exceptions(logger, args.calls, args.depth))
+        Logger.flush()
+        memory = queued_memory(sink, logger, args.depth)
+        print('{:>14} {:>10.1f} {:>10.1f} {:>10.1f} {:>18.1f}'.format(
+            name, statistics.mean(latencies) / 1000, latencies[len(latencies) // 2] / 1000,
+            latencies[int(len(latencies) * 0.99)] / 1000, memory))
+    Logger.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# Measures the CPU time per record of formatting one record for a growing number of sinks. Each sink splices its own
+# app_name and env into the shared serialization, compared with serializing the record again for every sink.
+#
+#   python -m benchmarks.bench_fanout [--records 20000]
+import argparse
+import time
+
+from loggingpy.log import JsonFormatter, LogEntry, LogLevel, Logger
+
+
+def make_record(i):
+    return Logger.make_record(LogEntry(LogLevel.Info, context='Benchmark', payload_type='Benchmark.Record',
+                                       message='hello', payload={'index': i, 'tags': ['a', 'b'], 'user': 'someone'}))
+
+
+def run(records, sinks, shared):
+    formatters = [JsonFormatter() for _ in range(sinks)]
+    fields = [JsonFormatter.encode_fields({'app_name': 'app{}'.format(i), 'env': 'BENCH'}) for i in range(sinks)]
+    start = time.process_time()
+    for i in range(records):
+        record = make_record(i)
+        for formatter, sink_fields in zip(formatters, fields):
+            if not shared:
+                record.__dict__.pop('_json_cache', None)
+            formatter.format_with_fields(record, sink_fields)
+    return (time.process_time() - start) / records * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    print('{:>6} {:>16} {:>16}'.format('sinks', 'per-sink us/rec', 'shared us/rec'))
+    for sinks in (1, 2, 4, 8):
+        print('{:>6} {:>16.1f} {:>16.1f}'.format(
+            sinks, run(args.records, sinks, shared=False), run(args.records, sinks, shared=True)))
+
+
+if __name__ == '__main__':
+    main()
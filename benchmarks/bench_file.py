@@ -0,0 +1,67 @@
+# Compares the throughput of writing JSON log entries to a file with logging.FileHandler and with BundlingFileSink.
+# Both handlers get the same records and the same JsonFormatter, so the difference is the cost of writing: the
+# FileHandler writes and flushes every record on the calling thread under its lock, the sink hands the record to its
+# writing thread which writes it with many others in one call. Reports the records per second of the handle calls and
+# including the close, which waits until everything is written.
+#
+#   python -m benchmarks.bench_file [--records 200000] [--fsync interval] [--compression gzip]
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from loggingpy import BundlingFileSink, FsyncPolicy, JsonFormatter
+
+
+def make_records(count):
+    logger = logging.getLogger('bench')
+    return [logger.makeRecord('bench', logging.INFO, __file__, 0, 'hello %s', (i,), None) for i in range(count)]
+
+
+def run(handler, records):
+    start = time.perf_counter()
+    for record in records:
+        handler.handle(record)
+    handle_seconds = time.perf_counter() - start
+    handler.close()
+    return handle_seconds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--fsync', choices=[policy.value for policy in FsyncPolicy], default='interval')
+    parser.add_argument('--compression', choices=['gzip'], default=None)
+    parser.add_argument('--max-bytes', type=int, default=16 * 1024 * 1024, help='rotation size of the sink')
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    directory = tempfile.TemporaryDirectory()
+
+    print('{:<18} {:>10} {:>14} {:>14} {:>10}'.format('handler', 'records', 'handle rec/s', 'total rec/s', 'MB'))
+
+    path = os.path.join(directory.name, 'file-handler.log')
+    handler = logging.FileHandler(path)
+    handler.setFormatter(JsonFormatter())
+    handle_seconds, total_seconds = run(handler, records)
+    print('{:<18} {:>10} {:>14.0f} {:>14.0f} {:>10.1f}'.format(
+        'FileHandler', len(records), len(records) / handle_seconds, len(records) / total_seconds,
+        os.path.getsize(path) / 1024 / 1024))
+
+    path = os.path.join(directory.name, 'file-sink.log')
+    sink = BundlingFileSink('bench', 'bench', path, max_bytes=args.max_bytes, compression=args.compression,
+                            fsync=FsyncPolicy(args.fsync))
+    sink.setFormatter(JsonFormatter())
+    handle_seconds, total_seconds = run(sink, records)
+    stats = sink.stats()
+    print('{:<18} {:>10} {:>14.0f} {:>14.0f} {:>10.1f}'.format(
+        'BundlingFileSink', stats['records_written'], len(records) / handle_seconds, len(records) / total_seconds,
+        stats['bytes_written'] / 1024 / 1024))
+    print('chunks {}, fsyncs {}, rotations {}'.format(stats['chunks_written'], stats['fsyncs'], stats['rotations']))
+
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
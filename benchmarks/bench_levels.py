@@ -0,0 +1,41 @@
+# Measures the cost of logging calls whose level is disabled, with eager and lazy payloads, next to an enabled call.
+#
+#   python -m benchmarks.bench_levels [--number 200000]
+import argparse
+import logging
+import timeit
+
+from loggingpy import Logger
+
+
+class NullSink(logging.Handler):
+
+    def emit(self, record):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+
+    Logger.with_sink(NullSink())
+    logger = Logger('Benchmark')
+    logger.set_level(logging.INFO)
+    order = {'id': 42, 'items': ['a', 'b'], 'total': 12.5}
+
+    calls = (
+        ('disabled', lambda: logger.debug('hello')),
+        ('disabled + payload', lambda: logger.debug('hello', payload_type='Order', payload=order)),
+        ('disabled + lazy', lambda: logger.debug('hello', payload_type='Order', payload=lambda: dict(order))),
+        ('missing payload type', lambda: logger.debug('hello', payload=order)),
+        ('enabled + lazy', lambda: logger.info('hello', payload_type='Order', payload=lambda: dict(order))),
+    )
+    print('{:>22} {:>10}'.format('call', 'ns/call'))
+    for name, call in calls:
+        print('{:>22} {:>10.0f}'.format(name, timeit.timeit(call, number=args.number) / args.number * 1e9))
+    Logger.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Compares logging one structured entry per item in a loop with Logger.log_many, for a batch job which logs 100k items.
+# The entries go to a BundlingHttpSink posting to the local ingestion stub and to a BundlingFileSink. Reports the time
+# of the logging calls on the caller and the time until the dispatcher handed everything to the sinks.
+#
+#   python -m benchmarks.bench_log_many [--items 100000]
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy import Logger, BundlingHttpSink, BundlingFileSink
+from loggingpy.log import LogLevel
+
+
+def run(logger, items, batched):
+    payloads = [{'index': i, 'status': 'processed'} for i in range(items)]
+    start = time.perf_counter()
+    if batched:
+        logger.log_many(LogLevel.Info, 'Item', payloads)
+    else:
+        for payload in payloads:
+            logger.info(payload_type='Item', payload=payload)
+    caller_seconds = time.perf_counter() - start
+    Logger.flush()
+    return caller_seconds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=100000)
+    args = parser.parse_args()
+
+    server = StubServer().start()
+    directory = tempfile.TemporaryDirectory()
+    http_sink = BundlingHttpSink('bench', 'bench', server.url, logs_drain_timeout=1)
+    file_sink = BundlingFileSink('bench', 'bench', os.path.join(directory.name, 'bench.log'))
+    Logger.with_sinks([http_sink, file_sink])
+    logger = Logger('Batch')
+    logger.set_level(logging.DEBUG)
+
+    print('{:<10} {:>10} {:>12} {:>12} {:>14}'.format('mode', 'items', 'caller s', 'flushed s', 'flushed rec/s'))
+    for mode, batched in (('loop', False), ('log_many', True)):
+        caller_seconds, total_seconds = run(logger, args.items, batched)
+        print('{:<10} {:>10} {:>12.2f} {:>12.2f} {:>14.0f}'.format(
+            mode, args.items, caller_seconds, total_seconds, args.items / total_seconds))
+
+    Logger.shutdown()
+    http_sink.close()
+    file_sink.close()
+    print('delivered {}, written {}'.format(server.records, file_sink.stats()['records_written']))
+    server.stop()
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
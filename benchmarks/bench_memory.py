@@ -0,0 +1,66 @@
+# Measures with tracemalloc what a Logger.info call allocates on the calling thread and what a queued record keeps
+# alive while the dispatcher is stalled. Compares queuing the bare log entry with queuing a log record, which is what
+# happens when other handlers are attached to the standard python loggers.
+#
+#   python -m benchmarks.bench_memory [--records 20000]
+import argparse
+import logging
+import threading
+import tracemalloc
+
+from loggingpy import Logger
+
+
+class StalledSink(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.released = threading.Event()
+
+    def emit(self, record):
+        self.released.wait()
+
+
+def log_records(logger, records):
+    for i in range(records):
+        logger.info('order placed', payload_type='Order', payload={'id': i, 'total': 12.5})
+
+
+def measure(logger, records):
+    # the first record blocks the dispatcher, the following ones stay queued
+    log_records(logger, 1)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    log_records(logger, records)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = [stat for stat in after.compare_to(before, 'filename') if stat.size_diff > 0]
+    size = sum(stat.size_diff for stat in retained)
+    blocks = sum(stat.count_diff for stat in retained)
+    return size / records, blocks / records, peak / records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    print('{:>8} {:>18} {:>18} {:>18}'.format('queued', 'bytes/record', 'blocks/record', 'peak bytes/call'))
+    for name, propagate in (('entry', False), ('record', True)):
+        sink = StalledSink()
+        Logger.sinks[:] = [sink]
+        logger = Logger('Benchmark')
+        logger.set_level(logging.INFO)
+        logger.logger.propagate = propagate
+        logging.getLogger().handlers[:] = [logging.NullHandler()] if propagate else []
+
+        size, blocks, peak = measure(logger, args.records)
+        print('{:>8} {:>18.0f} {:>18.1f} {:>18.0f}'.format(name, size, blocks, peak))
+        sink.released.set()
+        Logger.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Compares forked worker processes which each upload their records through their own BundlingHttpSink with workers
+# which write their records to one LogCollector process over a Unix socket. Reports the time until the stub received
+# all records, the time the workers spent logging, and the connections and requests the stub served.
+#
+#   python -m benchmarks.bench_multiprocess [--workers 8] [--records 20000] [--latency 0.02]
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy import Logger, BundlingHttpSink
+from loggingpy.collector import LogCollector, CollectorSink
+
+fork = multiprocessing.get_context('fork')
+
+
+def work(records, results):
+    logger = Logger('Worker')
+    logger.set_level(logging.DEBUG)
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info('hello', payload_type='Record', payload={'index': i, 'pid': os.getpid()})
+    logging_seconds = time.perf_counter() - start
+
+    # every worker hands over its records before it exits, like a worker which is shut down gracefully
+    Logger.shutdown()
+    for sink in Logger.sinks:
+        sink.close()
+    results.put((logging_seconds, time.perf_counter() - start))
+
+
+def run(server, sink, workers, records):
+    server.reset()
+    Logger.sinks[:] = []
+    Logger.with_sink(sink)
+    Logger('Parent')  # the dispatcher and the sink exist before the workers are forked, like in a pre-forking server
+
+    results = fork.Queue()
+    start = time.perf_counter()
+    processes = [fork.Process(target=work, args=(records, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    worker_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    while server.records < workers * records and time.perf_counter() - start < 120:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    Logger.shutdown()
+    sink.close()
+    logging_seconds = sum(result[0] for result in worker_results) / workers
+    handover_seconds = sum(result[1] for result in worker_results) / workers
+    return elapsed, logging_seconds, handover_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--records', type=int, default=20000, help='records per worker')
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency).start()
+    directory = tempfile.TemporaryDirectory()
+    address = os.path.join(directory.name, 'collector.sock')
+
+    print('{:<10} {:>10} {:>12} {:>12} {:>12} {:>10} {:>10}'.format(
+        'mode', 'delivered', 'seconds', 'logging s', 'handover s', 'conns', 'requests'))
+
+    sink = BundlingHttpSink('bench', 'bench', server.url, logs_drain_timeout=1)
+    elapsed, logging_seconds, handover_seconds = run(server, sink, args.workers, args.records)
+    print('{:<10} {:>10} {:>12.2f} {:>12.2f} {:>12.2f} {:>10} {:>10}'.format(
+        'own', server.records, elapsed, logging_seconds, handover_seconds, server.connections, server.requests))
+
+    collector = LogCollector(address, server.url, logs_drain_timeout=1).start()
+    sink = CollectorSink('bench', 'bench', address)
+    elapsed, logging_seconds, handover_seconds = run(server, sink, args.workers, args.records)
+    collector.stop()
+    print('{:<10} {:>10} {:>12.2f} {:>12.2f} {:>12.2f} {:>10} {:>10}'.format(
+        'collector', server.records, elapsed, logging_seconds, handover_seconds, server.connections, server.requests))
+
+    server.stop()
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Microbenchmarks of the JSON serialization of log entries with realistic payloads. Compares the former to_dict pass
+# followed by json.dumps with the single-pass JsonEncoder and, if installed, its orjson backend.
+#
+#   python -m benchmarks.bench_serializer [--number 2000]
+import argparse
+import datetime
+import json
+import timeit
+import uuid
+
+from loggingpy.encoder import JsonEncoder, orjson
+from loggingpy.log import JsonFormatter, LogEntry, LogEntryParser, LogLevel
+
+
+class Customer:
+
+    def __init__(self, index):
+        self.id = uuid.UUID(int=index)
+        self.name = 'Customer {}'.format(index)
+        self.tags = ['premium', 'zürich']
+        self.created = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def order(index):
+    return {
+        'order_id': str(uuid.UUID(int=index)),
+        'total': 12.5 * index,
+        'currency': 'CHF',
+        'items': [{'sku': 'SKU-{}'.format(i), 'quantity': i, 'price': 3.5} for i in range(5)],
+        'shipping': {'street': 'Bahnhofstrasse 1', 'city': 'Zürich', 'zip': '8001'},
+    }
+
+
+PAYLOADS = {
+    'flat': {'user_id': 42, 'action': 'login', 'success': True, 'duration_ms': 12.3},
+    'nested': order(1),
+    'objects': {'customer': Customer(1), 'orders': [order(i) for i in range(3)]},
+    'large list': {'orders': [order(i) for i in range(100)]},
+}
+
+
+def dto_for(payload):
+    entry = LogEntry(LogLevel.Info, context='Benchmark', payload_type='Benchmark.Payload', message='hello',
+                     payload=payload)
+    return LogEntryParser.parse_log_entry(entry)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    formatter = JsonFormatter()
+    serializers = [
+        ('to_dict+dumps', lambda dto: json.dumps(formatter.to_dict(dto), default=str)),
+        ('encoder', JsonEncoder().encode),
+    ]
+    if orjson is not None:
+        serializers.append(('orjson', JsonEncoder('orjson').encode))
+
+    print('{:>12}'.format('payload') + ''.join('{:>18}'.format(name + ' us') for name, _ in serializers))
+    for name, payload in PAYLOADS.items():
+        dto = dto_for(payload)
+        timings = [timeit.timeit(lambda: serialize(dto), number=args.number) / args.number * 1e6
+                   for _, serialize in serializers]
+        print('{:>12}'.format(name) + ''.join('{:>18.1f}'.format(timing) for timing in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Compares the number of TCP handshakes needed to ship 10k records with a fresh connection per request versus the
+# pooled keep-alive transport.
+#
+#   python -m benchmarks.bench_transport [--records 10000]
+import argparse
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy.sender import HttpSender, PooledHttpTransport, SingleShotHttpTransport
+
+RECORD = '{"level": "Info", "context": "Benchmark", "payload_type": "Benchmark.Record", "message": "hello"}'
+
+
+def per_record(server, transport, records):
+    server.reset()
+    start = time.perf_counter()
+    for _ in range(records):
+        transport.post(server.url, RECORD, headers={"Content-type": "application/json"})
+    return server.connections, server.requests, time.perf_counter() - start
+
+
+def bundled(server, transport, records):
+    server.reset()
+    # small bulks make the handshakes visible
+    sender = HttpSender(server.url, transport=transport, flush_max_records=100)
+    start = time.perf_counter()
+    for _ in range(records):
+        sender.append(RECORD)
+        if sender.pending() >= 100:
+            sender.flush()
+    sender.close()
+    return server.connections, server.requests, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=10000)
+    args = parser.parse_args()
+
+    server = StubServer().start()
+    print('{:<12} {:<12} {:>12} {:>10} {:>10}'.format('mode', 'transport', 'handshakes', 'requests', 'seconds'))
+    for mode, run in (('per-record', per_record), ('bundled', bundled)):
+        for name, transport in (('single-shot', SingleShotHttpTransport()), ('pooled', PooledHttpTransport())):
+            connections, requests, elapsed = run(server, transport, args.records)
+            print('{:<12} {:<12} {:>12} {:>10} {:>10.2f}'.format(mode, name, connections, requests, elapsed))
+            transport.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
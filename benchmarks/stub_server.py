@@ -0,0 +1,102 @@
+# A local ingestion endpoint for benchmarks and tests. It accepts every POST, counts requests, received records
+# (newline separated lines, after decompressing gzip or deflate bodies) and accepted TCP connections, which is the
+# number of handshakes the clients did. An optional latency is added to every response to simulate a remote endpoint.
+# The status code of the responses can be changed, or a share of the requests can fail at random, to simulate an
+# endpoint which fails.
+import gzip
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 is required for the clients to keep their connections alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        status_code = self.server.status_code
+        if status_code == 200 and self.server.error_rate and random.random() < self.server.error_rate:
+            status_code = random.choice(self.server.error_status_codes)
+        if status_code == 200:
+            self.server.record_request(self.decode(body))
+
+        self.send_response(status_code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def decode(self, body):
+        encoding = self.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            return gzip.decompress(body)
+        if encoding == 'deflate':
+            return zlib.decompress(body)
+        return body
+
+    def log_message(self, format, *args):
+        pass  # keep the benchmark output clean
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, status_code=200, error_rate=0, error_status_codes=(503,),
+                 on_records=None):
+        """
+        :param latency: seconds every response is delayed
+        :param status_code: the status code of the responses
+        :param error_rate: the share of the requests which fail with one of the error status codes at random
+        :param error_status_codes:
+        :param on_records: called with the list of records of every accepted request, on the request's thread
+        """
+        HTTPServer.__init__(self, (host, port), StubRequestHandler)
+        self.latency = latency
+        self.status_code = status_code
+        self.error_rate = error_rate
+        self.error_status_codes = error_status_codes
+        self.on_records = on_records
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.records = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(*self.server_address)
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def record_request(self, body):
+        records = body.split(b'\n') if body else []
+        with self.lock:
+            self.requests += 1
+            self.records += len(records)
+        if self.on_records is not None:
+            self.on_records(records)
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.records = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='stub-server')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
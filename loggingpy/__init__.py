@@ -1,2 +1,10 @@
 from loggingpy.log import Logger, JsonFormatter  # noqa F401
-from loggingpy.sink import SimpleHttpSink, BundlingHttpSink # noqa F401
+from loggingpy.sink import SimpleHttpSink, BundlingHttpSink, BundlingFileSink # noqa F401
+from loggingpy.sender import HttpTransport, PooledHttpTransport, SingleShotHttpTransport  # noqa F401
+from loggingpy.queues import QueueLimits, OverflowPolicy  # noqa F401
+from loggingpy.spool import DiskSpool  # noqa F401
+from loggingpy.filewriter import FsyncPolicy  # noqa F401
+from loggingpy.sampling import Sampler, SamplingRule, SamplingKey, SuppressionReport  # noqa F401
+from loggingpy.coalescing import ExceptionCoalescer  # noqa F401
+from loggingpy.collector import LogCollector, CollectorSink  # noqa F401
+from loggingpy.aio import AsyncLogger, AsyncBundlingHttpSink, AsyncHttpTransport  # noqa F401
@@ -0,0 +1,428 @@
+# asyncio-native variants of the structured logger and the bundling sink. Logging calls only append the record to a
+# buffer, the records are formatted in a worker thread and batched and uploaded in tasks on the event loop over pooled
+# keep-alive connections.
+import asyncio
+import logging
+import ssl
+from collections import deque
+from time import monotonic
+from urllib.parse import urlsplit
+
+from loggingpy.log import JsonFormatter, Logger, LogEntry, LogLevel
+from loggingpy.retry import backoff_delay, DEFAULT_MAX_TRIES, DEFAULT_RETRY_BASE_DELAY, DEFAULT_RETRY_MAX_DELAY
+from loggingpy.sender import PlainBatch, CompressedBatch, COMPRESSION_WBITS, DEFAULT_COMPRESSION_LEVEL, \
+    DEFAULT_FLUSH_MAX_RECORDS, DEFAULT_POOL_SIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, \
+    MAX_BULK_SIZE_IN_BYTES, get_logger
+
+
+class AsyncHttpResponse:
+
+    def __init__(self, status_code: int, headers: dict, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+
+class AsyncHttpTransport:
+    """
+    A minimal HTTP/1.1 client on asyncio streams which keeps up to pool_size idle keep-alive connections per endpoint.
+    """
+
+    def __init__(self,
+                 pool_size=DEFAULT_POOL_SIZE,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT):
+        """
+        :param pool_size: maximum number of idle connections kept alive per endpoint
+        :param connect_timeout: seconds to wait for a connection to be established
+        :param read_timeout: seconds to wait for the endpoint to answer
+        """
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = {}
+
+    async def _connect(self, endpoint):
+        scheme, host, port = endpoint
+        ssl_context = ssl.create_default_context() if scheme == 'https' else None
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context), self.connect_timeout)
+
+    def _release(self, endpoint, connection):
+        idle = self._idle.setdefault(endpoint, deque())
+        if len(idle) < self.pool_size:
+            idle.append(connection)
+        else:
+            connection[1].close()
+
+    async def post(self, url, data: bytes, headers: dict=None):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        endpoint = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        lines = ['POST {} HTTP/1.1'.format(path), 'Host: {}'.format(parts.netloc),
+                 'Content-Length: {}'.format(len(data)), 'Connection: keep-alive']
+        lines.extend('{}: {}'.format(key, value) for key, value in (headers or {}).items())
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        idle = self._idle.get(endpoint)
+        while idle:
+            # an idle connection may have been closed by the server in the meantime, then try the next one
+            connection = idle.popleft()
+            try:
+                response, keep_alive = await self._exchange(connection, request, data)
+            except BaseException as e:
+                connection[1].close()
+                if isinstance(e, (ConnectionError, asyncio.IncompleteReadError)):
+                    continue
+                raise
+            self._finish(endpoint, connection, keep_alive)
+            return response
+
+        connection = await self._connect(endpoint)
+        try:
+            response, keep_alive = await self._exchange(connection, request, data)
+        except BaseException:
+            connection[1].close()
+            raise
+        self._finish(endpoint, connection, keep_alive)
+        return response
+
+    def _finish(self, endpoint, connection, keep_alive):
+        if keep_alive:
+            self._release(endpoint, connection)
+        else:
+            connection[1].close()
+
+    async def _exchange(self, connection, request, data):
+        reader, writer = connection
+        writer.write(request)
+        writer.write(data)
+        await writer.drain()
+        return await asyncio.wait_for(self._read_response(reader), self.read_timeout)
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readuntil(b'\r\n')
+        version, status_code = status_line.split(b' ', 2)[:2]
+
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        keep_alive = version == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            content = b''.join(chunks)
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
+        else:
+            content = await reader.read()
+            keep_alive = False
+
+        return AsyncHttpResponse(int(status_code), headers, content), keep_alive
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
+
+
+class AsyncBundlingHttpSink:
+    """
+    Bundles messages into bulk requests like the BundlingHttpSink, but batches and uploads them in tasks on the running
+    event loop. emit never blocks, it must be called from within the event loop. The records are formatted in a worker
+    thread, since formatting a stack trace reads the source lines from disk.
+    """
+
+    def __init__(self,
+                 app_name: str,
+                 environment: str,
+                 url: str,
+                 logs_drain_timeout=3,
+                 debug=False,
+                 transport: AsyncHttpTransport=None,
+                 compression: str=None,
+                 compression_level: int=DEFAULT_COMPRESSION_LEVEL,
+                 flush_max_records: int=DEFAULT_FLUSH_MAX_RECORDS,
+                 flush_max_bytes: int=MAX_BULK_SIZE_IN_BYTES,
+                 concurrency: int=1,
+                 max_tries: int=DEFAULT_MAX_TRIES,
+                 retry_base_delay: float=DEFAULT_RETRY_BASE_DELAY,
+                 retry_max_delay: float=DEFAULT_RETRY_MAX_DELAY):
+        """
+        A batch is sent as soon as it holds flush_max_records records or flush_max_bytes bytes, or when its oldest
+        record waited for logs_drain_timeout seconds. Up to concurrency batches are uploaded at the same time, a batch
+        which failed max_tries times is dropped.
+        """
+        if compression is not None and compression not in COMPRESSION_WBITS:
+            raise ValueError("Unsupported compression '{}', use one of {}".format(
+                compression, ', '.join(sorted(COMPRESSION_WBITS))))
+
+        self.app_name = app_name
+        self.environment = environment.upper()
+        self._fields = JsonFormatter.encode_fields({'app_name': self.app_name, 'env': self.environment})
+        self.url = url
+        self.logs_drain_timeout = logs_drain_timeout
+        self.logger = get_logger(debug)
+        self.transport = transport if transport is not None else AsyncHttpTransport(
+            pool_size=max(DEFAULT_POOL_SIZE, concurrency))
+        self.compression = compression
+        self.compression_level = compression_level
+        self.flush_max_records = flush_max_records
+        self.flush_max_bytes = flush_max_bytes
+        self.concurrency = concurrency
+        self.max_tries = max_tries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.level = logging.NOTSET
+        self.formatter = JsonFormatter()
+
+        self._records = []  # the records to be formatted, formatted records wait in the buffer for the next batch
+        self._buffer = deque()
+        self._buffer_size = 0
+        self._oldest_record_time = None
+        self._records_added = None
+        self._formatting = None
+        self._dispatching = None
+        self._runner = None
+        self._uploads = set()
+        self._upload_slots = None
+
+    def setFormatter(self, formatter):
+        self.formatter = formatter
+
+    def setLevel(self, level):
+        self.level = level
+
+    def emit(self, record):
+        """
+        Queue the record for formatting and the next batch.
+        :param record: a log record
+        :return:
+        """
+        if record.levelno < self.level:
+            return
+
+        if self._runner is None or self._runner.done():
+            self._start()
+
+        if not self._records and not self._buffer:
+            self._oldest_record_time = monotonic()
+        self._records.append(record)
+        self._records_added.set()
+
+    def _format(self, records):
+        # runs in a worker thread, the records are not touched by the event loop in the meantime
+        formatted = []
+        for record in records:
+            if isinstance(self.formatter, JsonFormatter):
+                data = self.formatter.format_with_fields(record, self._fields)
+            else:
+                record = logging.makeLogRecord(record.__dict__)
+                record.app_name = self.app_name
+                record.environment = self.environment
+                data = self.formatter.format(record)
+            formatted.append(data.encode('utf-8'))
+        return formatted
+
+    async def _format_records(self):
+        # a flush waits for the records the runner is formatting, and the records keep their order
+        async with self._formatting:
+            records = self._records
+            self._records = []
+            if records:
+                for data in await asyncio.get_running_loop().run_in_executor(None, self._format, records):
+                    self._buffer.append(data)
+                    self._buffer_size += len(data) + 1
+
+    def _is_batch_complete(self):
+        return len(self._buffer) >= self.flush_max_records or self._buffer_size >= self.flush_max_bytes
+
+    def _start(self):
+        # the event and the semaphore are bound to the loop which runs the sink
+        self._records_added = asyncio.Event()
+        self._formatting = asyncio.Lock()
+        self._dispatching = asyncio.Lock()
+        self._upload_slots = asyncio.Semaphore(self.concurrency)
+        self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            timeout = self.logs_drain_timeout
+            if self._oldest_record_time is not None:
+                timeout = self._oldest_record_time + self.logs_drain_timeout - monotonic()
+
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._records_added.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self._records_added.clear()
+
+            # the records logged since the last wake up are formatted at once
+            if self._records:
+                await self._format_records()
+
+            if self._buffer and (self._is_batch_complete() or self._oldest_record_time is None
+                                 or monotonic() - self._oldest_record_time >= self.logs_drain_timeout):
+                await self._dispatch()
+
+    def _take_buffer(self):
+        records = self._buffer
+        self._buffer = deque()
+        self._buffer_size = 0
+        self._oldest_record_time = monotonic() if self._records else None
+        return records
+
+    def _create_batch(self):
+        if self.compression is None:
+            return PlainBatch(max_records=self.flush_max_records)
+        return CompressedBatch(self.compression, self.compression_level, max_records=self.flush_max_records)
+
+    async def _dispatch(self):
+        # a flush waits for the records the runner took, which may wait for an upload slot
+        async with self._dispatching:
+            records = self._take_buffer()
+            while records:
+                batch = self._create_batch()
+                while records and not batch.is_full():
+                    if not batch.add(records[0]):
+                        break
+                    records.popleft()
+
+                await self._upload_slots.acquire()  # waits while all upload slots are busy
+                upload = asyncio.get_running_loop().create_task(self._upload(batch))
+                self._uploads.add(upload)
+                upload.add_done_callback(self._uploads.discard)
+
+    async def _upload(self, batch):
+        try:
+            headers = {"Content-type": "text/plain"}
+            if batch.content_encoding is not None:
+                headers["Content-Encoding"] = batch.content_encoding
+            body = batch.body()
+
+            for current_try in range(self.max_tries):
+                try:
+                    response = await self.transport.post(self.url, body, headers)
+                    if response.status_code == 200:
+                        self.logger.debug('Successfully sent bulk of %s logs to url ' + str(self.url),
+                                          len(batch.records))
+                        return
+                    if response.status_code in (400, 401):
+                        self.logger.info('Got %s from url ' + str(self.url) + ', dropping logs. Response: %s',
+                                         response.status_code, response.text)
+                        return
+                    self.logger.info('Got %s while sending logs to url ' + str(self.url) + ', Try (%s/%s).',
+                                     response.status_code, current_try + 1, self.max_tries)
+                except Exception as e:
+                    self.logger.error('Got exception while sending logs to url ' + str(self.url) + ', '
+                                      'Try (%s/%s). Message: %s', current_try + 1, self.max_tries, e)
+
+                if current_try + 1 < self.max_tries:
+                    await asyncio.sleep(backoff_delay(current_try + 1, self.retry_base_delay, self.retry_max_delay))
+
+            self.logger.info('Could not send %s logs to url ' + str(self.url) + ' after %s tries, dropping them',
+                             len(batch.records), self.max_tries)
+        finally:
+            self._upload_slots.release()
+
+    async def flush(self):
+        """
+        Send all queued records and wait for all uploads to finish.
+        :return:
+        """
+        if self._runner is None:
+            return
+        await self._format_records()
+        await self._dispatch()
+        if self._uploads:
+            await asyncio.gather(*self._uploads, return_exceptions=True)
+
+    async def close(self):
+        await self.flush()
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        self.transport.close()
+
+
+class AsyncLogger(Logger):
+    """
+    A structured logger for asyncio applications. It has the interface of the Logger, but hands the entries directly to
+    its async sinks instead of going through a standard python logger, queues and threads. The logging calls never
+    block the event loop. Like the Logger, it logs from the effective level of the standard python logger of its
+    context unless a level is set.
+    """
+    sinks = []
+
+    @staticmethod
+    def with_sinks(sinks: list):
+        for sink in sinks:
+            AsyncLogger.with_sink(sink)
+
+    @staticmethod
+    def with_sink(sink):
+        AsyncLogger.sinks.append(sink)
+        sink.setFormatter(JsonFormatter())
+
+    def __init__(self, context: str, prefix_payload_type: bool = True):
+        self.context = context
+        self.prefix_payload_type = prefix_payload_type
+        self.handlers = AsyncLogger.sinks
+
+        # only the level of the standard python logger is used, it gets no handlers
+        self.logger = logging.getLogger(context)
+
+    def is_enabled_for(self, log_level: LogLevel):
+        return self.logger.isEnabledFor(log_level.value) and len(AsyncLogger.sinks) > 0
+
+    def _log(self, log_entry: LogEntry):
+        if not self.logger.isEnabledFor(log_entry.log_level.value):
+            return
+
+        if log_entry.context is None or log_entry.context == "":
+            log_entry.context = self.context
+        self._emit(log_entry)
+
+    def _log_reports(self, reports: list):
+        # the counts of the reports were reset when they were taken, so they reach the sinks whatever the level
+        for report in reports:
+            self._emit(report)
+
+    @staticmethod
+    def _emit(log_entry: LogEntry):
+        record = Logger.make_record(log_entry)
+        for sink in AsyncLogger.sinks:
+            sink.emit(record)
+
+    def _dispatches_only(self, dispatcher):
+        # the entries go to the async sinks directly, never to the dispatcher of the Logger
+        return False
+
+    @staticmethod
+    async def flush():
+        """
+        Flush all async sinks.
+        :return:
+        """
+        await asyncio.gather(*[sink.flush() for sink in AsyncLogger.sinks])
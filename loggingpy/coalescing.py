@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+DEFAULT_WINDOW = 60  # seconds
+DEFAULT_MAX_MESSAGES = 5
+
+# the distinct exceptions which are coalesced at the same time, the exceptions beyond are logged in full
+DEFAULT_MAX_EXCEPTIONS = 1024
+
+
+class ExceptionGroup:
+    """
+    The occurrences of an exception within a window, after the first one.
+    """
+    __slots__ = ('opened_at', 'exception_type', 'log_level', 'context', 'payload_type', 'first_ns', 'last_ns',
+                 'count', 'messages')
+
+    def __init__(self, exception_type: str, log_level, context: str, payload_type: str, timestamp_ns: int):
+        self.opened_at = monotonic()
+        self.exception_type = exception_type
+        self.log_level = log_level
+        self.context = context
+        self.payload_type = payload_type
+        self.first_ns = timestamp_ns
+        self.last_ns = timestamp_ns
+        self.count = 0
+        self.messages = []
+
+
+class ExceptionCoalescer:
+    """
+    Folds the repeated occurrences of an exception into a summary. The first occurrence of an exception hash is logged
+    in full and opens a window, the later ones within the window are only counted along with a sample of their
+    distinct messages. When the window is over, the summary of the folded occurrences is due and the next occurrence
+    is logged in full again. It is thread safe.
+    """
+
+    def __init__(self, window: float=DEFAULT_WINDOW, max_messages: int=DEFAULT_MAX_MESSAGES,
+                 max_exceptions: int=DEFAULT_MAX_EXCEPTIONS):
+        """
+        :param window: seconds the occurrences after the first one are folded
+        :param max_messages: the number of distinct messages of the folded occurrences kept for the summary
+        :param max_exceptions: the number of distinct exceptions coalesced at the same time
+        """
+        self.window = window
+        self.max_messages = max_messages
+        self.max_exceptions = max_exceptions
+
+        self._lock = Lock()
+        self._groups = OrderedDict()  # by exception hash, in the order the windows were opened
+        self._closed = []  # groups whose window ended before they were taken
+        self._next_due_time = None
+        self.coalesced_total = 0
+
+    def after_fork(self):
+        """
+        Reinitialize the coalescer in a forked child process. The occurrences folded so far are reported by the parent.
+        :return:
+        """
+        self._lock = Lock()
+        self._groups = OrderedDict()
+        self._closed = []
+        self._next_due_time = None
+        self.coalesced_total = 0
+
+    def add(self, exception_hash: str, exception_type: str, log_level, context: str, payload_type: str,
+            message: str, timestamp_ns: int):
+        """
+        Count an occurrence of an exception.
+        :param exception_hash:
+        :param exception_type: the name of the exception class
+        :param log_level:
+        :param context:
+        :param payload_type:
+        :param message: the message of the log entry
+        :param timestamp_ns: the time of the occurrence in nanoseconds since the epoch
+        :return: whether the occurrence is logged in full, False if it was folded
+        """
+        with self._lock:
+            group = self._groups.get(exception_hash)
+            if group is not None and monotonic() - group.opened_at >= self.window:
+                del self._groups[exception_hash]
+                if group.count:
+                    self._closed.append((exception_hash, group))
+                    self._next_due_time = group.opened_at + self.window
+                group = None
+
+            if group is None:
+                if len(self._groups) < self.max_exceptions:
+                    group = self._groups[exception_hash] = ExceptionGroup(
+                        exception_type, log_level, context, payload_type, timestamp_ns)
+                    if self._next_due_time is None:
+                        self._next_due_time = group.opened_at + self.window
+                return True
+
+            group.count += 1
+            self.coalesced_total += 1
+            group.last_ns = timestamp_ns
+            if message and len(group.messages) < self.max_messages and message not in group.messages:
+                group.messages.append(message)
+            return False
+
+    def take_due(self, force: bool=False):
+        """
+        Remove the groups whose window is over and return those with folded occurrences.
+        :param force: take all groups, whether their window is over or not
+        :return: a list of (exception hash, group) tuples, empty if there is nothing to report yet
+        """
+        # checked without the lock first, it is asked on every logging call
+        due_time = self._next_due_time
+        if not force and (due_time is None or monotonic() < due_time):
+            return []
+
+        with self._lock:
+            now = monotonic()
+            due, self._closed = self._closed, []
+            while self._groups:
+                exception_hash, group = next(iter(self._groups.items()))
+                if not force and now - group.opened_at < self.window:
+                    break
+                del self._groups[exception_hash]
+                if group.count:
+                    due.append((exception_hash, group))
+
+            if self._groups:
+                self._next_due_time = next(iter(self._groups.values())).opened_at + self.window
+            else:
+                self._next_due_time = None
+        return due
@@ -0,0 +1,250 @@
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from loggingpy.log import Logger
+from loggingpy.sender import HttpSender
+from loggingpy.sink import ApplicationSink
+
+# every record is prefixed by its length and its log level
+FRAME_HEADER = struct.Struct('>IH')
+
+DEFAULT_START_TIMEOUT = 10  # seconds
+DEFAULT_DRAIN_TIMEOUT = 5  # seconds
+DRAIN_IDLE_INTERVAL = 0.1  # seconds a connection is idle before it counts as drained on stop
+RECEIVE_SIZE = 65536
+
+
+class CollectorRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Reads the records of a worker process and appends them to the sender of the collector. Once the collector stops,
+    the handler reads on until the worker closed the connection or the connection is idle, at most until the drain
+    deadline.
+    """
+
+    def handle(self):
+        server = self.server
+        connection = self.request
+        append = server.sender.append
+        pending = b''
+        while True:
+            if not select.select([connection], [], [], DRAIN_IDLE_INTERVAL)[0]:
+                if server.stopping.is_set():
+                    return  # everything the worker wrote before the stop was read
+                continue
+
+            data = connection.recv(RECEIVE_SIZE)
+            if not data:
+                return  # the worker closed the connection
+            pending = pending + data if pending else data
+
+            offset = 0
+            while len(pending) - offset >= FRAME_HEADER.size:
+                size, level = FRAME_HEADER.unpack_from(pending, offset)
+                end = offset + FRAME_HEADER.size + size
+                if end > len(pending):
+                    break
+                append(pending[offset + FRAME_HEADER.size:end], level)
+                offset = end
+            pending = pending[offset:]
+
+            if server.stopping.is_set() and time.monotonic() > server.drain_deadline:
+                return
+
+
+class CollectorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, address: str, handler_class):
+        socketserver.UnixStreamServer.__init__(self, address, handler_class)
+        self.stopping = threading.Event()
+        self.drain_deadline = None
+        self._handler_threads = set()
+        self._handler_threads_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self.process_request_thread, args=(request, client_address),
+                                  name='log-collector-connection', daemon=True)
+        with self._handler_threads_lock:
+            self._handler_threads = {t for t in self._handler_threads if t.is_alive()}
+            self._handler_threads.add(thread)
+        thread.start()
+
+    def drain(self, timeout: float):
+        """
+        Let the handlers read what the connected workers wrote so far, and wait for them. Connections which were made
+        but not accepted yet are taken first, their workers may already have written records.
+        :param timeout: seconds the handlers read at most
+        :return:
+        """
+        self.drain_deadline = time.monotonic() + timeout
+        self.stopping.set()
+        self.socket.setblocking(False)
+        while True:
+            try:
+                request, client_address = self.get_request()
+            except OSError:
+                break  # no pending connection is left
+            self.process_request(request, client_address)
+        with self._handler_threads_lock:
+            threads = list(self._handler_threads)
+        for thread in threads:
+            thread.join()
+
+
+class LogCollector:
+    """
+    A process which collects the records of the worker processes of a pre-forking server over a Unix socket, and
+    owns the batching and uploading of all of them. The workers only write their serialized records to the socket
+    through a CollectorSink, so the number of upload threads and connections does not grow with the number of
+    workers. The collector has to be started before the workers are forked, and stopped after they exited.
+    """
+
+    def __init__(self, address: str, url: str, drain_timeout: float=DEFAULT_DRAIN_TIMEOUT, **sender_options):
+        """
+        :param address: the path of the Unix socket
+        :param url: the endpoint the bulks are posted to
+        :param drain_timeout: seconds the collector reads the records of connected workers at most when it stops
+        :param sender_options: the options of the HttpSender of the collector
+        """
+        self.address = address
+        self.url = url
+        self.drain_timeout = drain_timeout
+        self.sender_options = sender_options
+        self.process = None
+
+    def serve(self, stop_event=None):
+        """
+        Collect and send records in this process until the stop event is set or the process receives SIGTERM. Then
+        stop accepting connections, read the records the connected workers wrote until they close their connection,
+        their connection is idle or the drain timeout passed, and send all pending records.
+        :param stop_event: stops the collector when set, a new event if None
+        :return:
+        """
+        stop_event = stop_event if stop_event is not None else threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        server = CollectorServer(self.address, CollectorRequestHandler)
+        server.sender = HttpSender(self.url, **self.sender_options)
+        serving_thread = threading.Thread(target=server.serve_forever, name='log-collector-thread', daemon=True)
+        serving_thread.start()
+        try:
+            stop_event.wait()
+        finally:
+            server.shutdown()
+            os.unlink(self.address)
+            server.drain(self.drain_timeout)
+            server.server_close()
+            server.sender.close()
+
+    def start(self, timeout: float=DEFAULT_START_TIMEOUT):
+        """
+        Start the collector in a child process and wait until it accepts connections.
+        :param timeout: seconds to wait for the socket of the collector
+        :return: the collector
+        """
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.process = multiprocessing.Process(target=self.serve, name='log-collector', daemon=True)
+        self.process.start()
+
+        end_time = time.monotonic() + timeout
+        while not os.path.exists(self.address):
+            if not self.process.is_alive() or time.monotonic() > end_time:
+                raise RuntimeError("The log collector did not start listening on '{}'".format(self.address))
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        """
+        Stop the collector process, after it read the records the workers wrote so far and sent all pending records.
+        :return:
+        """
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+
+class CollectorSink(ApplicationSink):
+    """
+    Writes the serialized records into the socket of a LogCollector, which batches and sends them. Every process
+    connects on its own, a forked child opens a new connection with its first record. Records which cannot be written
+    because the collector is not reachable are dropped, and reported once it is reachable again.
+    """
+    blocking = True  # a slow collector fills the socket buffer, then the writes block on a thread of the sink's own
+
+    def __init__(self, app_name: str, environment: str, address: str):
+        """
+        :param app_name:
+        :param environment:
+        :param address: the path of the Unix socket of the collector
+        """
+        ApplicationSink.__init__(self, app_name, environment)
+        self.address = address
+        self.dropped = 0
+        self.written = 0
+        self._socket = None
+        self._pid = os.getpid()
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            # the connection and the drops were inherited from the parent process, which keeps using and reporting them
+            self._close_connection()
+            self.dropped = 0
+            self.written = 0
+            self._pid = os.getpid()
+        if self._socket is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                connection.connect(self.address)
+            except OSError:
+                connection.close()
+                raise
+            self._socket = connection
+        return self._socket
+
+    def stats(self):
+        """
+        :return: the records written to the collector and the records dropped since the last drop report
+        """
+        return {'records_written': self.written, 'records_dropped': self.dropped}
+
+    def emit(self, record):
+        data = self._format(record).encode('utf-8')
+        try:
+            connection = self._connection()
+            if self.dropped:
+                report = self._format(Logger.drop_report_record(self.dropped, 'collector')).encode('utf-8')
+                connection.sendall(FRAME_HEADER.pack(len(report), logging.WARNING) + report)
+                self.dropped = 0
+            connection.sendall(FRAME_HEADER.pack(len(data), record.levelno) + data)
+            self.written += 1
+        except OSError:
+            self.dropped += 1
+            self._close_connection()
+
+    def _close_connection(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._pid == os.getpid():
+                self._close_connection()
+        finally:
+            self.release()
+        logging.Handler.close(self)
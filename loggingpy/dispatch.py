@@ -0,0 +1,264 @@
+from threading import Lock, Thread
+import logging
+import logging.handlers
+import os
+import queue
+import weakref
+
+from loggingpy.queues import BoundedQueue, QueueLimits
+
+
+class DispatchHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler which leaves the formatting of structured records to the dispatcher thread.
+    """
+
+    def prepare(self, record):
+        # the sinks format structured records from their log entry on the dispatcher thread anyway, formatting and
+        # copying them here would only add to the time the logging call takes
+        if hasattr(record, 'log_entry'):
+            return record
+        return logging.handlers.QueueHandler.prepare(self, record)
+
+
+DEFAULT_DUE_INTERVAL = 1  # seconds
+
+# the dispatchers of this process, which are reinitialized in a forked child
+_dispatchers = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for dispatcher in list(_dispatchers):
+        dispatcher.after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class SinkWorker:
+    """
+    A queue and thread of their own for a blocking sink, so the sink only holds up its own records instead of the
+    delivery to all other sinks.
+    """
+
+    def __init__(self, sink, limits: QueueLimits=None, drop_reporter=None):
+        self.sink = sink
+        self.queue = queue.Queue(-1) if limits is None else BoundedQueue(limits, drop_reporter=drop_reporter)
+        self.errors = 0
+        self._thread = Thread(target=self._work, name='log-sink-thread', daemon=True)
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    return
+                self.sink.handle(record)
+            except Exception:
+                self.errors += 1
+                self.sink.handleError(record)
+            finally:
+                self.queue.task_done()
+
+    def join(self):
+        self.queue.join()
+
+    def stop(self):
+        self.queue.put(None)
+        self._thread.join()
+
+
+class LogDispatcher:
+    """
+    A single queue and worker thread which hand the records of all structured loggers to all sinks. Every standard
+    python logger gets the same queue handler, so the number of queues and threads does not grow with the number of
+    logger contexts.
+
+    The worker thread calls the sinks one after the other, so a sink which blocks in emit, like one posting every record
+    synchronously, would hold up the delivery to all other sinks while the queue grows. Sinks which set the blocking
+    attribute to True therefore get a SinkWorker with a queue and thread of their own, bounded by the same limits.
+
+    While the queue is idle, the worker thread asks for the synthetic entries which are due every due interval, so
+    summaries are delivered even if no logging call follows.
+    """
+
+    def __init__(self, sinks: list, limits: QueueLimits=None, drop_reporter=None, make_record=None, due_entries=None,
+                 due_interval: float=DEFAULT_DUE_INTERVAL, sink_drop_reporter=None):
+        """
+        :param sinks: the sinks to fan out to. The list is read for every record, so sinks appended later receive the
+        records from then on
+        :param limits: the limits of the dispatch queue, None for an unbounded queue
+        :param drop_reporter: called with the number of records dropped by a full queue, returns a record reporting them
+        :param make_record: turns queued items which are not log records, like log entries, into log records
+        :param due_entries: returns the synthetic log entries which are due, None if there are none
+        :param due_interval: seconds the queue is idle before the due entries are asked for
+        :param sink_drop_reporter: called with the number of records dropped by the queue of a blocking sink and the
+        name of the sink, returns a record reporting them. The drop reporter is used if None
+        """
+        self.sinks = sinks
+        self.make_record = make_record
+        self.due_entries = due_entries
+        self.due_interval = due_interval
+        self.limits = limits
+        self.drop_reporter = drop_reporter
+        self.sink_drop_reporter = sink_drop_reporter
+        self.queue = self._make_queue()
+        self.handler = DispatchHandler(self.queue)
+
+        self._lock = Lock()
+        self._thread = None
+        self._workers = {}  # the workers of the blocking sinks by the id of the sink
+        self.dispatched = 0
+        self.sink_errors = 0
+        _dispatchers.add(self)
+
+    def _make_queue(self):
+        if self.limits is None:
+            return queue.Queue(-1)
+        return BoundedQueue(self.limits, drop_reporter=self.drop_reporter)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._dispatch, name='log-dispatch-thread', daemon=True)
+                self._thread.start()
+        return self
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _dispatch(self):
+        while True:
+            if self.due_entries is None:
+                record = self.queue.get()
+            else:
+                try:
+                    record = self.queue.get(timeout=self.due_interval)
+                except queue.Empty:
+                    self._dispatch_due()
+                    continue
+            try:
+                if record is None:
+                    return
+                if isinstance(record, list):
+                    self._dispatch_batch(record)
+                    continue
+                self._dispatch_record(record)
+            finally:
+                self.queue.task_done()
+
+    def _dispatch_record(self, record):
+        if not isinstance(record, logging.LogRecord):
+            record = self.make_record(record)
+        for sink in list(self.sinks):
+            if getattr(sink, 'blocking', False):
+                self._worker(sink).queue.put(record)
+                continue
+            try:
+                sink.handle(record)
+            except Exception:
+                # a failing sink must neither stop the dispatching nor starve the other sinks
+                self.sink_errors += 1
+                sink.handleError(record)
+        self.dispatched += 1
+
+    def _dispatch_due(self):
+        # the entries are handed to the sinks right here, queueing them could block on a full queue of this very thread
+        for entry in self.due_entries() or ():
+            self._dispatch_record(entry)
+
+    def _dispatch_batch(self, batch: list):
+        # the records of a batch go to every sink at once, sinks which cannot take batches get them one by one
+        records = [record if isinstance(record, logging.LogRecord) else self.make_record(record) for record in batch]
+        for sink in list(self.sinks):
+            if getattr(sink, 'blocking', False):
+                worker = self._worker(sink)
+                for record in records:
+                    worker.queue.put(record)
+                continue
+            handle_batch = getattr(sink, 'handle_batch', None)
+            try:
+                if handle_batch is not None:
+                    handle_batch(records)
+                else:
+                    for record in records:
+                        sink.handle(record)
+            except Exception:
+                self.sink_errors += 1
+                sink.handleError(records[0])
+        self.dispatched += len(records)
+
+    def _worker(self, sink):
+        # only called by the worker thread of the dispatcher
+        worker = self._workers.get(id(sink))
+        if worker is None or worker.sink is not sink:
+            worker = self._workers[id(sink)] = SinkWorker(sink, self.limits, self._sink_drop_reporter(sink))
+        return worker
+
+    def _sink_drop_reporter(self, sink):
+        # the drops of a blocking sink are reported with its name, to tell them from the drops of the shared queue
+        if self.sink_drop_reporter is None:
+            return self.drop_reporter
+        name = type(sink).__name__
+        return lambda dropped: self.sink_drop_reporter(dropped, name)
+
+    def join(self):
+        """
+        Wait until every record queued so far was handed to the sinks, including the blocking sinks.
+        :return:
+        """
+        if self.is_alive():
+            self.queue.join()
+        for worker in list(self._workers.values()):
+            worker.join()
+
+    def stats(self):
+        """
+        A snapshot of the metrics of the dispatcher.
+        :return: a dictionary of the queue depth, the records handed to the sinks, the failures of the sinks and the
+        records dropped by a bounded queue
+        """
+        workers = list(self._workers.values())
+        queues = [self.queue] + [worker.queue for worker in workers]
+        return {
+            'queue_depth': self.queue.qsize(),
+            'sink_queue_depth': sum(worker.queue.qsize() for worker in workers),
+            'dispatched': self.dispatched,
+            'sink_errors': self.sink_errors + sum(worker.errors for worker in workers),
+            'records_dropped': sum(q.queue.dropped.total for q in queues if isinstance(q, BoundedQueue)),
+        }
+
+    def after_fork(self):
+        """
+        Reinitialize the dispatcher in a forked child process. The worker thread does not exist in the child and the
+        locks of the queue may have been held by another thread of the parent. The records queued in the parent are
+        dispatched by the parent, the child starts with an empty queue.
+        :return:
+        """
+        running = self._thread is not None
+        self._lock = Lock()
+        self._thread = None
+        self._workers = {}
+        self.dispatched = 0
+        self.sink_errors = 0
+        self.queue = self._make_queue()
+        self.handler.queue = self.queue
+        if running:
+            self.start()
+
+    def stop(self):
+        """
+        Dispatch the queued records and stop the worker thread and the workers of the blocking sinks.
+        :return:
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join()
+        for worker in list(self._workers.values()):
+            worker.stop()
+        self._workers = {}
@@ -0,0 +1,78 @@
+from json.encoder import c_make_encoder, encode_basestring_ascii, JSONEncoder
+import uuid
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional dependency
+    orjson = None
+
+BACKENDS = ('json', 'orjson')
+
+
+def _public_attributes(obj):
+    return {key: value for key, value in obj.__dict__.items() if not callable(value) and not key.startswith('_')}
+
+
+def _ast(obj):
+    return obj._ast()
+
+
+class JsonEncoder:
+    """
+    Encodes arbitrary objects into JSON in a single pass of the C encoder of the json module, with the output of
+    json.dumps(to_dict(obj), default=str). The encoder itself handles dicts, lists, tuples, strings, numbers, booleans
+    and None. Anything else goes through a dispatch table which converts it like to_dict: UUIDs into strings, objects
+    with an _ast method into its result, other iterables into lists, objects with attributes into a dict of their public
+    attributes, and everything else into its str. The table is filled the first time an instance of a type is encoded.
+
+    Unlike to_dict, instances of subclasses of str, int and float (like IntEnum members) are encoded as their value.
+    With the orjson backend the output is compact, not ASCII-escaped and has ISO 8601 datetimes.
+    """
+
+    def __init__(self, backend: str='json'):
+        """
+        :param backend: 'json', or 'orjson' which requires orjson to be installed
+        """
+        if backend not in BACKENDS:
+            raise ValueError("Unsupported JSON backend '{}', use one of {}".format(backend, ', '.join(BACKENDS)))
+        if backend == 'orjson' and orjson is None:
+            raise ValueError("The orjson JSON backend requires orjson to be installed")
+
+        self.backend = backend
+        self._converters = {}
+        if c_make_encoder is not None:
+            # built once rather than on every JSONEncoder.encode call. Without the markers of the circular reference
+            # check it can be shared between threads, a circular reference ends in a RecursionError instead
+            self._iterencode = c_make_encoder(
+                None, self._convert, encode_basestring_ascii, None, ': ', ', ', False, False, True)
+        else:
+            self._iterencode = JSONEncoder(default=self._convert, check_circular=False).iterencode
+
+    def encode(self, obj):
+        """
+        :param obj:
+        :return: the JSON string
+        """
+        if self.backend == 'orjson':
+            return orjson.dumps(obj, default=self._convert, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return ''.join(self._iterencode(obj, 0))
+
+    def _convert(self, obj):
+        # the default hook of the backend, called for the types it does not know itself
+        converter = self._converters.get(obj.__class__)
+        if converter is None:
+            converter = self._converters[obj.__class__] = self._converter_for(obj)
+        return converter(obj)
+
+    @staticmethod
+    def _converter_for(obj):
+        # the checks of JsonFormatter.to_dict, in the same order
+        if isinstance(obj, uuid.UUID):
+            return str
+        if hasattr(obj, '_ast'):
+            return _ast
+        if hasattr(obj, '__iter__'):
+            return list
+        if hasattr(obj, '__dict__'):
+            return _public_attributes
+        return str
@@ -1,4 +1,10 @@
+import itertools
+import linecache
+import traceback
+
+
 class ExceptionInfo:
+    __slots__ = ('exception_type', 'error_message', 'stack_trace', 'exception_hash')
 
     def __init__(self, exception_type: str, error_message: str, stack_trace: str, exception_hash: str):
         self.exception_type = exception_type
@@ -16,3 +22,63 @@ class ExceptionInfo:
         trace(plus nested / hidden exceptions).Can be used
         to aggregate / count similar exceptions.
         """
+
+
+class ExceptionSnapshot:
+    """
+    What a log entry needs of an exception, captured on the logging thread without formatting anything: the exception
+    type, its message and the code locations of its traceback. Unlike the exception it keeps no frames alive, the stack
+    trace is formatted from the code locations later on.
+    """
+    __slots__ = ('exception_class', 'message', 'locations')
+
+    def __init__(self, exception: BaseException, max_frames: int=None):
+        """
+        :param exception:
+        :param max_frames: the number of innermost frames to keep, all frames if None
+        """
+        self.exception_class = exception.__class__
+        self.message = str(exception)
+
+        locations = []
+        tb = exception.__traceback__
+        while tb is not None:
+            locations.append((tb.tb_frame.f_code, tb.tb_lineno, tb.tb_lasti))
+            tb = tb.tb_next
+        if max_frames is not None:
+            locations = locations[-max_frames:] if max_frames > 0 else []
+        self.locations = tuple(locations)
+
+    @staticmethod
+    def of(exception):
+        """
+        :param exception: an exception or a snapshot
+        :return: the snapshot of the exception
+        """
+        return exception if isinstance(exception, ExceptionSnapshot) else ExceptionSnapshot(exception)
+
+    def __str__(self):
+        return self.message
+
+    def stack_summary(self):
+        """
+        Rebuild the frame summaries of the traceback, like traceback.extract_tb.
+        :return: a list of FrameSummary
+        """
+        for filename in {code.co_filename for code, _, _ in self.locations}:
+            linecache.checkcache(filename)
+        return [_frame_summary(code, lineno, lasti) for code, lineno, lasti in self.locations]
+
+
+def _frame_summary(code, lineno, lasti):
+    if not hasattr(code, 'co_positions'):
+        return traceback.FrameSummary(code.co_filename, lineno, code.co_name)
+
+    # the positions of the instruction, which allow to mark the failing expression in the source line
+    positions = (None, None, None, None)
+    if lasti >= 0:
+        positions = next(itertools.islice(code.co_positions(), lasti // 2, None), positions)
+    if positions[0] is not None:
+        lineno = positions[0]
+    return traceback.FrameSummary(code.co_filename, lineno, code.co_name, lookup_line=False,
+                                  end_lineno=positions[1], colno=positions[2], end_colno=positions[3])
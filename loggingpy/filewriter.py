@@ -0,0 +1,399 @@
+import glob
+import gzip
+import logging
+import os
+import shutil
+import weakref
+from enum import Enum
+from threading import Condition, Lock, Thread, main_thread
+from time import monotonic, strftime
+
+from loggingpy.queues import QueueLimits, RecordBuffer, OverflowPolicy
+
+DEFAULT_FILE_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_FILE_FLUSH_MAX_BYTES = 1024 * 1024  # 1 MB
+DEFAULT_FILE_FLUSH_INTERVAL = 1  # seconds
+DEFAULT_FILE_FSYNC_INTERVAL = 1  # seconds
+MAIN_THREAD_POLL_INTERVAL = 1  # seconds
+
+COMPRESSION_SUFFIXES = {
+    'gzip': '.gz',
+}
+
+# the writers of this process, which are reinitialized in a forked child
+_writers = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for writer in list(_writers):
+        writer.after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class FsyncPolicy(Enum):
+    """
+    When the written records are forced to disk.
+    """
+    Never = 'never'
+    """Leave it to the operating system, a crash of the host may lose what it did not write yet."""
+
+    Interval = 'interval'
+    """Fsync at most every fsync interval, after the chunks written in the meantime, so a crash loses at most that."""
+
+    Always = 'always'
+    """Fsync after every chunk."""
+
+
+class FileWriter:
+    """
+    Writes newline delimited records into a file in large chunks. Records are buffered and written by a background
+    thread once flush_max_bytes are buffered or the oldest record waited for flush_interval seconds, every chunk with a
+    single write call. The file is rotated by size and age, rotated files are optionally compressed and only the
+    newest backup_count of them are kept.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int=DEFAULT_FILE_MAX_BYTES,
+        max_age: float=None,
+        backup_count: int=DEFAULT_BACKUP_COUNT,
+        compression: str=None,
+        fsync: FsyncPolicy=FsyncPolicy.Interval,
+        fsync_interval: float=DEFAULT_FILE_FSYNC_INTERVAL,
+        flush_max_bytes: int=DEFAULT_FILE_FLUSH_MAX_BYTES,
+        flush_interval: float=DEFAULT_FILE_FLUSH_INTERVAL,
+        limits: QueueLimits=None,
+        drop_reporter=None
+    ):
+        """
+        :param path: the path of the current file, rotated files get a timestamp and a sequence number appended
+        :param max_bytes: size at which the file is rotated, None to not rotate by size
+        :param max_age: seconds after which the file is rotated, None to not rotate by age
+        :param backup_count: the number of rotated files kept, None to keep all
+        :param compression: None (default) or 'gzip' to compress the rotated files
+        :param fsync: when the written records are forced to disk
+        :param fsync_interval: minimum seconds between two fsyncs with the Interval policy
+        :param flush_max_bytes: number of buffered bytes which trigger writing a chunk
+        :param flush_interval: maximum seconds a record waits before it is written
+        :param limits: bounds of the records waiting to be written, unbounded by default
+        :param drop_reporter: called with the number of dropped records once the limits' report interval passed,
+        returns a record (str or bytes) reporting them which is written in spite of the limits, or None
+        """
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError("Unsupported compression '{}', use one of {}".format(
+                compression, ', '.join(sorted(COMPRESSION_SUFFIXES))))
+
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.compression = compression
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.flush_max_bytes = flush_max_bytes
+        self.flush_interval = flush_interval
+        self.limits = limits if limits is not None else QueueLimits()
+        self.drop_reporter = drop_reporter
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._closed = False
+        self._initialize_state()
+        _writers.add(self)
+        self._initialize_writing_thread()
+
+    def _initialize_state(self):
+        # the buffer holds the records until a chunk is due, the writing thread waits on the condition for that
+        # while blocked logging calls wait on the space condition for the buffer to be taken
+        self._buffer = RecordBuffer(self.limits, sizeof=len)
+        self._oldest_record_time = None
+        self._lock = Lock()
+        self._condition = Condition(self._lock)
+        self._space = Condition(self._lock)
+
+        # guards the file, which is written by the writing thread and by flushes
+        self._write_lock = Lock()
+        self._file = None
+        self._file_size = 0
+        self._opened_at = None
+        self._unsynced = False
+        self._last_sync_time = monotonic()
+        self._rotations = 0
+        self._compression_threads = []
+
+        self.records_written = 0
+        self.bytes_written = 0
+        self.chunks_written = 0
+        self.fsyncs = 0
+
+    def after_fork(self):
+        """
+        Reinitialize the writer in a forked child process. The records pending in the parent are written by the
+        parent, the child starts with an empty buffer and reopens the file with its first chunk.
+        :return:
+        """
+        self._initialize_state()
+
+    def _initialize_writing_thread(self):
+        self.writing_thread = Thread(target=self._drain_buffer)
+        self.writing_thread.daemon = False
+        self.writing_thread.name = 'file-writing-thread'
+        self.writing_thread.start()
+
+    def append(self, record, level: int=logging.NOTSET):
+        """
+        Buffer a record for writing, subject to the limits of the writer.
+        :param record: the serialized record, without a trailing newline
+        :param level: the log level of the record, for the DropBelowLevel overflow policy
+        :return:
+        """
+        if not self.writing_thread.is_alive() and not self._closed:
+            self._initialize_writing_thread()
+
+        if isinstance(record, str):
+            record = record.encode('utf-8')
+
+        with self._condition:
+            self._add(record, level)
+
+            # only wake up the writing thread once a chunk is complete, the age limit is handled by its wait timeout
+            if self._buffer.size >= self.flush_max_bytes or not self._buffer.has_room():
+                self._condition.notify()
+
+    def extend(self, records):
+        """
+        Buffer several records for writing at once, subject to the limits of the writer. The lock of the writer is
+        taken once for all of them.
+        :param records: (serialized record, log level) pairs
+        :return:
+        """
+        if not self.writing_thread.is_alive() and not self._closed:
+            self._initialize_writing_thread()
+
+        records = [(record.encode('utf-8') if isinstance(record, str) else record, level) for record, level in records]
+
+        with self._condition:
+            for record, level in records:
+                self._add(record, level)
+
+            if self._buffer.size >= self.flush_max_bytes or not self._buffer.has_room():
+                self._condition.notify()
+
+    def _add(self, record: bytes, level: int):
+        # called with the lock held
+        if not self._buffer.has_room(len(record)) and not self._make_room(level, len(record)):
+            return
+
+        if not self._buffer:
+            self._oldest_record_time = monotonic()
+        self._buffer.append(record, level)
+
+    def _make_room(self, level, size):
+        # called with the lock held, returns whether the record can be appended
+        if self.limits.policy != OverflowPolicy.Block:
+            return self._buffer.make_room(level, size) >= 0
+
+        # make sure the writing thread takes the buffer, then wait for it
+        self._condition.notify()
+        end_time = monotonic() + self.limits.block_timeout
+        while not self._buffer.has_room(size):
+            remaining = end_time - monotonic()
+            if remaining <= 0 or self._closed:
+                self._buffer.dropped.add()
+                return False
+            self._space.wait(remaining)
+        return True
+
+    def pending(self):
+        """
+        Number of records which wait for the next chunk.
+        :return:
+        """
+        return len(self._buffer)
+
+    def flush(self):
+        """
+        Write the buffered records and fsync them unless the fsync policy is Never.
+        :return:
+        """
+        self._write_buffer(sync=self.fsync != FsyncPolicy.Never)
+
+    def close(self):
+        """
+        Write all pending records, close the file and wait for the compression of rotated files.
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            self._space.notify_all()
+        self.writing_thread.join()
+
+    def stats(self):
+        """
+        :return: a dictionary of the records, bytes and chunks written, the fsyncs, rotations and the buffer state
+        """
+        with self._lock:
+            return {
+                'records_written': self.records_written,
+                'bytes_written': self.bytes_written,
+                'chunks_written': self.chunks_written,
+                'fsyncs': self.fsyncs,
+                'rotations': self._rotations,
+                'queue_depth': len(self._buffer),
+                'queue_bytes': self._buffer.size,
+                'records_dropped': self._buffer.dropped.total,
+            }
+
+    def _wait_for_chunk(self):
+        """
+        Block until a chunk is complete, the oldest record reached the maximum age or the writer shuts down.
+        :return: False if the writer shuts down
+        """
+        with self._condition:
+            while not self._closed:
+                if self._buffer:
+                    if self._buffer.size >= self.flush_max_bytes or not self._buffer.has_room():
+                        return True
+                    timeout = self._oldest_record_time + self.flush_interval - monotonic()
+                    if timeout <= 0:
+                        return True
+                else:
+                    timeout = self.flush_interval
+
+                # wake up regularly to notice the exit of the main thread
+                self._condition.wait(min(timeout, MAIN_THREAD_POLL_INTERVAL))
+
+                if not main_thread().is_alive():
+                    return False
+            return False
+
+    def _drain_buffer(self):
+        last_try = False
+        while not last_try:
+            last_try = not self._wait_for_chunk()
+            try:
+                self._write_buffer(sync=last_try and self.fsync != FsyncPolicy.Never)
+            except OSError as e:
+                logging.getLogger(__name__).error('Could not write logs to %s: %s', self.path, e)
+
+        with self._write_lock:
+            self._close_file()
+            for compression_thread in self._compression_threads:
+                compression_thread.join()
+
+    def _take_buffer(self):
+        with self._condition:
+            records = self._buffer.take_all()
+            self._oldest_record_time = None
+            self._space.notify_all()
+
+            dropped = self._buffer.dropped.take_due()
+        if dropped and self.drop_reporter is not None:
+            report = self.drop_reporter(dropped)
+            if report is not None:
+                records.append(report.encode('utf-8') if isinstance(report, str) else report)
+        return records
+
+    def _write_buffer(self, sync: bool=False):
+        with self._write_lock:
+            records = self._take_buffer()
+            if records:
+                # a single write call per chunk, the records are copied once into the chunk
+                records.append(b'')
+                chunk = b'\n'.join(records)
+                self._write(chunk, len(records) - 1)
+
+            if self._file is not None and self._unsynced:
+                if sync or self.fsync == FsyncPolicy.Always or (
+                        self.fsync == FsyncPolicy.Interval
+                        and monotonic() - self._last_sync_time >= self.fsync_interval):
+                    self._sync()
+
+    def _write(self, chunk: bytes, records: int):
+        if self._file is not None and self._is_rotation_due(len(chunk)):
+            self._rotate()
+        if self._file is None:
+            self._open()
+
+        self._file.write(chunk)
+        self._file_size += len(chunk)
+        self._unsynced = True
+        with self._lock:
+            self.records_written += records
+            self.bytes_written += len(chunk)
+            self.chunks_written += 1
+
+    def _is_rotation_due(self, size: int):
+        if self.max_bytes is not None and self._file_size > 0 and self._file_size + size > self.max_bytes:
+            return True
+        return self.max_age is not None and monotonic() - self._opened_at >= self.max_age
+
+    def _open(self):
+        # unbuffered, every chunk goes to the file with a single write call
+        self._file = open(self.path, 'ab', buffering=0)
+        self._file_size = self._file.tell()
+        self._opened_at = monotonic()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = False
+        self._last_sync_time = monotonic()
+        with self._lock:
+            self.fsyncs += 1
+
+    def _close_file(self):
+        if self._file is not None:
+            if self._unsynced and self.fsync != FsyncPolicy.Never:
+                self._sync()
+            self._file.close()
+            self._file = None
+
+    def _rotate(self):
+        self._close_file()
+        self._rotations += 1
+        rotated_path = '{}.{}-{:06d}'.format(self.path, strftime('%Y%m%d%H%M%S'), self._rotations)
+        os.rename(self.path, rotated_path)
+
+        self._compression_threads = [thread for thread in self._compression_threads if thread.is_alive()]
+        if self.compression is not None:
+            # compressing a large file takes a while, the records go on to the new file in the meantime
+            compression_thread = Thread(target=self._compress, args=(rotated_path,))
+            compression_thread.daemon = False
+            compression_thread.name = 'file-compression-thread'
+            compression_thread.start()
+            self._compression_threads.append(compression_thread)
+        else:
+            self._remove_old_files()
+
+    def _compress(self, path: str):
+        compressed_path = path + COMPRESSION_SUFFIXES[self.compression]
+        # the temporary file is not taken for a rotated file if the process dies while compressing
+        with open(path, 'rb') as source, gzip.open(compressed_path + '.tmp', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.rename(compressed_path + '.tmp', compressed_path)
+        os.remove(path)
+        self._remove_old_files()
+
+    def rotated_files(self):
+        """
+        :return: the paths of the rotated files, oldest first
+        """
+        return sorted(path for path in glob.glob(glob.escape(self.path) + '.*') if not path.endswith('.tmp'))
+
+    def _remove_old_files(self):
+        if self.backup_count is None:
+            return
+        rotated = self.rotated_files()
+        if self.compression is not None:
+            # files which are still being compressed are not counted, nor removed under the compression thread
+            rotated = [path for path in rotated if path.endswith(COMPRESSION_SUFFIXES[self.compression])]
+        for path in rotated[:max(0, len(rotated) - self.backup_count)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # removed by a concurrent compression thread
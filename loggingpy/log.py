@@ -1,17 +1,45 @@
 from enum import Enum
+import atexit
 import datetime
-import pytz
 import traceback
 import logging
-import logging.handlers
-import queue
 import json
 import hashlib
+import os
 import random
 import re
+import time
 import uuid
-from loggingpy.exceptions import ExceptionInfo
-from typing import Union
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from threading import Lock
+from loggingpy.coalescing import ExceptionCoalescer, ExceptionGroup
+from loggingpy.dispatch import LogDispatcher
+from loggingpy.encoder import JsonEncoder
+from loggingpy.exceptions import ExceptionInfo, ExceptionSnapshot
+from loggingpy.queues import QueueLimits
+from loggingpy.sampling import Sampler, SamplingKey
+from typing import Callable, Iterable, Union
+
+# payload types, contexts and levels are a small fixed set, the names derived from them are computed once
+DERIVED_NAME_CACHE_SIZE = 1024
+NAME_TYPES = (str, type(None))
+
+# the stack traces of the exceptions raised at different code locations which are kept formatted and hashed
+EXCEPTION_CACHE_SIZE = 256
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# messages and payloads may be given as callables, which are only called if the entry is logged
+Message = Union[str, Callable[[], str]]
+Payload = Union[str, dict, Callable[[], Union[str, dict]]]
+
+# the entries of a Logger.log_many call are queued in batches of this many, an iterable of any length is neither held
+# in memory at once nor delivered only once it is exhausted
+LOG_MANY_BATCH_SIZE = 1000
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
 
 
 class LogLevel(Enum):
@@ -30,6 +58,8 @@ class LogEntry:
     A log entry consists of a log level, a timestamp, a context and a payload ( which are all required)
     and from data and exception information (both optional).
     """
+    __slots__ = ('timestamp_ns', '_timestamp', 'context', 'payload_type', 'log_level', 'message', 'payload',
+                 'exception', 'suppressed')
 
     def __init__(
         self,
@@ -39,23 +69,64 @@ class LogEntry:
         timestamp: datetime=None,
         message='',
         payload=None,
-        exception: Exception=None
+        exception: Exception=None,
+        suppressed: int=0
     ):
+        """
+        :param suppressed: the number of entries of the same key which were suppressed by sampling before this one
+        """
 
-        # timestamp default must be set here because in the signature it is set to init time
+        # timestamp default must be set here because in the signature it is set to init time. It is captured as the
+        # raw nanoseconds since the epoch, the datetime is only created if somebody asks for it
         if timestamp is None:
-            timestamp = pytz.UTC.localize(datetime.datetime.utcnow())
+            self.timestamp_ns = time.time_ns()
+            self._timestamp = None
         else:
             if not timestamp.tzinfo:
                 raise ValueError("Timestamp provided should not be naive")
+            self.timestamp_ns = None
+            self._timestamp = timestamp
 
-        self.timestamp = timestamp
         self.context = context
         self.payload_type = payload_type
         self.log_level = log_level
         self.message = message
         self.payload = payload
         self.exception = exception
+        self.suppressed = suppressed
+
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = EPOCH + datetime.timedelta(microseconds=self.timestamp_ns // 1000)
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, timestamp: datetime):
+        self.timestamp_ns = None
+        self._timestamp = timestamp
+
+    @property
+    def levelno(self):
+        """
+        The numeric log level, like the one of a log record, for the queues which take both.
+        """
+        return self.log_level.value
+
+
+class LogBatch(list):
+    """
+    The log entries of a Logger.log_many call which are queued and handed to the sinks together. A batch counts with
+    all its entries against the record limit of a bounded dispatch queue.
+    """
+    __slots__ = ('levelno',)
+
+    def __init__(self, levelno: int):
+        """
+        :param levelno: the numeric log level of the entries, for the queues which take both entries and records
+        """
+        list.__init__(self)
+        self.levelno = levelno
 
 
 class LogEntryParser:
@@ -63,6 +134,30 @@ class LogEntryParser:
     The Log entry parser helps to turn log entries into serializable data for the logger.
     """
 
+    _timestamp_prefix = (None, None)  # the second and its rendering, replaced as a whole to be read consistently
+
+    @staticmethod
+    def format_timestamp(timestamp_ns: int):
+        """
+        Render a UTC timestamp like str(datetime) does. The date and time up to the second are rendered once per second.
+        :param timestamp_ns: nanoseconds since the epoch
+        :return: the timestamp, e.g. 2020-01-02 03:04:05.000006+00:00
+        """
+        second, nanoseconds = divmod(timestamp_ns, 1000000000)
+        cached_second, prefix = LogEntryParser._timestamp_prefix
+        if second != cached_second:
+            prefix = str(EPOCH + datetime.timedelta(seconds=second))[:19]
+            LogEntryParser._timestamp_prefix = (second, prefix)
+        microseconds = nanoseconds // 1000
+        if microseconds:
+            return '%s.%06d+00:00' % (prefix, microseconds)
+        return prefix + '+00:00'
+
+    _fingerprints = OrderedDict()
+    _fingerprints_lock = Lock()
+    _fingerprint_hits = 0
+    _fingerprint_misses = 0
+
     @staticmethod
     def exception_to_string(exception: Exception):
         """
@@ -70,9 +165,9 @@ class LogEntryParser:
         :param exception:
         :return:
         """
-        stack = traceback.extract_tb(exception.__traceback__)
-        pretty = traceback.format_list(stack)
-        return ''.join(pretty) + '\n  {} {}'.format(exception.__class__, exception)
+        snapshot = ExceptionSnapshot.of(exception)
+        stack_trace, _ = LogEntryParser.exception_fingerprint(snapshot)
+        return stack_trace + '\n  {} {}'.format(snapshot.exception_class, snapshot.message)
 
     @staticmethod
     def hash_exception(exception: Exception):
@@ -81,9 +176,44 @@ class LogEntryParser:
         :param exception:
         :return:
         """
-        stack_trace = LogEntryParser.exception_to_string(exception)
-        stack_trace_lines = stack_trace.split('\n')
-        stack_trace_lines = stack_trace_lines[:-2]
+        _, exception_hash = LogEntryParser.exception_fingerprint(exception)
+        return exception_hash
+
+    @staticmethod
+    def exception_fingerprint(exception: Union[Exception, ExceptionSnapshot]):
+        """
+        Format the stack trace of an exception and hash it. Both only depend on where the exception was raised, so
+        they are cached by the exception type and the code locations of its traceback.
+        :param exception: an exception or its snapshot
+        :return: the formatted stack trace without the exception message, and the hash
+        """
+        snapshot = ExceptionSnapshot.of(exception)
+        key = (snapshot.exception_class, snapshot.locations)
+
+        with LogEntryParser._fingerprints_lock:
+            fingerprint = LogEntryParser._fingerprints.get(key)
+            if fingerprint is not None:
+                LogEntryParser._fingerprints.move_to_end(key)
+                LogEntryParser._fingerprint_hits += 1
+                return fingerprint
+
+        stack_trace = ''.join(traceback.format_list(snapshot.stack_summary()))
+        fingerprint = (stack_trace, LogEntryParser._hash_stack_trace(stack_trace))
+
+        with LogEntryParser._fingerprints_lock:
+            LogEntryParser._fingerprint_misses += 1
+            LogEntryParser._fingerprints[key] = fingerprint
+            if len(LogEntryParser._fingerprints) > EXCEPTION_CACHE_SIZE:
+                LogEntryParser._fingerprints.popitem(last=False)
+
+        return fingerprint
+
+    @staticmethod
+    def _hash_stack_trace(stack_trace: str):
+        # every formatted frame ends with a line break, the last element of the split is empty
+        stack_trace_lines = stack_trace.split('\n')[:-1]
+        if not stack_trace_lines:
+            return ''
         stack_trace_lines[-1] = stack_trace_lines[-1].split('(')[0]
 
         # TBD: this routine would just create a single(32 character) hash of all exceptions:
@@ -101,6 +231,25 @@ class LogEntryParser:
         hashes = [l[:8] for l in stack_hash]
         return '.'.join(hashes)
 
+    @staticmethod
+    def parse_exception(exception: Union[Exception, ExceptionSnapshot]):
+        """
+        Turn an exception into the exception info of the data transfer object.
+        :param exception: an exception or its snapshot
+        :return: a dictionary
+        """
+        snapshot = ExceptionSnapshot.of(exception)
+        exception_info = ExceptionInfo(exception_type=snapshot.exception_class.__name__,
+                                       error_message=snapshot.message,
+                                       stack_trace=LogEntryParser.exception_to_string(snapshot),
+                                       exception_hash=LogEntryParser.hash_exception(snapshot))
+        return {
+            "exception_type": exception_info.exception_type,
+            "error_message": exception_info.error_message,
+            "stack_trace": exception_info.stack_trace,
+            "exception_hash": exception_info.exception_hash
+        }
+
     @staticmethod
     def parse_log_entry(log_entry: LogEntry):
         """
@@ -108,15 +257,6 @@ class LogEntryParser:
         :param log_entry:
         :return:
         """
-        exception = log_entry.exception
-        if exception is not None:
-            exception_info = ExceptionInfo(exception_type=exception.__class__.__name__,
-                                           error_message=str(exception),
-                                           stack_trace=LogEntryParser.exception_to_string(exception),
-                                           exception_hash=LogEntryParser.hash_exception(exception))
-        else:
-            exception_info = None
-
         # transparently wrap string values into an object to ensure a logged payload is always a JSON object rather
         # than a scalar. We do not care about other primitives etc. If somebody is willing to log an int, it'll just
         # get serialized
@@ -135,23 +275,79 @@ class LogEntryParser:
             dto["payload_type"] = log_entry.payload_type
 
             if payload is not None:
-                property_name = dto['payload_type'].replace('.', '_')
-                property_name = LogEntryParser.underscore(property_name)
+                property_name = LogEntryParser.property_name(dto['payload_type'])
                 dto[property_name] = payload                                # add payload if any
 
         if log_entry.message is not "" and log_entry.message is not None:   # add message if any
             dto["message"] = log_entry.message
 
-        if exception_info is not None:                                      # add exception if any
-            dto["exception_info"] = {
-                "exception_type": exception_info.exception_type,
-                "error_message": exception_info.error_message,
-                "stack_trace": exception_info.stack_trace,
-                "exception_hash": exception_info.exception_hash
-            }
+        if log_entry.exception is not None:                                 # add exception if any
+            dto["exception_info"] = LogEntryParser.parse_exception(log_entry.exception)
+
+        if log_entry.suppressed:                                            # add suppressed entries if any
+            dto["suppressed_entries"] = log_entry.suppressed
 
         return dto
 
+    @staticmethod
+    @lru_cache(maxsize=DERIVED_NAME_CACHE_SIZE)
+    def property_name(payload_type: str):
+        """
+        The name of the property which holds the payload of the given payload type.
+        :param payload_type:
+        :return:
+        """
+        return LogEntryParser.underscore(payload_type.replace('.', '_'))
+
+    @staticmethod
+    @lru_cache(maxsize=DERIVED_NAME_CACHE_SIZE)
+    def qualified_payload_type(context: str, payload_type: str):
+        """
+        Prefix the payload type with the context of the logger.
+        :param context:
+        :param payload_type:
+        :return:
+        """
+        return context + '.' + payload_type
+
+    @staticmethod
+    @lru_cache(maxsize=DERIVED_NAME_CACHE_SIZE)
+    def header_fragment(level_name: str, context: str, payload_type: str, with_payload: bool):
+        """
+        Pre-encode the JSON members of the data transfer object which only depend on the level, context and payload
+        type: the level, context and payload type members, followed by the key of the payload property if there is a
+        payload.
+        :param level_name:
+        :param context:
+        :param payload_type: the payload type, '' for none
+        :param with_payload: whether the key of the payload property is appended
+        :return: the fragment
+        """
+        fragment = '"level": {}, "context": {}'.format(
+            encode_basestring_ascii(level_name), encode_basestring_ascii(context))
+
+        if payload_type != '':
+            fragment += ', "payload_type": ' + encode_basestring_ascii(payload_type)
+
+            if with_payload:
+                fragment += ', {}: '.format(encode_basestring_ascii(LogEntryParser.property_name(payload_type)))
+
+        return fragment
+
+    @staticmethod
+    def cache_info():
+        """
+        Hit and miss statistics of the caches of derived names.
+        :return: a dictionary of the cache statistics by cache name
+        """
+        return {
+            'property_name': LogEntryParser.property_name.cache_info(),
+            'qualified_payload_type': LogEntryParser.qualified_payload_type.cache_info(),
+            'header_fragment': LogEntryParser.header_fragment.cache_info(),
+            'exception_fingerprint': CacheInfo(LogEntryParser._fingerprint_hits, LogEntryParser._fingerprint_misses,
+                                               EXCEPTION_CACHE_SIZE, len(LogEntryParser._fingerprints)),
+        }
+
     @staticmethod
     def underscore(word):
         # from https://github.com/jpvanhal/inflection/blob/2ea54f615924c5cfc967d50cc179eacf0b269c08/inflection.py#L394
@@ -178,6 +374,223 @@ class Logger:
     logging to make proper structured logger calls.
     """
     sinks = []
+    queue_limits = None
+    dispatcher = None
+    _dispatcher_lock = Lock()
+    exception_snapshots = False
+    snapshot_max_frames = None
+    sampler = None
+    exception_coalescer = None
+    stats_interval = None
+    _stats_reported_at = None
+    _last_enqueue_count = (None, 0)  # the monotonic time and the number of enqueued records of the last stats
+
+    @staticmethod
+    def with_queue_limits(limits: QueueLimits):
+        """
+        Bound the dispatch queue shared by all structured loggers. Records are dropped according to the overflow policy
+        of the limits, and reported by a synthetic log entry. The limits apply from the next start of the dispatcher,
+        which is the creation of the first structured logger or the first one after a shutdown.
+        :param limits: the limits, or None for an unbounded queue
+        :return:
+        """
+        Logger.queue_limits = limits
+
+    @staticmethod
+    def with_exception_snapshots(enabled: bool=True, max_frames: int=None):
+        """
+        Capture logged exceptions as snapshots: the logging call only records the type, message and code locations of
+        an exception, formatting and hashing its stack trace happen on the dispatcher thread. The queued entries then
+        keep no frames alive.
+        :param enabled:
+        :param max_frames: the number of innermost frames to keep, all frames if None. Fewer frames change the hash
+        :return:
+        """
+        Logger.exception_snapshots = enabled
+        Logger.snapshot_max_frames = max_frames
+
+    @staticmethod
+    def with_sampling(sampler: Sampler):
+        """
+        Rate limit and sample the entries of all structured loggers. The sampler decides before an entry is built and
+        serialized, so suppressed entries cost little more than the check of the log level.
+        :param sampler: the sampler, or None to log every entry
+        :return:
+        """
+        Logger.sampler = sampler
+
+    @staticmethod
+    def with_exception_coalescing(coalescer: ExceptionCoalescer):
+        """
+        Fold the repeated occurrences of an exception into summaries. The first occurrence of an exception hash within
+        the window of the coalescer is logged in full, the later ones are only counted, and reported by a summary entry
+        once the window is over.
+        :param coalescer: the coalescer, or None to log every occurrence in full
+        :return:
+        """
+        Logger.exception_coalescer = coalescer
+
+    @staticmethod
+    def with_stats_reporting(interval: float=60):
+        """
+        Log the metrics of the logging pipeline as a Logging.Stats entry at most once per interval, with the next entry
+        logged after the interval passed.
+        :param interval: seconds between two stats entries, or None to stop reporting
+        :return:
+        """
+        Logger.stats_interval = interval
+        Logger._stats_reported_at = time.monotonic()
+
+    @staticmethod
+    def stats():
+        """
+        A snapshot of the metrics of the logging pipeline: the dispatch queue and its enqueue rate since the previous
+        snapshot, every sink which has metrics, the entries suppressed by the sampler and the exceptions folded by the
+        coalescer.
+        :return: a dictionary
+        """
+        stats = {}
+        dispatcher = Logger.dispatcher
+        if dispatcher is not None:
+            stats['dispatch'] = dispatcher.stats()
+            now = time.monotonic()
+            enqueued = stats['dispatch']['dispatched'] + stats['dispatch']['queue_depth']
+            last_time, last_enqueued = Logger._last_enqueue_count
+            if last_time is not None and now > last_time and enqueued >= last_enqueued:
+                stats['dispatch']['enqueue_rate'] = round((enqueued - last_enqueued) / (now - last_time), 1)
+            Logger._last_enqueue_count = (now, enqueued)
+
+        stats['sinks'] = [dict(sink.stats(), sink=type(sink).__name__)
+                          for sink in Logger.sinks if callable(getattr(sink, 'stats', None))]
+        if Logger.sampler is not None:
+            stats['suppressed_entries'] = Logger.sampler.suppressed_total
+        if Logger.exception_coalescer is not None:
+            stats['coalesced_exceptions'] = Logger.exception_coalescer.coalesced_total
+        return stats
+
+    @staticmethod
+    def get_dispatcher():
+        """
+        Return the dispatcher which hands the records of all structured loggers to the sinks, and start it if needed.
+        :return:
+        """
+        with Logger._dispatcher_lock:
+            if Logger.dispatcher is None:
+                Logger.dispatcher = LogDispatcher(
+                    Logger.sinks,
+                    Logger.queue_limits,
+                    drop_reporter=lambda dropped: Logger.drop_report_record(dropped, 'dispatch'),
+                    make_record=Logger.make_record,
+                    due_entries=Logger.due_reports,
+                    sink_drop_reporter=Logger.drop_report_record
+                ).start()
+            return Logger.dispatcher
+
+    @staticmethod
+    def drop_report_record(dropped: int, source: str):
+        """
+        Create the synthetic record which reports records dropped by a full queue.
+        :param dropped: the number of dropped records
+        :param source: the name of the queue which dropped the records
+        :return: a log record
+        """
+        log_entry = LogEntry(
+            log_level=LogLevel.Warning,
+            context='Logging',
+            payload_type='Logging.DroppedRecords',
+            message='Dropped {} log records because the {} queue was full.'.format(dropped, source),
+            payload={'dropped_records': dropped, 'queue': source}
+        )
+        return Logger.make_record(log_entry)
+
+    @staticmethod
+    def suppression_summary_entry(summary: list):
+        """
+        Create the synthetic entry which reports entries suppressed by the sampler.
+        :param summary: the suppressed entries by sampling key and value, as returned by Sampler.take_summary
+        :return: a log entry
+        """
+        suppressed = sum(item['count'] for item in summary)
+        return LogEntry(
+            log_level=LogLevel.Warning,
+            context='Logging',
+            payload_type='Logging.SuppressedEntries',
+            message='Suppressed {} log entries by sampling and rate limits.'.format(suppressed),
+            payload={'suppressed_entries': suppressed, 'keys': summary}
+        )
+
+    @staticmethod
+    def exception_summary_entry(exception_hash: str, group: ExceptionGroup):
+        """
+        Create the synthetic entry which reports the occurrences of an exception folded by the coalescer.
+        :param exception_hash:
+        :param group: the folded occurrences
+        :return: a log entry
+        """
+        return LogEntry(
+            log_level=group.log_level,
+            context='Logging',
+            payload_type='Logging.ExceptionSummary',
+            message='{} {} occurred {} more times after the logged occurrence.'.format(
+                group.exception_type, exception_hash, group.count),
+            payload={
+                'exception_hash': exception_hash,
+                'exception_type': group.exception_type,
+                'context': group.context,
+                'payload_type': group.payload_type,
+                'coalesced_occurrences': group.count,
+                'first_timestamp': LogEntryParser.format_timestamp(group.first_ns),
+                'last_timestamp': LogEntryParser.format_timestamp(group.last_ns),
+                'messages': group.messages
+            }
+        )
+
+    @staticmethod
+    def due_reports(force: bool=False):
+        """
+        Create the synthetic entries which are due: the stats of the pipeline, and the summaries of the entries
+        suppressed by the sampler and of the exceptions folded by the coalescer.
+        :param force: create the summaries whether they are due or not, the stats are only reported when due
+        :return: a list of log entries
+        """
+        reports = []
+        interval = Logger.stats_interval
+        if interval is not None and time.monotonic() - Logger._stats_reported_at >= interval:
+            Logger._stats_reported_at = time.monotonic()
+            reports.append(LogEntry(
+                log_level=LogLevel.Info,
+                context='Logging',
+                payload_type='Logging.Stats',
+                payload=Logger.stats()
+            ))
+        if Logger.sampler is not None:
+            summary = Logger.sampler.take_summary(force)
+            if summary:
+                reports.append(Logger.suppression_summary_entry(summary))
+        if Logger.exception_coalescer is not None:
+            reports.extend(Logger.exception_summary_entry(exception_hash, group)
+                           for exception_hash, group in Logger.exception_coalescer.take_due(force))
+        return reports
+
+    @staticmethod
+    def make_record(log_entry: LogEntry):
+        """
+        Wrap a log entry into a log record, for handlers which are not fed through a standard python logger.
+        :param log_entry:
+        :return: a log record
+        """
+        attributes = {
+            'name': log_entry.context,
+            'levelno': log_entry.log_level.value,
+            'levelname': logging.getLevelName(log_entry.log_level.value),
+            'msg': log_entry.message,
+            'log_entry': log_entry
+        }
+        if log_entry.timestamp_ns is not None:
+            # the record may be made long after the entry, on another thread
+            attributes['created'] = log_entry.timestamp_ns / 1e9
+            attributes['msecs'] = log_entry.timestamp_ns % 1000000000 // 1000000
+        return logging.makeLogRecord(attributes)
 
     @staticmethod
     def with_sinks(sinks: list):
@@ -204,23 +617,16 @@ class Logger:
     def __init__(self, context: str, prefix_payload_type: bool = True):
         self.context = context
         self.logger = logging.getLogger(context)
-        self.handlers = []
         self.prefix_payload_type = prefix_payload_type
 
-        if len(self.logger.handlers) == 0:
-            for sink in Logger.sinks:
-                # each sink we add to the logger gets a queue handler prepended in order to allow the message to enqueue
-                # and thereby make the logger non-blocking to the code
-                log_queue = queue.Queue(-1)
-                queue_handler = logging.handlers.QueueHandler(log_queue)
-                queue_listener = logging.handlers.QueueListener(log_queue, sink)
-                queue_listener.start()
-
-                # we collect the handlers in order to be able to flush them at the end and ensure graceful shutdown
-                self.handlers.append(sink)
-                self.logger.addHandler(queue_handler)
-        else:
-            self.handlers.extend(Logger.sinks)
+        # we collect the handlers in order to be able to flush them at the end and ensure graceful shutdown
+        self.handlers = list(Logger.sinks)
+
+        # all loggers enqueue into the queue of the shared dispatcher, which makes the logger non-blocking to the code
+        # without a queue and thread per context and sink
+        dispatch_handler = Logger.get_dispatcher().handler
+        if dispatch_handler not in self.logger.handlers:
+            self.logger.addHandler(dispatch_handler)
 
     def set_level(self, level):
         """
@@ -230,21 +636,86 @@ class Logger:
         """
         self.logger.setLevel(level)
 
+    def is_enabled_for(self, log_level: LogLevel):
+        """
+        Whether entries of the given level are logged.
+        :param log_level:
+        :return:
+        """
+        return self.logger.isEnabledFor(log_level.value)
+
     def _log(self, log_entry: LogEntry):
         if log_entry.context is None or log_entry.context is "":
             log_entry.context = self.context
 
+        # the entry alone is queued if the dispatcher is the only handler which would receive it, the log record is
+        # then made on the dispatcher thread
+        dispatcher = Logger.dispatcher
+        if dispatcher is not None and self._dispatches_only(dispatcher):
+            dispatcher.queue.put(log_entry)
+            return
+
         # exc_info=True, stack_info=True, add this to drop out some dto info
         self.logger.log(log_entry.log_level.value, log_entry.message, extra={'log_entry': log_entry})
 
+    def _log_reports(self, reports: list):
+        # the counts of the reports were reset when they were taken, so they are queued for the sinks whatever the level
+        # of this logger and its handlers would let through
+        if reports:
+            queue_put = Logger.get_dispatcher().queue.put
+            for report in reports:
+                queue_put(report)
+
+    def _dispatches_only(self, dispatcher: LogDispatcher):
+        # whether the standard python logger would hand a record to the dispatcher and nothing else
+        stdlib_logger = self.logger
+        if stdlib_logger.filters or stdlib_logger.handlers != [dispatcher.handler]:
+            return False
+        parent = stdlib_logger.parent if stdlib_logger.propagate else None
+        while parent is not None:
+            if parent.handlers:
+                return False
+            parent = parent.parent if parent.propagate else None
+        return True
+
     def _write_entry(
         self,
         log_level: Enum,
         payload_type: str,
-        message: str = '',
-        payload=None,
+        message: Message = '',
+        payload: Payload = None,
         exception: Exception = None
     ):
+        # nothing is allocated or evaluated for entries which no sink would receive
+        if not self.is_enabled_for(log_level):
+            return
+
+        if exception is not None and Logger.exception_snapshots:
+            exception = ExceptionSnapshot(exception, Logger.snapshot_max_frames)
+
+        sampler = Logger.sampler
+        coalescer = Logger.exception_coalescer
+        if sampler is not None or coalescer is not None or Logger.stats_interval is not None:
+            self._log_reports(Logger.due_reports())
+
+        # sampling happens before anything is evaluated, built or serialized
+        suppressed = 0
+        if sampler is not None:
+            suppressed = self._sample(sampler, log_level, payload_type, exception)
+            if suppressed is None:
+                return
+
+        # messages and payloads can be passed as callables which are only evaluated for entries that are logged
+        if callable(message):
+            message = message()
+
+        # the folded occurrences of an exception keep their message for the summary, but are neither built nor queued
+        if exception is not None and coalescer is not None \
+                and not self._coalesce(coalescer, log_level, payload_type, message, exception):
+            return
+
+        if callable(payload):
+            payload = payload()
 
         second_log_entry = None
         if payload is not None and payload_type is '':
@@ -261,22 +732,119 @@ class Logger:
             )
 
         if self.context and self.prefix_payload_type:
-            payload_type = self.context + '.' + payload_type
+            payload_type = LogEntryParser.qualified_payload_type(self.context, payload_type)
 
         log_entry = LogEntry(context="",
                              log_level=log_level,
                              payload_type=payload_type,
                              message=message,
                              payload=payload,
-                             exception=exception)
+                             exception=exception,
+                             suppressed=suppressed)
         self._log(log_entry)
 
         if second_log_entry is not None:
             self._log(second_log_entry)
 
+    def _sample(self, sampler: Sampler, log_level: Enum, payload_type: str, exception):
+        if self.context and self.prefix_payload_type:
+            payload_type = LogEntryParser.qualified_payload_type(self.context, payload_type)
+        values = self._sampling_values(log_level, payload_type)
+        if exception is not None and sampler.needs(SamplingKey.ExceptionHash):
+            # cached by the code locations of the exception, only the first of a kind is formatted here
+            values[SamplingKey.ExceptionHash] = LogEntryParser.hash_exception(exception)
+        return sampler.sample(values)
+
+    def _sampling_values(self, log_level: Enum, payload_type: str):
+        # the values of the sampling keys, as the entry will have them
+        return {
+            SamplingKey.Context: self.context,
+            SamplingKey.PayloadType: payload_type,
+            SamplingKey.Level: log_level.name,
+        }
+
+    def _coalesce(self, coalescer: ExceptionCoalescer, log_level: Enum, payload_type: str, message, exception):
+        snapshot = ExceptionSnapshot.of(exception)
+        if self.context and self.prefix_payload_type:
+            payload_type = LogEntryParser.qualified_payload_type(self.context, payload_type)
+        return coalescer.add(LogEntryParser.hash_exception(snapshot),
+                             snapshot.exception_class.__name__,
+                             log_level,
+                             self.context,
+                             payload_type,
+                             message if isinstance(message, str) else str(message),
+                             time.time_ns())
+
+    def log_many(self, log_level: LogLevel, payload_type: str, payloads: Iterable[Payload], message: Message=''):
+        """
+        Log an entry for every payload, like a batch job which logs one entry per processed item. The level check, the
+        due reports, the qualified payload type and the message are computed once for all entries, every entry keeps
+        its own timestamp. If the dispatcher is the only handler, the entries are queued in batches which the sinks
+        take at once, otherwise they are logged one by one.
+        :param log_level:
+        :param payload_type: the payload type of all entries
+        :param payloads: an iterable or generator of payloads, which may be callables like the payload of a single
+        entry. It is not consumed if the level is disabled
+        :param message: the message of all entries
+        :return:
+        """
+        if not self.is_enabled_for(log_level):
+            return
+
+        # entries without a payload type get the generated one and its warning each, like single entries
+        if payload_type == '':
+            for payload in payloads:
+                self._write_entry(log_level, payload_type, message=message, payload=payload)
+            return
+
+        sampler = Logger.sampler
+        if sampler is not None or Logger.exception_coalescer is not None or Logger.stats_interval is not None:
+            self._log_reports(Logger.due_reports())
+
+        if self.context and self.prefix_payload_type:
+            payload_type = LogEntryParser.qualified_payload_type(self.context, payload_type)
+        values = self._sampling_values(log_level, payload_type) if sampler is not None else None
+
+        if callable(message):
+            message = message()
+
+        dispatcher = Logger.dispatcher
+        batched = dispatcher is not None and self._dispatches_only(dispatcher)
+        batch_size = LOG_MANY_BATCH_SIZE
+        if batched and dispatcher.limits is not None and dispatcher.limits.max_records is not None:
+            batch_size = max(1, min(batch_size, dispatcher.limits.max_records))  # a larger batch would never fit
+        batch = LogBatch(log_level.value)
+        for payload in payloads:
+            suppressed = 0
+            if sampler is not None:
+                suppressed = sampler.sample(values)
+                if suppressed is None:
+                    continue
+
+            if callable(payload):
+                payload = payload()
+
+            log_entry = LogEntry(context=self.context,
+                                 log_level=log_level,
+                                 payload_type=payload_type,
+                                 message=message,
+                                 payload=payload,
+                                 suppressed=suppressed)
+            if not batched:
+                self._log(log_entry)
+                continue
+
+            batch.append(log_entry)
+            if len(batch) >= batch_size:
+                dispatcher.queue.put(batch)
+                batch = LogBatch(log_level.value)
+
+        if batch:
+            dispatcher.queue.put(batch)
+
     # convenience methods
 
-    def debug(self, message: str='', exception: Exception=None, payload_type: str='', payload: Union[str, dict]=None):
+    def debug(self, message: Message='', exception: Exception=None, payload_type: str='', payload: Payload=None):
         self._write_entry(
             LogLevel.Debug,
             payload_type=payload_type,
@@ -285,7 +853,7 @@ class Logger:
             exception=exception
         )
 
-    def info(self, message: str='', exception: Exception=None, payload_type: str='', payload: Union[str, dict]=None):
+    def info(self, message: Message='', exception: Exception=None, payload_type: str='', payload: Payload=None):
         self._write_entry(
             LogLevel.Info,
             payload_type=payload_type,
@@ -294,7 +862,7 @@ class Logger:
             exception=exception
         )
 
-    def warning(self, message: str='', exception: Exception=None, payload_type: str='', payload: Union[str, dict]=None):
+    def warning(self, message: Message='', exception: Exception=None, payload_type: str='', payload: Payload=None):
         self._write_entry(
             LogLevel.Warning,
             payload_type=payload_type,
@@ -303,7 +871,7 @@ class Logger:
             exception=exception
         )
 
-    def error(self, message: str='', exception: Exception=None, payload_type: str='', payload: Union[str, dict]=None):
+    def error(self, message: Message='', exception: Exception=None, payload_type: str='', payload: Payload=None):
         self._write_entry(
             LogLevel.Error,
             payload_type=payload_type,
@@ -312,7 +880,7 @@ class Logger:
             exception=exception
         )
 
-    def fatal(self, message: str='', exception: Exception=None, payload_type: str='', payload: Union[str, dict]=None):
+    def fatal(self, message: Message='', exception: Exception=None, payload_type: str='', payload: Payload=None):
         self._write_entry(
             LogLevel.Fatal,
             payload_type=payload_type,
@@ -324,9 +892,35 @@ class Logger:
     @staticmethod
     def flush():
         """
-        Flush all sinks.
+        Wait until the queued records were handed to the sinks, then flush all sinks. The entries suppressed by the
+        sampler and the exceptions folded by the coalescer so far are reported first, which ends the open windows of
+        the coalescer.
         :return:
         """
+        dispatcher = Logger.dispatcher
+        if dispatcher is not None:
+            for report in Logger.due_reports(force=True):
+                dispatcher.queue.put(report)
+            dispatcher.join()
+        [h.flush() for h in Logger.sinks]
+
+    @staticmethod
+    def shutdown():
+        """
+        Dispatch the queued records, stop the dispatcher thread and flush all sinks. A structured logger created
+        afterwards starts a new dispatcher.
+        :return:
+        """
+        with Logger._dispatcher_lock:
+            dispatcher = Logger.dispatcher
+            Logger.dispatcher = None
+
+        if dispatcher is not None:
+            dispatcher.stop()
+            for name in list(logging.Logger.manager.loggerDict):
+                stdlib_logger = logging.Logger.manager.loggerDict[name]
+                if isinstance(stdlib_logger, logging.Logger) and dispatcher.handler in stdlib_logger.handlers:
+                    stdlib_logger.removeHandler(dispatcher.handler)
         [h.flush() for h in Logger.sinks]
 
 
@@ -334,9 +928,30 @@ class JsonFormatter(logging.Formatter):
     """
     The Json formatter turns all types of classes into dictionaries, and then formats it into a json.
     """
+    default_backend = 'json'
 
-    def __init__(self, fmt=None, datefmt=None, style='%'):
+    def __init__(self, fmt=None, datefmt=None, style='%', backend: str=None):
+        """
+        :param backend: the JSON backend of the encoder, 'json' or 'orjson', JsonFormatter.default_backend if None
+        """
         logging.Formatter.__init__(self, fmt, datefmt, style)
+        self.encoder = JsonEncoder(backend if backend is not None else JsonFormatter.default_backend)
+
+        # records formatted by several sinks are serialized once per distinct formatter configuration
+        self._cache_key = (type(self), fmt, datefmt, style, self.encoder.backend)
+
+        # the pre-encoded fragments have the separators of the json backend and bypass to_dict
+        self._encodes_entries = self.encoder.backend == 'json' and type(self).to_dict is JsonFormatter.to_dict
+
+    def encode(self, dto):
+        """
+        Encode the dto into json. Formatters which override to_dict keep converting the dto with it first.
+        :param dto:
+        :return:
+        """
+        if type(self).to_dict is not JsonFormatter.to_dict:
+            return json.dumps(self.to_dict(dto), default=str)
+        return self.encoder.encode(dto)
 
     def to_dict(self, obj, classkey=None):
         """
@@ -373,9 +988,98 @@ class JsonFormatter(logging.Formatter):
         else:
             return obj
 
+    @staticmethod
+    def encode_fields(fields: dict):
+        """
+        Pre-encode per-sink fields into a JSON fragment which format_with_fields splices into a serialized record.
+        :param fields:
+        :return: the fragment, the members of the JSON object without the braces
+        """
+        return json.dumps(fields, default=str)[1:-1]
+
     def format(self, record):
         """Formats a log record and serializes to json"""
+        return self.format_with_fields(record)
+
+    def format_with_fields(self, record, fields: str=None):
+        """
+        Format a log record and append the given pre-encoded fields. The record is serialized only once for all sinks
+        sharing it, the per-sink fields are spliced into the cached JSON.
+        :param record:
+        :param fields: a fragment created by encode_fields, or None
+        :return: the json
+        """
+        cache = record.__dict__.setdefault('_json_cache', {})
+        json_dto = cache.get(self._cache_key)
+        if json_dto is None:
+            json_dto = cache[self._cache_key] = self.serialize(record)
+
+        # records may carry the fields as attributes, they follow the dto like the fields of the sink
+        record_fields = {}
+        if hasattr(record, 'app_name'):
+            record_fields['app_name'] = record.app_name
+
+        if hasattr(record, 'environment'):
+            record_fields['env'] = record.environment
+
+        fragments = [JsonFormatter.encode_fields(record_fields)] if record_fields else []
+        if fields:
+            fragments.append(fields)
+
+        if not fragments:
+            return json_dto
+        return json_dto[:-1] + ', ' + ', '.join(fragments) + '}'
+
+    def encode_entry(self, log_entry: LogEntry):
+        """
+        Encode a log entry into the json of its data transfer object without building the dto. The members which only
+        depend on the level, context and payload type come pre-encoded from a cache.
+        :param log_entry:
+        :return: the json
+        """
+        encode = self.encoder.encode
 
+        payload = log_entry.payload
+        if type(payload) is str:
+            payload = {"Message": payload}
+
+        payload_type = '' if log_entry.payload_type is None else log_entry.payload_type
+        with_payload = payload_type != '' and payload is not None
+        header = LogEntryParser.header_fragment(log_entry.log_level.name,
+                                                "" if log_entry.context is None else log_entry.context,
+                                                payload_type,
+                                                with_payload)
+
+        if log_entry.timestamp_ns is not None:
+            timestamp = encode_basestring_ascii(LogEntryParser.format_timestamp(log_entry.timestamp_ns))
+        else:
+            timestamp = encode(log_entry.timestamp)
+
+        chunks = ['{"timestamp": ', timestamp, ', ', header]
+        if with_payload:
+            chunks.append(encode(payload))
+
+        if log_entry.message != "" and log_entry.message is not None:
+            chunks.append(', "message": ')
+            chunks.append(encode(log_entry.message))
+
+        if log_entry.exception is not None:
+            chunks.append(', "exception_info": ')
+            chunks.append(encode(LogEntryParser.parse_exception(log_entry.exception)))
+
+        if log_entry.suppressed:
+            chunks.append(', "suppressed_entries": ')
+            chunks.append(str(log_entry.suppressed))
+
+        chunks.append('}')
+        return ''.join(chunks)
+
+    def serialize(self, record):
+        """
+        Serialize a log record into json, without the per-sink fields.
+        :param record:
+        :return: the json
+        """
         record.msg = logging.Formatter.format(self, record)  # format the message using the base formatter
 
         if hasattr(record, 'log_entry'):
@@ -386,16 +1090,13 @@ class JsonFormatter(logging.Formatter):
                                  payload_type='ExternalLoggerMessage',
                                  message=record.msg)
 
-        dto = LogEntryParser.parse_log_entry(log_entry=log_entry)   # turn the log entry into a dto for serialization
-
-        if hasattr(record, 'app_name'):
-            dto['app_name'] = record.app_name
-
-        if hasattr(record, 'environment'):
-            dto['env'] = record.environment
-
         try:
-            json_dto = json.dumps(self.to_dict(dto), default=str)   # turn dto to json
+            if self._encodes_entries and type(log_entry.context) in NAME_TYPES \
+                    and type(log_entry.payload_type) in NAME_TYPES:
+                json_dto = self.encode_entry(log_entry)                 # turn the log entry into json directly
+            else:
+                dto = LogEntryParser.parse_log_entry(log_entry=log_entry)   # turn the log entry into a dto
+                json_dto = self.encode(dto)                             # turn dto to json
         except Exception as e:  # if it fails to serialize the dto
             json_dto = json.dumps(self.to_dict({
                 "timestamp": datetime.datetime.utcnow(),
@@ -407,3 +1108,25 @@ class JsonFormatter(logging.Formatter):
             }))
 
         return json_dto
+
+
+def _after_fork_in_child():
+    # the locks may have been held by another thread of the parent, which does not exist in the forked child
+    Logger._dispatcher_lock = Lock()
+    LogEntryParser._fingerprints_lock = Lock()
+    for reporter in (Logger.sampler, Logger.exception_coalescer):
+        if reporter is not None:
+            reporter.after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _flush_at_exit():
+    # the daemon dispatcher thread would take the queued records and the summaries of the open windows with it
+    if Logger.dispatcher is not None:
+        Logger.flush()
+
+
+atexit.register(_flush_at_exit)
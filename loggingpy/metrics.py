@@ -0,0 +1,87 @@
+from bisect import bisect_left
+from threading import Lock
+
+# the upper bounds of the histogram buckets, the last bucket takes everything above
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds
+BATCH_RECORDS_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+BATCH_BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets, which costs a binary search per observation and no memory per observation.
+    """
+
+    def __init__(self, bounds: tuple):
+        """
+        :param bounds: the ascending upper bounds of the buckets
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = None
+        self._lock = Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        """
+        :return: a dictionary of the count, sum, maximum and the counts of the buckets by their upper bound
+        """
+        with self._lock:
+            buckets = {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+            buckets['inf'] = self.counts[-1]
+            return {'count': self.count, 'sum': self.sum, 'max': self.max, 'buckets': buckets}
+
+
+class SenderMetrics:
+    """
+    The counters of an HttpSender. The sender updates them while it holds its lock anyway, except the histograms
+    which have their own.
+    """
+
+    def __init__(self):
+        self.records_appended = 0
+        self.bytes_appended = 0
+        self.batches_sent = 0
+        self.records_sent = 0
+        self.bytes_sent = 0
+        self.failed_attempts = 0
+        self.retries = 0
+        self.batches_rejected = 0
+        self.batches_given_up = 0
+        self.records_given_up = 0
+        self.records_spooled = 0
+        self.bytes_spooled = 0
+        self.upload_latency = Histogram(LATENCY_BUCKETS)
+        self.batch_records = Histogram(BATCH_RECORDS_BUCKETS)
+        self.batch_bytes = Histogram(BATCH_BYTES_BUCKETS)
+
+    def snapshot(self):
+        """
+        :return: a dictionary of the counters and histograms
+        """
+        return {
+            'records_appended': self.records_appended,
+            'bytes_appended': self.bytes_appended,
+            'batches_sent': self.batches_sent,
+            'records_sent': self.records_sent,
+            'bytes_sent': self.bytes_sent,
+            'failed_attempts': self.failed_attempts,
+            'retries': self.retries,
+            'batches_rejected': self.batches_rejected,
+            'batches_given_up': self.batches_given_up,
+            'records_given_up': self.records_given_up,
+            'records_spooled': self.records_spooled,
+            'bytes_spooled': self.bytes_spooled,
+            'upload_latency': self.upload_latency.snapshot(),
+            'batch_records': self.batch_records.snapshot(),
+            'batch_bytes': self.batch_bytes.snapshot(),
+        }
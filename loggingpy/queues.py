@@ -0,0 +1,268 @@
+from collections import deque
+from enum import Enum
+from time import monotonic
+import logging
+import queue
+
+
+class OverflowPolicy(Enum):
+    """
+    What happens to a record which arrives while its queue is full.
+    """
+    Block = 'block'
+    """Block the logging call until there is room again, drop the record if that takes longer than the timeout."""
+
+    DropNewest = 'drop_newest'
+    """Drop the arriving record."""
+
+    DropOldest = 'drop_oldest'
+    """Drop the oldest queued records until the arriving one fits."""
+
+    DropBelowLevel = 'drop_below_level'
+    """
+    Drop arriving records below the minimum level. Records at or above it replace the oldest queued record below the
+    minimum level, or the oldest record at all if there is none.
+    """
+
+
+class QueueLimits:
+    """
+    Bounds for a queue of log records. A limit of None means unbounded.
+    """
+
+    def __init__(
+        self,
+        max_records: int=None,
+        max_bytes: int=None,
+        policy: OverflowPolicy=OverflowPolicy.DropOldest,
+        block_timeout: float=1.0,
+        min_level: int=logging.WARNING,
+        drop_report_interval: float=60
+    ):
+        """
+        :param max_records: maximum number of queued records
+        :param max_bytes: maximum number of queued bytes, only enforced on queues of serialized records
+        :param policy: the overflow policy
+        :param block_timeout: seconds a logging call blocks at most with the Block policy
+        :param min_level: records at or above this level are kept by the DropBelowLevel policy
+        :param drop_report_interval: minimum seconds between two synthetic log entries reporting dropped records
+        """
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.min_level = min_level
+        self.drop_report_interval = drop_report_interval
+
+
+class DropCounter:
+    """
+    Counts dropped records and tells when they are due to be reported.
+    """
+
+    def __init__(self, report_interval: float):
+        self.report_interval = report_interval
+        self.count = 0
+        self.total = 0
+        self._last_report_time = monotonic()
+
+    def add(self, count: int=1):
+        self.count += count
+        self.total += count
+
+    def take_due(self):
+        """
+        Return the number of records dropped since the last report if a report is due, and reset it.
+        :return: the number of dropped records, 0 if there is nothing to report yet
+        """
+        if self.count == 0 or monotonic() - self._last_report_time < self.report_interval:
+            return 0
+
+        count = self.count
+        self.count = 0
+        self._last_report_time = monotonic()
+        return count
+
+
+def batch_length(item):
+    """
+    Return the number of records of a queue item, which is a single record or a list of records queued together.
+    :param item:
+    :return:
+    """
+    return len(item) if isinstance(item, list) else 1
+
+
+class RecordBuffer:
+    """
+    A FIFO of records which enforces QueueLimits. It is not thread safe, the owner has to hold its lock.
+    """
+
+    def __init__(self, limits: QueueLimits=None, sizeof=None, countof=None):
+        """
+        :param limits: the limits, None for an unbounded buffer
+        :param sizeof: returns the size of a record in bytes, the byte limit is only enforced if given
+        :param countof: returns the number of records of an item which holds several, every item is one record if None
+        """
+        self.limits = limits if limits is not None else QueueLimits()
+        self.sizeof = sizeof
+        self.countof = countof
+        self.records = deque()
+        self.levels = deque()  # the log level of each record, for the DropBelowLevel policy
+        self.size = 0
+        self.count = 0  # the number of records in all items, the record limit applies to it
+        self.dropped = DropCounter(self.limits.drop_report_interval)
+
+    def __len__(self):
+        return len(self.records)
+
+    def has_room(self, size: int=0, count: int=1):
+        limits = self.limits
+        if limits.max_records is not None and self.count + count > limits.max_records:
+            return False
+        if limits.max_bytes is not None and self.sizeof is not None and self.records:
+            return self.size + size <= limits.max_bytes
+        return True
+
+    def append(self, record, level: int=logging.NOTSET):
+        self.records.append(record)
+        self.levels.append(level)
+        self.count += 1 if self.countof is None else self.countof(record)
+        if self.sizeof is not None:
+            self.size += self.sizeof(record)
+
+    def popleft(self):
+        record = self.records.popleft()
+        self.levels.popleft()
+        self.count -= 1 if self.countof is None else self.countof(record)
+        if self.sizeof is not None:
+            self.size -= self.sizeof(record)
+        return record
+
+    def take_all(self):
+        """
+        Remove and return all records at once.
+        :return: a deque of the records
+        """
+        records = self.records
+        self.records = deque()
+        self.levels = deque()
+        self.size = 0
+        self.count = 0
+        return records
+
+    def make_room(self, level: int, size: int=0, count: int=1):
+        """
+        Apply the non-blocking part of the overflow policy for an arriving record. Dropped records are counted.
+        :param level: the log level of the record
+        :param size: the size of the record in bytes
+        :param count: the number of records of the arriving item
+        :return: the number of queued items which were dropped, or -1 if the arriving item has to be dropped
+        """
+        policy = self.limits.policy
+        evicted = 0
+        evicted_records = 0
+
+        if policy == OverflowPolicy.DropOldest:
+            while self.records and not self.has_room(size, count):
+                evicted_records += self._count(self.popleft())
+                evicted += 1
+
+        elif policy == OverflowPolicy.DropBelowLevel:
+            if level < self.limits.min_level:
+                self.dropped.add(count)
+                return -1
+
+            while self.records and not self.has_room(size, count):
+                removed = self._remove_first_below_level()
+                evicted_records += removed if removed else self._count(self.popleft())
+                evicted += 1
+
+        if not self.has_room(size, count):
+            self.dropped.add(evicted_records + count)
+            return -1
+
+        self.dropped.add(evicted_records)
+        return evicted
+
+    def _count(self, record):
+        return 1 if self.countof is None else self.countof(record)
+
+    def _remove_first_below_level(self):
+        # returns the number of removed records, 0 if there is no item below the minimum level
+        min_level = self.limits.min_level
+        for index, level in enumerate(self.levels):
+            if level < min_level:
+                record = self.records[index]
+                del self.records[index]
+                del self.levels[index]
+                count = self._count(record)
+                self.count -= count
+                if self.sizeof is not None:
+                    self.size -= self.sizeof(record)
+                return count
+        return 0
+
+
+class BoundedQueue(queue.Queue):
+    """
+    A queue of log records which applies QueueLimits on put, as a drop-in for the queues of the stdlib QueueHandler
+    and QueueListener. The None sentinel of the QueueListener is always accepted. A list of records queued together
+    counts with all its records against the record limit, and is dropped as a whole.
+    """
+
+    def __init__(self, limits: QueueLimits, sizeof=None, drop_reporter=None):
+        """
+        :param limits:
+        :param sizeof: returns the size of a record in bytes, the byte limit is only enforced if given
+        :param drop_reporter: called with the number of dropped records, returns a record reporting them which is
+        handed out by the next get
+        """
+        self.limits = limits
+        self.sizeof = sizeof
+        self.drop_reporter = drop_reporter
+        queue.Queue.__init__(self)
+
+    def _init(self, maxsize):
+        self.queue = RecordBuffer(self.limits, self.sizeof, countof=batch_length)
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        self.queue.append(item, logging.NOTSET if item is None else item.levelno)
+
+    def _get(self):
+        if self.drop_reporter is not None:
+            dropped = self.queue.dropped.take_due()
+            if dropped:
+                self.unfinished_tasks += 1  # the report is marked as done like any other record
+                return self.drop_reporter(dropped)
+        return self.queue.popleft()
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Put a record into the queue, applying the overflow policy rather than the block and timeout arguments.
+        """
+        size = self.sizeof(item) if self.sizeof is not None and item is not None else 0
+        count = batch_length(item)
+
+        with self.not_full:
+            if item is not None and not self.queue.has_room(size, count):
+                if self.limits.policy == OverflowPolicy.Block:
+                    end_time = monotonic() + self.limits.block_timeout
+                    while not self.queue.has_room(size, count):
+                        remaining = end_time - monotonic()
+                        if remaining <= 0:
+                            self.queue.dropped.add(count)
+                            return
+                        self.not_full.wait(remaining)
+                else:
+                    evicted = self.queue.make_room(item.levelno, size, count)
+                    if evicted < 0:
+                        return
+                    self.unfinished_tasks -= evicted  # evicted records will never be marked as done
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
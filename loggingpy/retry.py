@@ -0,0 +1,121 @@
+from enum import Enum
+from time import monotonic
+import heapq
+import itertools
+import random
+
+DEFAULT_MAX_TRIES = 4
+DEFAULT_RETRY_BASE_DELAY = 2  # seconds
+DEFAULT_RETRY_MAX_DELAY = 60  # seconds
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30  # seconds
+
+
+def backoff_delay(attempt: int, base_delay: float=DEFAULT_RETRY_BASE_DELAY, max_delay: float=DEFAULT_RETRY_MAX_DELAY):
+    """
+    Exponential backoff with full jitter: a random delay up to base_delay * 2^attempt, capped at max_delay. The jitter
+    spreads the retries of many batches (and processes) instead of hitting a recovering endpoint all at once.
+    :param attempt: the number of failed attempts so far, starting at 1
+    :param base_delay:
+    :param max_delay:
+    :return: the delay in seconds
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class RetryScheduler:
+    """
+    Parks items until their retry is due. It is not thread safe, the owner has to hold its lock.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()  # keeps the order of items which are due at the same time
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, item, delay: float):
+        heapq.heappush(self._heap, (monotonic() + delay, next(self._sequence), item))
+
+    def next_due_time(self):
+        """
+        :return: the monotonic time the next item is due, or None
+        """
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, everything: bool=False):
+        """
+        Remove and return the items which are due.
+        :param everything: return all items, whether they are due or not
+        :return: a list of items
+        """
+        now = monotonic()
+        items = []
+        while self._heap and (everything or self._heap[0][0] <= now):
+            items.append(heapq.heappop(self._heap)[2])
+        return items
+
+
+class CircuitState(Enum):
+    Closed = 'closed'
+    Open = 'open'
+    HalfOpen = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Stops the attempts against an endpoint which keeps failing. After failure_threshold consecutive failures the
+    circuit opens, and no request is allowed for reset_timeout seconds. Then a single probe is let through: its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int=DEFAULT_FAILURE_THRESHOLD, reset_timeout: float=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.Closed
+        self.failures = 0
+        self._opened_at = None
+        self._probe_sent_at = None
+
+    def allow_request(self):
+        """
+        Whether a request may be sent now. Returning True in the open state turns the request into the probe.
+        :return:
+        """
+        if self.state == CircuitState.Closed:
+            return True
+
+        now = monotonic()
+        if self.state == CircuitState.Open and now - self._opened_at >= self.reset_timeout:
+            self.state = CircuitState.HalfOpen
+            self._probe_sent_at = now
+            return True
+
+        # a probe whose outcome got lost must not keep the circuit half open forever
+        if self.state == CircuitState.HalfOpen and now - self._probe_sent_at >= self.reset_timeout:
+            self._probe_sent_at = now
+            return True
+
+        return False
+
+    def next_probe_time(self):
+        """
+        :return: the monotonic time from which allow_request lets a probe through, or None if the circuit is closed
+        """
+        if self.state == CircuitState.Open:
+            return self._opened_at + self.reset_timeout
+        if self.state == CircuitState.HalfOpen:
+            return self._probe_sent_at + self.reset_timeout
+        return None
+
+    def record_success(self):
+        self.state = CircuitState.Closed
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == CircuitState.HalfOpen or self.failures >= self.failure_threshold:
+            self.state = CircuitState.Open
+            self._opened_at = monotonic()
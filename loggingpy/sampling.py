@@ -0,0 +1,194 @@
+from collections import OrderedDict
+from enum import Enum
+from threading import Lock
+from time import monotonic
+import random
+
+# the distinct values of a key which keep their own bucket and suppressed count, like the exception hashes of a storm
+DEFAULT_MAX_KEYS = 1024
+DEFAULT_SUMMARY_INTERVAL = 60  # seconds
+
+
+class SamplingKey(Enum):
+    """
+    The attribute of a log entry whose values are rate limited and sampled separately.
+    """
+    Context = 'context'
+    PayloadType = 'payload_type'
+    Level = 'level'
+    ExceptionHash = 'exception_hash'
+
+
+class SuppressionReport(Enum):
+    """
+    How the number of suppressed entries is reported.
+    """
+    NextEntry = 'next_entry'
+    """Add the number of entries suppressed since to the next entry of the same key which is logged."""
+
+    Summary = 'summary'
+    """Log a summary entry with the suppressed entries by key at most once per summary interval."""
+
+
+class TokenBucket:
+    """
+    Lets through rate entries per second on average, and bursts of up to burst entries. It is not thread safe, the
+    owner has to hold its lock.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._refilled_at = monotonic()
+
+    def take(self):
+        """
+        Take a token if there is one.
+        :return: whether a token was taken
+        """
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SamplingRule:
+    """
+    Rate limits and samples the entries which share a value of the key, e.g. every payload type on its own. Entries
+    without a value for the key, like entries without an exception for the exception hash, are not affected.
+    """
+
+    def __init__(self, key: SamplingKey, rate: float=None, burst: float=None, probability: float=1.0):
+        """
+        :param key: the attribute of the entries the rule is applied to separately
+        :param rate: the entries per second let through per key value, None for no rate limit
+        :param burst: the entries let through at once before the rate applies, the rate (at least 1) if None
+        :param probability: the share of the entries which are kept, after the rate limit
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError("The rate of a sampling rule must be positive")
+        if not 0 <= probability <= 1:
+            raise ValueError("The probability of a sampling rule must be between 0 and 1")
+
+        self.key = key
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate or 1)
+        self.probability = probability
+
+
+class Sampler:
+    """
+    Decides for every log entry whether it is logged, before it is serialized or even queued. An entry is logged if
+    every rule lets it through. The entries a rule suppresses are counted by the rule and key value, and reported
+    according to the report mode.
+    """
+
+    def __init__(
+        self,
+        rules: list,
+        report: SuppressionReport=SuppressionReport.NextEntry,
+        summary_interval: float=DEFAULT_SUMMARY_INTERVAL,
+        max_keys: int=DEFAULT_MAX_KEYS
+    ):
+        """
+        :param rules: the sampling rules
+        :param report: how the suppressed entries are reported
+        :param summary_interval: minimum seconds between two summary entries
+        :param max_keys: the number of key values per rule which are tracked, the least recently seen ones are
+        forgotten first along with their suppressed count
+        """
+        self.rules = rules
+        self.report = report
+        self.summary_interval = summary_interval
+        self.max_keys = max_keys
+
+        self._lock = Lock()
+        self._buckets = [OrderedDict() for _ in rules]
+        self._suppressed = [{} for _ in rules]
+        self._last_summary_time = monotonic()
+        self.suppressed_total = 0
+
+    def after_fork(self):
+        """
+        Reinitialize the sampler in a forked child process. The entries suppressed so far are reported by the parent.
+        :return:
+        """
+        self._lock = Lock()
+        self._suppressed = [{} for _ in self.rules]
+        self._last_summary_time = monotonic()
+        self.suppressed_total = 0
+
+    def needs(self, key: SamplingKey):
+        """
+        Whether a rule is keyed by the given attribute, for the attributes which are expensive to compute.
+        :param key:
+        :return:
+        """
+        return any(rule.key == key for rule in self.rules)
+
+    def sample(self, values: dict):
+        """
+        Decide whether an entry is logged.
+        :param values: the values of the entry by sampling key, keys without a value may be missing
+        :return: None if the entry is suppressed, otherwise the number of suppressed entries to report with it
+        """
+        with self._lock:
+            for index, rule in enumerate(self.rules):
+                value = values.get(rule.key)
+                if value is None:
+                    continue
+                if not self._lets_through(index, rule, value):
+                    self.suppressed_total += 1
+                    suppressed = self._suppressed[index]
+                    if value in suppressed or len(suppressed) < self.max_keys:
+                        suppressed[value] = suppressed.get(value, 0) + 1
+                    return None
+
+            if self.report != SuppressionReport.NextEntry:
+                return 0
+            count = 0
+            for index, rule in enumerate(self.rules):
+                value = values.get(rule.key)
+                if value is not None:
+                    count += self._suppressed[index].pop(value, 0)
+            return count
+
+    def _lets_through(self, index: int, rule: SamplingRule, value):
+        if rule.rate is not None:
+            buckets = self._buckets[index]
+            bucket = buckets.get(value)
+            if bucket is None:
+                bucket = buckets[value] = TokenBucket(rule.rate, rule.burst)
+                if len(buckets) > self.max_keys:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(value)
+            if not bucket.take():
+                return False
+        return rule.probability >= 1 or random.random() < rule.probability
+
+    def take_summary(self, force: bool=False):
+        """
+        Return the entries suppressed since the last summary if a summary is due, and reset them.
+        :param force: return the suppressed entries whether a summary is due or not
+        :return: a list of dictionaries with the key, value and count, empty if there is nothing to report yet
+        """
+        if self.report != SuppressionReport.Summary:
+            return []
+        # checked without the lock first, it is asked on every logging call
+        if not force and monotonic() - self._last_summary_time < self.summary_interval:
+            return []
+        with self._lock:
+            if not force and monotonic() - self._last_summary_time < self.summary_interval:
+                return []
+            summary = [{'key': rule.key.value, 'value': value, 'count': count}
+                       for rule, suppressed in zip(self.rules, self._suppressed)
+                       for value, count in suppressed.items()]
+            if summary:
+                self._suppressed = [{} for _ in self.rules]
+                self._last_summary_time = monotonic()
+            return summary
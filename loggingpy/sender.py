@@ -1,81 +1,565 @@
 # This class is responsible for handling all asynchronous http
 # communication
+import os
 import sys
+import queue
+import weakref
+import zlib
 
-from time import sleep
+from collections import deque
+from time import monotonic, perf_counter
 from datetime import datetime
-from threading import Thread, enumerate
+from threading import Thread, Lock, Condition, main_thread
 import logging
 
 import requests
+from requests.adapters import HTTPAdapter
 
-if sys.version[0] == '2':
-    import Queue as queue
-else:
-    import queue as queue
+from loggingpy.metrics import SenderMetrics
+from loggingpy.queues import QueueLimits, RecordBuffer, OverflowPolicy
+from loggingpy.spool import DiskSpool
+from loggingpy.retry import CircuitBreaker, RetryScheduler, backoff_delay, DEFAULT_MAX_TRIES, \
+    DEFAULT_RETRY_BASE_DELAY, DEFAULT_RETRY_MAX_DELAY
 
 
 MAX_BULK_SIZE_IN_BYTES = 1 * 1024 * 1024  # 1 MB
+DEFAULT_FLUSH_MAX_RECORDS = 1000
+MAIN_THREAD_POLL_INTERVAL = 1  # seconds
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CONNECT_TIMEOUT = 10  # seconds
+DEFAULT_READ_TIMEOUT = 30  # seconds
+
+COMPRESSION_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# worst case deflate expansion is 5 bytes per stored block of 16383 bytes, plus the gzip / zlib header, trailer and
+# the final block marker (which are all well below this)
+DEFLATE_BLOCK_SIZE = 16383
+DEFLATE_BLOCK_OVERHEAD = 5
+DEFLATE_STREAM_OVERHEAD = 32
+
+BATCH_SENT = 'sent'
+BATCH_REJECTED = 'rejected'
+BATCH_FAILED = 'failed'
 
 
 def get_logger(debug):
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG if debug else logging.INFO)
-    logger.addHandler(logging.StreamHandler(sys.stdout))
+    # all senders share the logger, it needs a single handler
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler(sys.stdout))
     return logger
 
 
 def backup_logs(logs, logger):
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     logger.info('Backing up your logs to http-upload-failures-%s.txt', timestamp)
-    with open('http-upload-failures-{}.txt'.format(timestamp), 'a') as f:
-        f.writelines('\n'.join(logs))
+    with open('http-upload-failures-{}.txt'.format(timestamp), 'ab') as f:
+        f.write(b'\n'.join(logs))
+
+
+# the senders of this process, which are reinitialized in a forked child
+_senders = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for sender in list(_senders):
+        sender.after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class HttpTransport:
+    """
+    A transport ships request bodies to an endpoint. Senders and sinks only talk to this interface, which allows to
+    swap the connection handling (or to stub it out) without touching the batching logic.
+    """
+
+    def post(self, url, data, headers=None):
+        """
+        Post the given body to the url.
+        :param url:
+        :param data:
+        :param headers:
+        :return: the response, exposing at least status_code, text and content
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Release all connections held by the transport.
+        :return:
+        """
+        pass
+
+    def after_fork(self):
+        """
+        Forget the connections inherited from the parent process, in a forked child. They still belong to the parent.
+        :return:
+        """
+        pass
+
+
+class SingleShotHttpTransport(HttpTransport):
+    """
+    Opens a fresh connection for every request, like the module level requests.post does.
+    """
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+        self.timeout = (connect_timeout, read_timeout)
+
+    def post(self, url, data, headers=None):
+        return requests.post(url, data=data, headers=headers, timeout=self.timeout)
+
+
+class PooledHttpTransport(HttpTransport):
+    """
+    Keeps persistent keep-alive connections in a pool per endpoint, so consecutive requests skip the TCP and TLS
+    handshakes.
+    """
+
+    def __init__(self,
+                 pool_size=DEFAULT_POOL_SIZE,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT):
+        """
+        :param pool_size: maximum number of connections kept alive per endpoint
+        :param connect_timeout: seconds to wait for a connection to be established
+        :param read_timeout: seconds to wait for the endpoint to answer
+        """
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = self._make_session()
+
+    def _make_session(self):
+        session = requests.Session()
+
+        # retries are handled by the sender, the adapter must not silently repeat requests
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def post(self, url, data, headers=None):
+        return self.session.post(url, data=data, headers=headers, timeout=self.timeout)
+
+    def close(self):
+        self.session.close()
+
+    def after_fork(self):
+        self.session = self._make_session()
+
+
+class PlainBatch:
+    """
+    A bulk of UTF-8 encoded log messages which is posted as newline separated plain text. The size is the exact
+    number of bytes on the wire.
+    """
+    content_encoding = None
+
+    def __init__(self, max_size=MAX_BULK_SIZE_IN_BYTES, max_records=None):
+        self.max_size = max_size
+        self.max_records = max_records
+        self.records = []
+        self.size = 0
+        self.closed = False
+        self.tries = 0
+        self._body = None
+
+    def add(self, record: bytes):
+        """
+        Add a record to the batch. The first record is always accepted, even if it exceeds the maximum size on its own.
+        :param record:
+        :return: whether the record was accepted, a rejected record has to go into the next batch
+        """
+        size = len(record) + 1 if self.records else len(record)  # records are separated by a newline
+        if self.records and self.size + size > self.max_size:
+            self.closed = True
+            return False
+
+        self.records.append(record)
+        self.size += size
+        return True
+
+    def is_full(self):
+        return self.closed or self.size >= self.max_size or self._has_max_records()
+
+    def _has_max_records(self):
+        return self.max_records is not None and len(self.records) >= self.max_records
+
+    def body(self):
+        # join computes the total length first and copies every record once into a single buffer
+        if self._body is None:
+            self._body = b'\n'.join(self.records)
+        return self._body
+
+
+class CompressedBatch(PlainBatch):
+    """
+    A bulk of log messages which is compressed while the records are added, so the bulk size limit applies to the
+    compressed body which is actually sent.
+    """
+
+    def __init__(self, encoding, level=DEFAULT_COMPRESSION_LEVEL, max_size=MAX_BULK_SIZE_IN_BYTES, max_records=None):
+        PlainBatch.__init__(self, max_size, max_records)
+        self.content_encoding = encoding
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, COMPRESSION_WBITS[encoding])
+        self.chunks = []
+        self.compressed_size = 0  # bytes the compressor emitted so far
+        self.pending_size = 0  # uncompressed bytes compressed since the last sync, the compressor may hold them back
+
+    def _size_upper_bound(self, additional_size):
+        pending = self.pending_size + additional_size
+        blocks = pending // DEFLATE_BLOCK_SIZE + 1
+        return self.compressed_size + pending + blocks * DEFLATE_BLOCK_OVERHEAD + DEFLATE_STREAM_OVERHEAD
+
+    def _write(self, chunk):
+        if chunk:
+            self.chunks.append(chunk)
+            self.compressed_size += len(chunk)
+
+    def _sync(self):
+        # forces the compressor to emit everything it holds, which makes the compressed size exact
+        self._write(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.pending_size = 0
+
+    def add(self, record: bytes):
+        size = len(record)
+        if self.records:
+            size += 1
+
+            if self._size_upper_bound(size) > self.max_size:
+                self._sync()
+                if self._size_upper_bound(size) > self.max_size:
+                    self.closed = True
+                    return False
+
+            chunk = self.compressor.compress(b'\n')
+        else:
+            chunk = b''
+
+        self.records.append(record)
+        self.size += size
+
+        # whatever the compressor emits, it may still hold back any of the input since the last sync, like the first
+        # record after the gzip header, so only a sync makes the pending bytes exact again
+        self._write(chunk + self.compressor.compress(record))
+        self.pending_size += size
+        return True
+
+    def is_full(self):
+        return self.closed or self._has_max_records()
+
+    def body(self):
+        if self._body is None:
+            self._write(self.compressor.flush(zlib.Z_FINISH))
+            self._body = b''.join(self.chunks)
+        return self._body
 
 
 class HttpSender:
     def __init__(self,
                  url,
                  logs_drain_timeout=5,
-                 debug=False):
+                 debug=False,
+                 transport: HttpTransport=None,
+                 compression: str=None,
+                 compression_level: int=DEFAULT_COMPRESSION_LEVEL,
+                 flush_max_records: int=DEFAULT_FLUSH_MAX_RECORDS,
+                 flush_max_bytes: int=MAX_BULK_SIZE_IN_BYTES,
+                 concurrency: int=1,
+                 limits: QueueLimits=None,
+                 drop_reporter=None,
+                 spool: DiskSpool=None,
+                 max_tries: int=DEFAULT_MAX_TRIES,
+                 retry_base_delay: float=DEFAULT_RETRY_BASE_DELAY,
+                 retry_max_delay: float=DEFAULT_RETRY_MAX_DELAY,
+                 circuit_breaker: CircuitBreaker=None):
+        """
+        A batch is sent as soon as it holds flush_max_records records or flush_max_bytes bytes, or when its oldest
+        record waited for logs_drain_timeout seconds.
+
+        With a concurrency of 1 the batches are posted one after the other by the sending thread, so the endpoint
+        receives all records in the order they were appended. With a higher concurrency the sending thread hands the
+        batches to that many upload threads: records within a batch keep their order, but batches can arrive in any
+        order, since a later batch may overtake an earlier one which is slower or being retried.
+        :param url: the endpoint the bulks are posted to
+        :param logs_drain_timeout: maximum seconds a record waits before it is sent
+        :param debug: log debug messages of the sender to stdout
+        :param transport: the transport used to post the bulks, defaults to a pooled keep-alive transport
+        :param compression: None (default), 'gzip' or 'deflate' to compress the bulks
+        :param compression_level: zlib compression level from 1 (fastest) to 9 (smallest)
+        :param flush_max_records: number of records which trigger sending a batch, and the most a batch holds
+        :param flush_max_bytes: number of bytes which trigger sending a batch
+        :param concurrency: number of batches which may be uploaded at the same time
+        :param limits: bounds of the records waiting to be sent, unbounded by default
+        :param drop_reporter: called with the number of dropped records once the limits' report interval passed,
+        returns a record (str or bytes) reporting them which is sent in spite of the limits, or None
+        :param spool: keeps batches which could not be sent and records which exceed the limits on disk, and replays
+        them once the url accepts logs again. Without a spool such batches are dumped into text files in the working
+        directory and never resent.
+        :param max_tries: number of attempts to send a batch before it is given up
+        :param retry_base_delay: the backoff of the first retry is up to this many seconds, doubling with every try
+        :param retry_max_delay: maximum backoff in seconds
+        :param circuit_breaker: stops the attempts while the url keeps failing, batches are given up in the meantime
+        """
+        if compression is not None and compression not in COMPRESSION_WBITS:
+            raise ValueError("Unsupported compression '{}', use one of {}".format(
+                compression, ', '.join(sorted(COMPRESSION_WBITS))))
+
         self.url = url
         self.logs_drain_timeout = logs_drain_timeout
         self.logger = get_logger(debug)
+        self.transport = transport if transport is not None else PooledHttpTransport(
+            pool_size=max(DEFAULT_POOL_SIZE, concurrency))
+        self.compression = compression
+        self.compression_level = compression_level
+        self.flush_max_records = flush_max_records
+        self.flush_max_bytes = flush_max_bytes
+        self.concurrency = concurrency
+        self.limits = limits if limits is not None else QueueLimits()
+        self.drop_reporter = drop_reporter
+        self.spool = spool
+        self._replay_thread = None
+        self.max_tries = max_tries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+
+        self._closed = False
+        self._stopping = False
+        self._initialize_state()
+        _senders.add(self)
 
         # Function to see if the main thread is alive
-        self.is_main_thread_active = lambda: any(
-            (i.name == 'MainThread') and i.is_alive() for i in enumerate())
+        self.is_main_thread_active = lambda: main_thread().is_alive()
 
-        # Create a queue to hold logs
-        self.queue = queue.Queue()
         self._initialize_sending_thread()
 
+        # batches spooled by a previous process
+        self._replay_spool_if_needed()
+
+    def _initialize_state(self):
+        # the buffer holds the records until a batch is due, the sending thread waits on the condition for that
+        # while blocked logging calls wait on the space condition for the buffer to be taken
+        self._buffer = RecordBuffer(self.limits, sizeof=len)
+        self._oldest_record_time = None
+        self._lock = Lock()
+        self._condition = Condition(self._lock)
+        self._space = Condition(self._lock)
+        self._flush_lock = Lock()
+
+        # failed batches wait here for their retry, guarded by the lock as well
+        self._retries = RetryScheduler()
+
+        # with concurrent uploads, complete batches wait here for the next free upload thread
+        self._batches = queue.Queue(maxsize=self.concurrency)
+        self._upload_threads = []
+
+        # updated with the lock held
+        self.metrics = SenderMetrics()
+
+    def after_fork(self):
+        """
+        Reinitialize the sender in a forked child process. The threads of the sender do not exist in the child and its
+        locks may have been held by them. The records and batches pending in the parent are sent by the parent, the
+        child starts with an empty buffer and without connections, and starts its threads with its first record.
+        The spool stays with the parent, which writes and replays its segments, the child sends without a spool.
+        :return:
+        """
+        self._initialize_state()
+        self._replay_thread = None
+        self.transport.after_fork()
+        if self.spool is not None:
+            self.spool.after_fork()
+            self.spool = None
+
     def _initialize_sending_thread(self):
         self.sending_thread = Thread(target=self._drain_queue)
         self.sending_thread.daemon = False
         self.sending_thread.name = 'http-sending-thread'
         self.sending_thread.start()
 
-    def append(self, logs_message):
-        if not self.sending_thread.is_alive():
+        if self.concurrency > 1:
+            self._upload_threads = [t for t in self._upload_threads if t.is_alive()]
+            for _ in range(self.concurrency - len(self._upload_threads)):
+                upload_thread = Thread(target=self._upload_batches)
+                upload_thread.daemon = False
+                upload_thread.name = 'http-upload-thread'
+                upload_thread.start()
+                self._upload_threads.append(upload_thread)
+
+    def append(self, logs_message, level: int=logging.NOTSET):
+        """
+        Queue a record for sending, subject to the limits of the sender.
+        :param logs_message: the serialized record
+        :param level: the log level of the record, for the DropBelowLevel overflow policy
+        :return:
+        """
+        if not self.sending_thread.is_alive() and not self._closed:
+            self._initialize_sending_thread()
+
+        # records are encoded once, all size accounting and the request body work on these bytes
+        if isinstance(logs_message, str):
+            logs_message = logs_message.encode('utf-8')
+
+        with self._condition:
+            self._add(logs_message, level)
+
+            # only wake up the sending thread once a batch is complete, the age limit is handled by its wait timeout
+            if self._is_batch_complete():
+                self._condition.notify()
+
+    def extend(self, records):
+        """
+        Queue several records for sending at once, subject to the limits of the sender. The lock of the sender is
+        taken once for all of them.
+        :param records: (serialized record, log level) pairs
+        :return:
+        """
+        if not self.sending_thread.is_alive() and not self._closed:
             self._initialize_sending_thread()
 
-        # Queue lib is thread safe, no issue here
-        self.queue.put(logs_message)
+        records = [(logs_message.encode('utf-8') if isinstance(logs_message, str) else logs_message, level)
+                   for logs_message, level in records]
+
+        with self._condition:
+            for logs_message, level in records:
+                self._add(logs_message, level)
+
+            if self._is_batch_complete():
+                self._condition.notify()
+
+    def _add(self, logs_message: bytes, level: int):
+        # called with the lock held
+        self.metrics.records_appended += 1
+        self.metrics.bytes_appended += len(logs_message)
+        if not self._buffer.has_room(len(logs_message)):
+            if self.spool is not None:
+                # the spool takes the overflow instead of the overflow policy
+                self.spool.append([logs_message])
+                self.metrics.records_spooled += 1
+                self.metrics.bytes_spooled += len(logs_message)
+                return
+            if not self._make_room(level, len(logs_message)):
+                return
+
+        if not self._buffer:
+            self._oldest_record_time = monotonic()
+        self._buffer.append(logs_message, level)
+
+    def _make_room(self, level, size):
+        # called with the lock held, returns whether the record can be appended
+        if self.limits.policy != OverflowPolicy.Block:
+            return self._buffer.make_room(level, size) >= 0
+
+        # make sure the sending thread takes the buffer, then wait for it
+        self._condition.notify()
+        end_time = monotonic() + self.limits.block_timeout
+        while not self._buffer.has_room(size):
+            remaining = end_time - monotonic()
+            if remaining <= 0 or self._closed:
+                self._buffer.dropped.add()
+                return False
+            self._space.wait(remaining)
+        return True
+
+    def stats(self):
+        """
+        A snapshot of the metrics of the sender: the counters of the records and batches, the histograms of the batch
+        sizes and upload latencies, and the current state of the buffer, the retries and the spool.
+        :return: a dictionary
+        """
+        with self._lock:
+            stats = self.metrics.snapshot()
+            stats['queue_depth'] = len(self._buffer)
+            stats['queue_bytes'] = self._buffer.size
+            stats['records_dropped'] = self._buffer.dropped.total
+            stats['pending_retries'] = len(self._retries)
+            stats['circuit'] = self.circuit_breaker.state.value
+        if self.spool is not None:
+            stats['spool_bytes'] = self.spool.size
+            stats['spool_dropped_bytes'] = self.spool.dropped_bytes
+        return stats
+
+    def pending(self):
+        """
+        Number of records which wait for the next batch.
+        :return:
+        """
+        return len(self._buffer)
 
     def flush(self):
         self._flush_queue()
 
+        # wait for the uploads of all handed over batches
+        if self.concurrency > 1:
+            self._batches.join()
+
+    def close(self):
+        """
+        Send all pending records and stop the sending thread.
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            self._space.notify_all()
+        self.sending_thread.join()
+        if self._replay_thread is not None:
+            self._replay_thread.join()
+        self.transport.close()
+
+    def _is_batch_complete(self):
+        if not self._buffer.has_room():
+            return True
+        return len(self._buffer) >= self.flush_max_records or self._buffer.size >= self.flush_max_bytes
+
+    def _wait_for_batch(self):
+        """
+        Block until a batch is complete, the oldest record reached the maximum age or the sender shuts down.
+        :return: False if the sender shuts down
+        """
+        with self._condition:
+            while not self._closed:
+                if self._buffer:
+                    if self._is_batch_complete():
+                        return True
+                    timeout = self._oldest_record_time + self.logs_drain_timeout - monotonic()
+                    if timeout <= 0:
+                        return True
+                else:
+                    timeout = self.logs_drain_timeout
+
+                for due_time in (self._retries.next_due_time(), self._next_spool_probe_time()):
+                    if due_time is not None:
+                        if due_time <= monotonic():
+                            return True
+                        timeout = min(timeout, due_time - monotonic())
+
+                # wake up regularly to notice the exit of the main thread
+                self._condition.wait(min(timeout, MAIN_THREAD_POLL_INTERVAL))
+
+                if not self.is_main_thread_active():
+                    self.logger.debug(
+                        'Identified quit of main thread, sending logs one '
+                        'last time')
+                    return False
+            return False
+
     def _drain_queue(self):
         last_try = False
 
         while not last_try:
-            # If main is exited, we should run one last time and try to remove
-            # all logs
-            if not self.is_main_thread_active():
-                self.logger.debug(
-                    'Identified quit of main thread, sending logs one '
-                    'last time')
-                last_try = True
+            last_try = not self._wait_for_batch()
+            self._stopping = last_try
 
             try:
                 self._flush_queue()
@@ -84,83 +568,269 @@ class HttpSender:
                     'Unexpected exception while draining queue to url, ' + str(self.url) +
                     'swallowing. Exception: %s', e)
 
-            if not last_try:
-                sleep(self.logs_drain_timeout)
+            if self.spool is not None:
+                self.spool.sync_if_due()
+                self._probe_with_spool()
+
+        self._stop_upload_threads()
+        if self.spool is not None:
+            self.spool.close()
+
+    def _upload_batches(self):
+        while True:
+            batch = self._batches.get()
+            try:
+                if batch is None:
+                    return
+                self._send_batch(batch)
+            except Exception as e:
+                self.logger.debug(
+                    'Unexpected exception while uploading batch to url, ' + str(self.url) +
+                    'swallowing. Exception: %s', e)
+            finally:
+                self._batches.task_done()
+
+    def _stop_upload_threads(self):
+        # the upload threads finish the batches handed over before they get to their stop marker
+        for _ in self._upload_threads:
+            self._batches.put(None)
+        for upload_thread in self._upload_threads:
+            upload_thread.join()
+
+    def _take_buffer(self):
+        with self._condition:
+            records = self._buffer.take_all()
+            self._oldest_record_time = None
+            self._space.notify_all()
+        return records
+
+    def _report_drops(self):
+        with self._condition:
+            dropped = self._buffer.dropped.take_due()
+        if not dropped:
+            return
+
+        self.logger.info('Dropped %s log records for url ' + str(self.url) + ' because the queue was full', dropped)
+        report = self.drop_reporter(dropped) if self.drop_reporter is not None else None
+        if report is not None:
+            if isinstance(report, str):
+                report = report.encode('utf-8')
+            with self._condition:
+                if not self._buffer:
+                    self._oldest_record_time = monotonic()
+                self._buffer.append(report, logging.WARNING)
 
     def _flush_queue(self):
-        # Sending logs until queue is empty
-        while not self.queue.empty():
-            logs_list = self._get_messages_up_to_max_allowed_size()
+        with self._flush_lock:
+            self._report_drops()
+
+            # retries which are due go first, on shutdown all of them get their last try
+            with self._condition:
+                retries = self._retries.pop_due(everything=self._stopping)
+            for batch in retries:
+                self._dispatch_batch(batch)
+
+            # Sending logs until queue is empty
+            records = self._take_buffer()
+            while records:
+                self._dispatch_batch(self._get_messages_up_to_max_allowed_size(records))
+
+    def _dispatch_batch(self, batch):
+        if self.concurrency > 1:
+            self._batches.put(batch)  # blocks while all upload threads are busy
+        else:
+            self._send_batch(batch)
+
+    def _send_batch(self, batch):
+        """
+        Post a batch once. A failed batch is parked in the retry scheduler rather than retried in place, so the
+        calling thread goes on with the next batch.
+        :param batch:
+        :return:
+        """
+        logs_list = batch.records
+        self.logger.debug(
+            'Starting to drain %s logs to url' + str(self.url) + str(len(logs_list)))
+
+        with self._lock:
+            allowed = self.circuit_breaker.allow_request()
+        if not allowed:
+            self._give_up(batch, 'the url is unhealthy')
+            return
+
+        batch.tries += 1
+        body = batch.body()
+        if batch.tries == 1:
+            self.metrics.batch_records.observe(len(logs_list))
+            self.metrics.batch_bytes.observe(len(body))
+        start = perf_counter()
+        result = self._post_batch(batch, self._headers(batch), body, batch.tries - 1, self.max_tries)
+        self.metrics.upload_latency.observe(perf_counter() - start)
+
+        with self._lock:
+            if result == BATCH_FAILED:
+                self.circuit_breaker.record_failure()
+                self.metrics.failed_attempts += 1
+            else:
+                self.circuit_breaker.record_success()
+                if result == BATCH_SENT:
+                    self.metrics.batches_sent += 1
+                    self.metrics.records_sent += len(logs_list)
+                    self.metrics.bytes_sent += len(body)
+                else:
+                    self.metrics.batches_rejected += 1
+
+        if result == BATCH_SENT:
+            self._replay_spool_if_needed()
+        elif result == BATCH_FAILED:
+            if batch.tries >= self.max_tries or self._stopping:
+                self._give_up(batch, 'after {} tries'.format(batch.tries))
+            else:
+                with self._condition:
+                    self.metrics.retries += 1
+                    self._retries.schedule(batch, backoff_delay(batch.tries, self.retry_base_delay,
+                                                                self.retry_max_delay))
+                    self._condition.notify()  # the sending thread has to wake up for the retry
+
+    def _give_up(self, batch, reason):
+        logs_list = batch.records
+        with self._lock:
+            self.metrics.batches_given_up += 1
+            self.metrics.records_given_up += len(logs_list)
+            if self.spool is not None:
+                self.metrics.records_spooled += len(logs_list)
+                self.metrics.bytes_spooled += sum(len(record) for record in logs_list)
+        if self.spool is not None:
+            self.logger.info(
+                'Could not send logs to url ' + str(self.url) + ' ' + reason + ', '
+                'spooling them for a later replay')
+            self.spool.append(logs_list)
+        else:
+            # Write to file
+            self.logger.info(
+                'Could not send logs to url ' + str(self.url) + ' ' + reason + ', '
+                'backing up to local file system')
+            backup_logs(logs_list, self.logger)
+
+    @staticmethod
+    def _headers(batch):
+        headers = {"Content-type": "text/plain"}
+        if batch.content_encoding is not None:
+            headers["Content-Encoding"] = batch.content_encoding
+        return headers
+
+    def _post_batch(self, batch, headers, body, current_try=0, number_of_retries=1):
+        """
+        Post a batch once.
+        :return: BATCH_SENT, BATCH_REJECTED if the batch must not be retried, or BATCH_FAILED
+        """
+        try:
+            response = self.transport.post(
+                self.url, headers=headers, data=body)
+            if response.status_code != 200:
+                if response.status_code == 400:
+                    self.logger.info(
+                        'Got 400 code from url ' + str(self.url) + '. This means that '
+                        'some of your logs are too big, or badly '
+                        'formatted. response: %s', response.text)
+                    return BATCH_REJECTED
+
+                if response.status_code == 401:
+                    self.logger.info(
+                        'You are not authorized with url ' + str(self.url) + '! Token '
+                        'OK? dropping logs...')
+                    return BATCH_REJECTED
+                else:
+                    self.logger.info(
+                        'Got %s while sending logs to url ' + str(self.url) + ', '
+                        'Try (%s/%s). Response: %s',
+                        response.status_code,
+                        current_try + 1,
+                        number_of_retries,
+                        response.text)
+                    return BATCH_FAILED
+            else:
+                self.logger.debug(
+                    'Successfully sent bulk of %s logs to '
+                    'url ' + str(self.url), len(batch.records))
+                return BATCH_SENT
+        except Exception as e:
+            self.logger.error(
+                'Got exception while sending logs to url ' + str(self.url) + ', '
+                'Try (%s/%s). Message: %s',
+                current_try + 1, number_of_retries, e)
+            return BATCH_FAILED
+
+    def _next_spool_probe_time(self):
+        # while the circuit is open and there is nothing else to send, the spool replay probes the url
+        if self.spool is None or self.spool.is_empty() or self._is_replaying():
+            return None
+        return self.circuit_breaker.next_probe_time()
+
+    def _is_replaying(self):
+        return self._replay_thread is not None and self._replay_thread.is_alive()
+
+    def _probe_with_spool(self):
+        with self._lock:
+            if self._next_spool_probe_time() is None or not self.circuit_breaker.allow_request():
+                return
+        self._replay_spool_if_needed()
+
+    def _replay_spool_if_needed(self):
+        if self.spool is None or self.spool.is_empty():
+            return
+
+        with self._lock:
+            if self._is_replaying():
+                return
+            self._replay_thread = Thread(target=self._replay_spool)
+            self._replay_thread.daemon = False
+            self._replay_thread.name = 'http-replay-thread'
+            self._replay_thread.start()
+
+    def _replay_spool(self):
+        """
+        Send the spooled batches, oldest first. A segment is removed once all its batches went out, the replay stops
+        at the first failure and leaves the rest for the next one. Batches of a segment which was interrupted are
+        sent again by the next replay.
+        :return:
+        """
+        try:
+            self._replay_segments()
+        except Exception as e:
             self.logger.debug(
-                'Starting to drain %s logs to url' + str(self.url) + str(len(logs_list)))
-
-            # Not configurable from the outside
-            sleep_between_retries = 2
-            number_of_retries = 4
-
-            should_backup_to_disk = True
-            headers = {"Content-type": "text/plain"}
-
-            for current_try in range(number_of_retries):
-                should_retry = False
-                try:
-                    response = requests.post(
-                        self.url, headers=headers, data='\n'.join(logs_list))
-                    if response.status_code != 200:
-                        if response.status_code == 400:
-                            self.logger.info(
-                                'Got 400 code from url ' + str(self.url) + '. This means that '
-                                'some of your logs are too big, or badly '
-                                'formatted. response: %s', response.text)
-                            should_backup_to_disk = False
-                            break
-
-                        if response.status_code == 401:
-                            self.logger.info(
-                                'You are not authorized with url ' + str(self.url) + '! Token '
-                                'OK? dropping logs...')
-                            should_backup_to_disk = False
-                            break
+                'Unexpected exception while replaying spooled logs to url ' + str(self.url) + ', '
+                'swallowing. Exception: %s', e)
+
+    def _replay_segments(self):
+        for path in self.spool.closed_segments():
+            for records in self.spool.read(path):
+                records = deque(records)
+                while records:
+                    batch = self._get_messages_up_to_max_allowed_size(records)
+                    result = self._post_batch(batch, self._headers(batch), batch.body())
+                    with self._lock:
+                        if result == BATCH_FAILED:
+                            self.circuit_breaker.record_failure()
                         else:
-                            self.logger.info(
-                                'Got %s while sending logs to url ' + str(self.url) + ', '
-                                'Try (%s/%s). Response: %s',
-                                response.status_code,
-                                current_try + 1,
-                                number_of_retries,
-                                response.text)
-                            should_retry = True
-                    else:
-                        self.logger.debug(
-                            'Successfully sent bulk of %s logs to '
-                            'url ' + str(self.url), len(logs_list))
-                        should_backup_to_disk = False
-                        break
-                except Exception as e:
-                    self.logger.error(
-                        'Got exception while sending logs to url ' + str(self.url) + ', '
-                        'Try (%s/%s). Message: %s',
-                        current_try + 1, number_of_retries, e)
-                    should_retry = True
-
-                if should_retry:
-                    sleep(sleep_between_retries)
-                    sleep_between_retries *= 2
-
-            if should_backup_to_disk:
-                # Write to file
-                self.logger.info(
-                    'Could not send logs to url ' + str(self.url) + ' after %s tries, '
-                    'backing up to local file system', number_of_retries)
-                backup_logs(logs_list, self.logger)
-
-    def _get_messages_up_to_max_allowed_size(self):
-        logs_list = []
-        current_size = 0
-        while not self.queue.empty():
-            current_log = self.queue.get()
-            current_size += sys.getsizeof(current_log)
-            logs_list.append(current_log)
-            if current_size >= MAX_BULK_SIZE_IN_BYTES:
+                            self.circuit_breaker.record_success()
+
+                    if result == BATCH_FAILED:
+                        self.logger.info('Replay of spooled logs to url ' + str(self.url) + ' failed, retrying later')
+                        return
+            self.spool.remove(path)
+            self.logger.debug('Replayed spool segment %s to url ' + str(self.url), path)
+
+    def _create_batch(self):
+        if self.compression is None:
+            return PlainBatch(max_records=self.flush_max_records)
+        return CompressedBatch(self.compression, self.compression_level, max_records=self.flush_max_records)
+
+    def _get_messages_up_to_max_allowed_size(self, records):
+        batch = self._create_batch()
+        while records and not batch.is_full():
+            # a record which does not fit anymore stays in place for the next batch
+            if not batch.add(records[0]):
                 break
-        return logs_list
+            records.popleft()
+        return batch
@@ -1,26 +1,35 @@
 import requests
 import logging
 import signal
-from loggingpy.log import JsonFormatter
+from loggingpy.log import JsonFormatter, Logger
+from loggingpy.queues import QueueLimits
+from loggingpy.spool import DiskSpool
+from loggingpy.filewriter import FileWriter, FsyncPolicy, DEFAULT_FILE_MAX_BYTES, DEFAULT_BACKUP_COUNT, \
+    DEFAULT_FILE_FLUSH_MAX_BYTES, DEFAULT_FILE_FLUSH_INTERVAL, DEFAULT_FILE_FSYNC_INTERVAL
+from loggingpy.retry import CircuitBreaker, DEFAULT_MAX_TRIES, DEFAULT_RETRY_BASE_DELAY, DEFAULT_RETRY_MAX_DELAY
 import logging.handlers
 
-from .sender import HttpSender
+from .sender import HttpSender, HttpTransport, PooledHttpTransport, DEFAULT_COMPRESSION_LEVEL, \
+    DEFAULT_FLUSH_MAX_RECORDS, MAX_BULK_SIZE_IN_BYTES
 
 
 class SimpleHttpSink(logging.Handler):
     """
     Sends every log message in series one-by-one.
     """
+    blocking = True  # the dispatcher hands the records to a thread of the sink's own
 
-    def __init__(self, endpoint_uri: str):
+    def __init__(self, endpoint_uri: str, transport: HttpTransport=None):
         logging.Handler.__init__(self)
         self.endpoint_uri = endpoint_uri
+        self.transport = transport if transport is not None else PooledHttpTransport()
         self.setFormatter(JsonFormatter())
 
     def emit(self, record):
         log_entry = self.format(record)
         try:
-            return requests.post(self.endpoint_uri, log_entry, headers={"Content-type": "application/json"}).content
+            return self.transport.post(
+                self.endpoint_uri, log_entry, headers={"Content-type": "application/json"}).content
         except Exception as ex:  # after the post retries, all bets are off
             print(ex)
 
@@ -34,7 +43,50 @@ def post_request(info):
         print(ex)
 
 
-class BundlingHttpSink(logging.Handler):
+class ApplicationSink(logging.Handler):
+    """
+    A sink which adds the name and environment of the application to every record it formats.
+    """
+
+    def __init__(self, app_name: str, environment: str):
+        self.app_name = app_name
+        self.environment = environment.upper()
+        self._fields = JsonFormatter.encode_fields({'app_name': self.app_name, 'env': self.environment})
+        logging.Handler.__init__(self)
+
+    def _format(self, record):
+        # the record is shared with the other sinks, so the sink's fields must not be set on it
+        if isinstance(self.formatter, JsonFormatter):
+            return self.formatter.format_with_fields(record, self._fields)
+
+        record = logging.makeLogRecord(record.__dict__)
+        record.app_name = self.app_name
+        record.environment = self.environment
+        return self.format(record)
+
+    def handle_batch(self, records: list):
+        """
+        Handle the records of a batch logged by Logger.log_many, like handle does for a single record: the filters
+        are applied to every record and the records which pass are emitted under the lock of the sink at once.
+        :param records: the log records
+        :return:
+        """
+        records = [record for record in records if self.filter(record)]
+        if records:
+            with self.lock:
+                self.emit_batch(records)
+
+    def emit_batch(self, records: list):
+        """
+        Emit the records of a batch. Sinks which buffer records override it to buffer them all at once.
+        :param records:
+        :return:
+        """
+        for record in records:
+            self.emit(record)
+
+
+class BundlingHttpSink(ApplicationSink):
     """
     Sends messages by bundling multiple messages into one request.
     Adjusted version from: https://github.com/logzio/logzio-python-handler/tree/master/logzio
@@ -44,22 +96,115 @@ class BundlingHttpSink(logging.Handler):
                  environment: str,
                  url: str,
                  logs_drain_timeout=3,
-                 debug=False):
-
-        self.app_name = app_name
-        self.environment = environment.upper()
+                 debug=False,
+                 transport: HttpTransport=None,
+                 compression: str=None,
+                 compression_level: int=DEFAULT_COMPRESSION_LEVEL,
+                 flush_max_records: int=DEFAULT_FLUSH_MAX_RECORDS,
+                 flush_max_bytes: int=MAX_BULK_SIZE_IN_BYTES,
+                 concurrency: int=1,
+                 limits: QueueLimits=None,
+                 spool: DiskSpool=None,
+                 max_tries: int=DEFAULT_MAX_TRIES,
+                 retry_base_delay: float=DEFAULT_RETRY_BASE_DELAY,
+                 retry_max_delay: float=DEFAULT_RETRY_MAX_DELAY,
+                 circuit_breaker: CircuitBreaker=None):
 
+        ApplicationSink.__init__(self, app_name, environment)
         self.http_sender = HttpSender(
             url=url,
             logs_drain_timeout=logs_drain_timeout,
-            debug=debug)
-        logging.Handler.__init__(self)
+            debug=debug,
+            transport=transport,
+            compression=compression,
+            compression_level=compression_level,
+            flush_max_records=flush_max_records,
+            flush_max_bytes=flush_max_bytes,
+            concurrency=concurrency,
+            limits=limits,
+            drop_reporter=self._report_drops,
+            spool=spool,
+            max_tries=max_tries,
+            retry_base_delay=retry_base_delay,
+            retry_max_delay=retry_max_delay,
+            circuit_breaker=circuit_breaker)
 
     def flush(self):
         self.http_sender.flush()
 
+    def close(self):
+        self.http_sender.close()
+        logging.Handler.close(self)
+
+    def _report_drops(self, dropped):
+        return self._format(Logger.drop_report_record(dropped, type(self).__name__))
+
+    def stats(self):
+        """
+        :return: the metrics of the sender of the sink
+        """
+        return self.http_sender.stats()
+
     def emit(self, record):
-        record.app_name = self.app_name
-        record.environment = self.environment
-        log_entry = self.format(record)
-        self.http_sender.append(log_entry)
+        log_entry = self._format(record)
+        self.http_sender.append(log_entry, record.levelno)
+
+    def emit_batch(self, records: list):
+        self.http_sender.extend([(self._format(record), record.levelno) for record in records])
+
+
+class BundlingFileSink(ApplicationSink):
+    """
+    Writes messages as newline delimited JSON into a file, bundling multiple messages into one write on a background
+    thread. The file is rotated by size and age.
+    """
+    def __init__(self,
+                 app_name: str,
+                 environment: str,
+                 path: str,
+                 max_bytes: int=DEFAULT_FILE_MAX_BYTES,
+                 max_age: float=None,
+                 backup_count: int=DEFAULT_BACKUP_COUNT,
+                 compression: str=None,
+                 fsync: FsyncPolicy=FsyncPolicy.Interval,
+                 fsync_interval: float=DEFAULT_FILE_FSYNC_INTERVAL,
+                 flush_max_bytes: int=DEFAULT_FILE_FLUSH_MAX_BYTES,
+                 flush_interval: float=DEFAULT_FILE_FLUSH_INTERVAL,
+                 limits: QueueLimits=None):
+
+        ApplicationSink.__init__(self, app_name, environment)
+        self.file_writer = FileWriter(
+            path=path,
+            max_bytes=max_bytes,
+            max_age=max_age,
+            backup_count=backup_count,
+            compression=compression,
+            fsync=fsync,
+            fsync_interval=fsync_interval,
+            flush_max_bytes=flush_max_bytes,
+            flush_interval=flush_interval,
+            limits=limits,
+            drop_reporter=self._report_drops)
+
+    def flush(self):
+        self.file_writer.flush()
+
+    def close(self):
+        self.file_writer.close()
+        logging.Handler.close(self)
+
+    def _report_drops(self, dropped):
+        return self._format(Logger.drop_report_record(dropped, type(self).__name__))
+
+    def stats(self):
+        """
+        :return: the metrics of the writer of the sink
+        """
+        return self.file_writer.stats()
+
+    def emit(self, record):
+        log_entry = self._format(record)
+        self.file_writer.append(log_entry, record.levelno)
+
+    def emit_batch(self, records: list):
+        self.file_writer.extend([(self._format(record), record.levelno) for record in records])
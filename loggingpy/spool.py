@@ -0,0 +1,205 @@
+import os
+import struct
+import zlib
+from threading import Lock
+from time import monotonic
+
+SEGMENT_PREFIX = 'spool-'
+SEGMENT_SUFFIX = '.log'
+
+DEFAULT_SPOOL_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024  # 16 MB
+DEFAULT_FSYNC_INTERVAL = 1  # seconds
+
+# every frame is prefixed by the payload length and its crc32, which allows to detect a torn write at the tail
+FRAME_HEADER = struct.Struct('>II')
+
+
+class DiskSpool:
+    """
+    An append-only spool of log batches on disk. Batches are written as checksummed frames into numbered segment
+    files, the oldest segments are replayed first and removed once they were sent. Writes go through a buffered file
+    and are fsynced as a group at most every fsync_interval seconds, so a crash loses at most that much.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int=DEFAULT_SPOOL_MAX_BYTES,
+        segment_bytes: int=DEFAULT_SEGMENT_BYTES,
+        fsync_interval: float=DEFAULT_FSYNC_INTERVAL
+    ):
+        """
+        :param directory: the spool directory, created if missing
+        :param max_bytes: maximum size of all segments, the oldest segments are deleted beyond it
+        :param segment_bytes: size at which the current segment is closed and a new one started
+        :param fsync_interval: maximum seconds between two fsyncs of the current segment
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+
+        self.dropped_bytes = 0
+        self._lock = Lock()
+        self._file = None
+        self._file_size = 0
+        self._unsynced = False
+        self._last_sync_time = monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = self._list_segments()
+        self._size = sum(os.path.getsize(path) for path in self._segments)
+        self._next_sequence = self._sequence(self._segments[-1]) + 1 if self._segments else 0
+
+    def _list_segments(self):
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    @staticmethod
+    def _sequence(path):
+        return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    @property
+    def size(self):
+        return self._size
+
+    def append(self, records: list):
+        """
+        Spool a batch of records. This does not fsync, see sync_if_due.
+        :param records: the UTF-8 encoded records
+        :return:
+        """
+        payload = b'\n'.join(records)
+        header = FRAME_HEADER.pack(len(payload), zlib.crc32(payload))
+
+        with self._lock:
+            if self._file is None or self._file_size >= self.segment_bytes:
+                self._open_next_segment()
+
+            self._file.write(header)
+            self._file.write(payload)
+            written = FRAME_HEADER.size + len(payload)
+            self._file_size += written
+            self._size += written
+            self._unsynced = True
+
+            self._enforce_max_bytes()
+
+    def _open_next_segment(self):
+        self._close_segment()
+        path = os.path.join(self.directory, '{}{:020d}{}'.format(SEGMENT_PREFIX, self._next_sequence, SEGMENT_SUFFIX))
+        self._next_sequence += 1
+        self._file = open(path, 'ab')
+        self._file_size = 0
+        self._segments.append(path)
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def _sync(self):
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+        self._last_sync_time = monotonic()
+
+    def _enforce_max_bytes(self):
+        # the current segment is never deleted, even if it exceeds the maximum size on its own
+        while self._size > self.max_bytes and len(self._segments) > 1:
+            self._delete(self._segments[0])
+
+    def _delete(self, path):
+        size = os.path.getsize(path)
+        os.remove(path)
+        self._segments.remove(path)
+        self._size -= size
+        self.dropped_bytes += size
+
+    def sync_if_due(self):
+        """
+        Fsync the written batches if the fsync interval passed.
+        :return:
+        """
+        with self._lock:
+            if self._file is not None and monotonic() - self._last_sync_time >= self.fsync_interval:
+                self._sync()
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def after_fork(self):
+        """
+        Let go of the spool in a forked child process. The segments and the bytes buffered for the current one belong
+        to the parent, so the inherited file is pointed at the null device before it is closed, which discards the
+        buffer instead of writing it a second time.
+        :return:
+        """
+        self._lock = Lock()
+        if self._file is not None:
+            null = os.open(os.devnull, os.O_WRONLY)
+            try:
+                os.dup2(null, self._file.fileno())
+            finally:
+                os.close(null)
+            self._file.close()
+            self._file = None
+        self._segments = []
+        self._size = 0
+
+    def closed_segments(self):
+        """
+        Close the current segment, so everything spooled so far becomes replayable.
+        :return: the paths of all segments, oldest first
+        """
+        with self._lock:
+            self._close_segment()
+            return list(self._segments)
+
+    def read(self, path):
+        """
+        Read the batches of a segment. A truncated or corrupt frame ends the segment, a segment which was deleted to
+        enforce the maximum size in the meantime has no batches.
+        :param path:
+        :return: a generator of lists of records
+        """
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            while True:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                length, checksum = FRAME_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    return
+                yield payload.split(b'\n')
+
+    def remove(self, path):
+        """
+        Remove a replayed segment.
+        :param path:
+        :return:
+        """
+        with self._lock:
+            if path in self._segments and os.path.exists(path):
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._segments.remove(path)
+                self._size -= size
+
+    def is_empty(self):
+        return not self._segments
@@ -10,6 +10,6 @@ setup(name='logging-py',
       author='felfel',
       author_email='tech@felfel.ch',
       description='Highly opinionated structured logging for python projects.',
-      packages=find_packages(exclude=['examples', 'tests']),
+      packages=find_packages(exclude=['examples', 'tests', 'benchmarks', 'benchmarks.*']),
       long_description=open('README.md').read(),
       zip_safe=False,)
@@ -0,0 +1,23 @@
+import json
+import logging
+
+from loggingpy.log import JsonFormatter
+
+
+class CollectingSink(logging.Handler):
+    """
+    Collects the records it receives, or the JSON objects they are formatted into if decode is set.
+    """
+
+    def __init__(self, decode: bool=False):
+        logging.Handler.__init__(self)
+        self.setFormatter(JsonFormatter())
+        self.decode = decode
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(self.format(record)) if self.decode else record)
+
+
+def fail(message):
+    raise ValueError(message)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import threading
+
+from benchmarks.stub_server import StubServer
+from loggingpy.aio import AsyncLogger, AsyncBundlingHttpSink, AsyncHttpTransport
+from loggingpy.log import JsonFormatter, LogLevel
+
+
+class TestAsyncHttpTransport:
+
+    def setup_method(self):
+        self.server = StubServer().start()
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_transport_should_reuse_connection(self):
+        async def post_all():
+            transport = AsyncHttpTransport()
+            responses = [await transport.post(self.server.url, b'log') for _ in range(10)]
+            transport.close()
+            return responses
+
+        responses = asyncio.run(post_all())
+
+        assert [response.status_code for response in responses] == [200] * 10
+        assert self.server.requests == 10
+        assert self.server.connections == 1
+
+    def test_timeout_should_close_reused_connection(self):
+        async def post_twice():
+            transport = AsyncHttpTransport(read_timeout=0.05)
+            await transport.post(self.server.url, b'log')
+            (writer_of_idle,) = [writer for idle in transport._idle.values() for _, writer in idle]
+            self.server.latency = 0.5
+            try:
+                await transport.post(self.server.url, b'slow')
+                assert False
+            except asyncio.TimeoutError:
+                pass
+            closing = writer_of_idle.is_closing()
+            transport.close()
+            return closing
+
+        assert asyncio.run(post_twice())
+
+
+class TestAsyncBundlingHttpSink:
+
+    def setup_method(self):
+        self.server = StubServer().start()
+        AsyncLogger.sinks = []
+
+    def teardown_method(self):
+        AsyncLogger.sinks = []
+        logging.getLogger('AsyncTest').setLevel(logging.NOTSET)
+        self.server.stop()
+
+    def test_records_should_be_bundled(self):
+        sink = AsyncBundlingHttpSink('app', 'test', self.server.url, flush_max_records=10, concurrency=2)
+        AsyncLogger.with_sink(sink)
+        logger = AsyncLogger('AsyncTest')
+        logger.set_level(logging.DEBUG)
+
+        async def log_all():
+            for i in range(25):
+                logger.info('message {}'.format(i), payload_type='Record', payload={'index': i})
+            await AsyncLogger.flush()
+            await sink.close()
+
+        asyncio.run(log_all())
+
+        assert self.server.records == 25
+        assert self.server.requests == 3
+
+    def test_close_should_send_records_waiting_for_upload_slot(self):
+        self.server.latency = 0.05
+        sink = AsyncBundlingHttpSink('app', 'test', self.server.url, flush_max_records=10)
+        AsyncLogger.with_sink(sink)
+        logger = AsyncLogger('AsyncTest')
+        logger.set_level(logging.DEBUG)
+
+        async def log_all():
+            for i in range(100):
+                logger.info('message {}'.format(i))
+            await asyncio.sleep(0.01)  # the runner takes all records, and uploads one batch at a time
+            await sink.close()
+
+        asyncio.run(log_all())
+
+        assert self.server.records == 100
+
+    def test_age_should_trigger_flush(self):
+        sink = AsyncBundlingHttpSink('app', 'test', self.server.url, logs_drain_timeout=0.1)
+        AsyncLogger.with_sink(sink)
+        logger = AsyncLogger('AsyncTest')
+        logger.set_level(logging.DEBUG)
+
+        async def log_and_wait():
+            logger.info('hello')
+            await asyncio.sleep(0.5)
+            delivered = self.server.records
+            await sink.close()
+            return delivered
+
+        assert asyncio.run(log_and_wait()) == 1
+
+    def test_record_should_be_formatted_like_sync_sink(self):
+        sink = AsyncBundlingHttpSink('app', 'test', self.server.url)
+        AsyncLogger.with_sink(sink)
+
+        received = []
+        self.server.on_records = received.extend
+
+        async def log_one():
+            AsyncLogger('AsyncTest').warning('hello', payload_type='Record', payload={'a': 1})
+            await sink.close()
+
+        asyncio.run(log_one())
+        dto = json.loads(received[0])
+
+        assert dto['level'] == 'Warning'
+        assert dto['context'] == 'AsyncTest'
+        assert dto['payload_type'] == 'AsyncTest.Record'
+        assert dto['async_test_record'] == {'a': 1}
+        assert dto['app_name'] == 'app'
+        assert dto['env'] == 'TEST'
+
+    def test_records_should_be_formatted_off_the_event_loop(self):
+        threads = []
+
+        class RecordingFormatter(JsonFormatter):
+            def format_with_fields(self, record, fields=None):
+                threads.append(threading.current_thread())
+                return JsonFormatter.format_with_fields(self, record, fields)
+
+        sink = AsyncBundlingHttpSink('app', 'test', self.server.url)
+        AsyncLogger.with_sink(sink)
+        sink.setFormatter(RecordingFormatter())
+
+        async def log_one():
+            try:
+                raise ValueError('formatted')
+            except ValueError as e:
+                AsyncLogger('AsyncTest').error('failed', exception=e)
+            await sink.close()
+
+        asyncio.run(log_one())
+
+        assert self.server.records == 1
+        assert threads and threading.main_thread() not in threads
+
+    def test_default_level_should_match_logger(self):
+        sink = AsyncBundlingHttpSink('app', 'test', self.server.url)
+        AsyncLogger.with_sink(sink)
+        logger = AsyncLogger('AsyncTest')
+
+        async def log_all():
+            logger.info('dropped')
+            logger.warning('logged')
+            await sink.close()
+
+        asyncio.run(log_all())
+
+        assert not logger.is_enabled_for(LogLevel.Info)
+        assert self.server.records == 1
@@ -0,0 +1,116 @@
+import logging
+import time
+
+from loggingpy.coalescing import ExceptionCoalescer
+from loggingpy.log import Logger, LogLevel
+from tests.helpers import CollectingSink, fail
+
+
+def fail_elsewhere(message):
+    raise ValueError(message)
+
+
+class TestExceptionCoalescer:
+
+    def add(self, coalescer, exception_hash, message='failed', timestamp_ns=0):
+        return coalescer.add(exception_hash, 'ValueError', LogLevel.Error, 'Context', 'Context.Failure', message,
+                             timestamp_ns)
+
+    def test_first_occurrence_should_be_logged_in_full(self):
+        coalescer = ExceptionCoalescer(window=60)
+
+        assert [self.add(coalescer, 'a'), self.add(coalescer, 'a'), self.add(coalescer, 'b')] == [True, False, True]
+
+    def test_folded_occurrences_should_be_summarized(self):
+        coalescer = ExceptionCoalescer(window=60, max_messages=2)
+        for i in range(5):
+            self.add(coalescer, 'a', message='failed {}'.format(i % 3), timestamp_ns=i)
+
+        assert coalescer.take_due() == []
+        (exception_hash, group), = coalescer.take_due(force=True)
+        assert exception_hash == 'a'
+        assert group.count == 4
+        assert (group.first_ns, group.last_ns) == (0, 4)
+        assert group.messages == ['failed 1', 'failed 2']
+
+    def test_next_window_should_log_in_full_again(self):
+        coalescer = ExceptionCoalescer(window=0)
+        self.add(coalescer, 'a')
+
+        assert self.add(coalescer, 'a')
+        assert coalescer.take_due() == []  # nothing was folded
+
+    def test_exceptions_beyond_limit_should_be_logged_in_full(self):
+        coalescer = ExceptionCoalescer(window=60, max_exceptions=1)
+        self.add(coalescer, 'a')
+
+        assert [self.add(coalescer, 'b'), self.add(coalescer, 'b')] == [True, True]
+
+
+class TestLoggerCoalescing:
+
+    def setup_method(self):
+        Logger.shutdown()
+        self.sinks = list(Logger.sinks)
+        Logger.sinks.clear()
+        self.sink = CollectingSink(decode=True)
+        Logger.with_sink(self.sink)
+
+    def teardown_method(self):
+        Logger.shutdown()
+        Logger.with_exception_coalescing(None)
+        Logger.sinks[:] = self.sinks
+
+    def test_exception_storm_should_be_folded_into_summary(self):
+        Logger.with_exception_coalescing(ExceptionCoalescer(window=60))
+        logger = Logger('Storm')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(10):
+            for raiser in (fail, fail_elsewhere):
+                try:
+                    raiser(str(i))
+                except ValueError as e:
+                    logger.error('failed {}'.format(i % 2), exception=e, payload_type='Failure')
+        Logger.flush()
+
+        full = [entry for entry in self.sink.records if 'exception_info' in entry]
+        summaries = [entry['logging_exception_summary'] for entry in self.sink.records
+                     if entry['payload_type'] == 'Logging.ExceptionSummary']
+        assert len(full) == 2
+        assert [summary['exception_hash'] for summary in summaries] == \
+            [entry['exception_info']['exception_hash'] for entry in full]
+        assert [summary['coalesced_occurrences'] for summary in summaries] == [9, 9]
+        assert summaries[0]['messages'] == ['failed 1', 'failed 0']
+        assert summaries[0]['payload_type'] == 'Storm.Failure'
+        assert summaries[0]['first_timestamp'] <= summaries[0]['last_timestamp']
+
+    def test_entries_without_exception_should_not_be_coalesced(self):
+        Logger.with_exception_coalescing(ExceptionCoalescer(window=60))
+        logger = Logger('StormFree')
+        logger.set_level(logging.DEBUG)
+
+        for _ in range(3):
+            logger.error('failed')
+        Logger.flush()
+
+        assert [entry['message'] for entry in self.sink.records] == ['failed'] * 3
+
+    def test_summary_should_be_delivered_without_further_logging(self):
+        Logger.with_exception_coalescing(ExceptionCoalescer(window=0.1))
+        logger = Logger('StormIdle')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(5):
+            try:
+                fail(str(i))
+            except ValueError as e:
+                logger.error('failed', exception=e)
+
+        end_time = time.monotonic() + 5
+        summaries = []
+        while not summaries and time.monotonic() < end_time:
+            time.sleep(0.05)
+            summaries = [entry['logging_exception_summary'] for entry in list(self.sink.records)
+                         if entry['payload_type'] == 'Logging.ExceptionSummary']
+        assert [summary['coalesced_occurrences'] for summary in summaries] == [4]
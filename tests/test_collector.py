@@ -0,0 +1,216 @@
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy.collector import LogCollector, CollectorServer, CollectorSink
+from loggingpy.log import Logger
+from loggingpy.sender import HttpSender
+from loggingpy.spool import DiskSpool
+from tests.helpers import CollectingSink
+
+fork = multiprocessing.get_context('fork')
+
+
+def wait_for(condition, timeout=10):
+    end_time = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end_time:
+        time.sleep(0.01)
+    return condition()
+
+
+def log_in_child(records):
+    logger = Logger('Worker')
+    logger.set_level(logging.DEBUG)
+    for i in range(records):
+        logger.info('child {}'.format(i))
+    Logger.flush()
+
+
+def flush_sender_in_child(sender):
+    sender.flush()
+    sender.close()
+
+
+def send_in_child(sender):
+    sender.append('child')
+    sender.close()
+
+
+class TestLogCollector:
+
+    def setup_method(self):
+        Logger.shutdown()
+        self.sinks = list(Logger.sinks)
+        Logger.sinks.clear()
+        self.server = StubServer().start()
+        self.received = []
+        self.server.on_records = self.received.extend
+        self.directory = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.directory.name, 'collector.sock')
+
+    def teardown_method(self):
+        Logger.shutdown()
+        Logger.sinks[:] = self.sinks
+        self.server.stop()
+        self.directory.cleanup()
+
+    def serve(self):
+        stop_event = threading.Event()
+        collector = LogCollector(self.address, self.server.url, logs_drain_timeout=0.1)
+        thread = threading.Thread(target=collector.serve, args=(stop_event,))
+        thread.start()
+        assert wait_for(lambda: os.path.exists(self.address))
+        return stop_event, thread
+
+    def test_records_should_be_sent_by_collector(self):
+        stop_event, thread = self.serve()
+        sink = CollectorSink('app', 'test', self.address)
+        Logger.with_sink(sink)
+        logger = Logger('Collected')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(20):
+            logger.info(str(i))
+        Logger.flush()
+        stop_event.set()
+        thread.join()
+
+        records = [json.loads(record) for record in self.received]
+        assert [record['message'] for record in records] == [str(i) for i in range(20)]
+        assert records[0]['app_name'] == 'app' and records[0]['env'] == 'TEST'
+
+    def test_records_should_be_sent_when_collector_stops_after_burst(self, monkeypatch):
+        append = HttpSender.append
+
+        def slow_append(sender, *args, **kwargs):
+            time.sleep(0.002)
+            return append(sender, *args, **kwargs)
+
+        monkeypatch.setattr(HttpSender, 'append', slow_append)
+        stop_event, thread = self.serve()
+        Logger.with_sink(CollectorSink('app', 'test', self.address))
+        logger = Logger('Burst')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(500):
+            logger.info(str(i))
+        Logger.flush()
+        stop_event.set()
+        thread.join()
+
+        assert [json.loads(record)['message'] for record in self.received] == [str(i) for i in range(500)]
+
+    def test_records_of_connection_not_yet_accepted_should_be_sent(self, monkeypatch):
+        # the collector stops before it got to accept the connection of the worker
+        monkeypatch.setattr(CollectorServer, '_handle_request_noblock', lambda server: time.sleep(0.01))
+        stop_event, thread = self.serve()
+        Logger.with_sink(CollectorSink('app', 'test', self.address))
+        logger = Logger('Pending')
+        logger.set_level(logging.DEBUG)
+
+        logger.info('pending')
+        Logger.flush()
+        stop_event.set()
+        thread.join()
+
+        assert [json.loads(record)['message'] for record in self.received] == ['pending']
+
+    def test_unreachable_collector_should_report_drops(self):
+        sink = CollectorSink('app', 'test', self.address)
+        Logger.with_sink(sink)
+        logger = Logger('Unreachable')
+        logger.set_level(logging.DEBUG)
+
+        logger.info('lost')
+        Logger.flush()
+        assert sink.dropped == 1
+
+        stop_event, thread = self.serve()
+        logger.info('found')
+        Logger.flush()
+        stop_event.set()
+        thread.join()
+
+        records = [json.loads(record) for record in self.received]
+        assert records[0]['logging_dropped_records'] == {'dropped_records': 1, 'queue': 'collector'}
+        assert records[1]['message'] == 'found'
+
+    def test_stalled_collector_should_not_hold_up_other_sinks(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.address)
+        listener.listen(1)  # accepts the connection, but never reads from it
+        sink = CollectingSink()
+        Logger.with_sinks([CollectorSink('app', 'test', self.address), sink])
+        logger = Logger('Stalled')
+        logger.set_level(logging.DEBUG)
+        logger.logger.propagate = False  # the test runner attaches its own handlers to the root logger
+
+        for i in range(200):
+            logger.info('x' * 10000)
+        try:
+            assert wait_for(lambda: len(sink.records) == 200, timeout=5)
+        finally:
+            listener.close()  # the writes to the collector fail and the records are dropped
+
+    def test_forked_workers_should_log_through_collector(self):
+        stop_event, thread = self.serve()
+        Logger.with_sink(CollectorSink('app', 'test', self.address))
+        log_in_child(1)  # the parent's dispatcher and connection exist before the fork
+
+        workers = [fork.Process(target=log_in_child, args=(50,)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            assert worker.exitcode == 0
+        stop_event.set()
+        thread.join()
+
+        messages = [json.loads(record)['message'] for record in self.received]
+        assert len(messages) == 151
+        assert messages.count('child 49') == 3
+
+
+class TestSenderAfterFork:
+
+    def setup_method(self):
+        self.server = StubServer().start()
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_child_should_not_send_records_of_parent(self):
+        sender = HttpSender(self.server.url, logs_drain_timeout=60)
+        sender.append('parent')
+
+        child = fork.Process(target=flush_sender_in_child, args=(sender,))
+        child.start()
+        child.join()
+        assert child.exitcode == 0
+        assert self.server.records == 0
+
+        sender.close()
+        assert self.server.records == 1
+
+    def test_child_should_leave_spool_to_parent(self):
+        directory = tempfile.TemporaryDirectory()
+        sender = HttpSender(self.server.url, logs_drain_timeout=60, spool=DiskSpool(directory.name))
+        spool = sender.spool
+        spool.append([b'parent'])  # buffered, not yet written
+
+        child = fork.Process(target=send_in_child, args=(sender,))
+        child.start()
+        child.join()
+        assert child.exitcode == 0
+        assert self.server.records == 1  # only the record of the child, the spool is replayed by the parent
+
+        batches = [batch for path in spool.closed_segments() for batch in spool.read(path)]
+        sender.close()
+        directory.cleanup()
+        assert batches == [[b'parent']]
@@ -0,0 +1,316 @@
+import json
+import logging
+import threading
+
+from loggingpy.exceptions import ExceptionSnapshot
+from loggingpy.log import Logger, LogEntry, LogLevel, LOG_MANY_BATCH_SIZE
+from loggingpy.queues import QueueLimits, OverflowPolicy
+from loggingpy.sampling import Sampler, SamplingRule, SamplingKey, SuppressionReport
+from tests.helpers import CollectingSink
+
+
+class FailingSink(logging.Handler):
+
+    def emit(self, record):
+        raise RuntimeError('sink failed')
+
+    def handleError(self, record):
+        pass
+
+
+class TestLogDispatcher:
+
+    def setup_method(self):
+        Logger.shutdown()
+        self.sinks = list(Logger.sinks)
+        Logger.sinks.clear()
+
+    def teardown_method(self):
+        Logger.shutdown()
+        Logger.with_queue_limits(None)
+        Logger.with_exception_snapshots(False)
+        Logger.sinks[:] = self.sinks
+
+    def test_thread_count_should_not_grow_with_contexts(self):
+        Logger.with_sinks([CollectingSink(), CollectingSink(), CollectingSink()])
+        threads = threading.active_count()
+
+        loggers = [Logger('DispatchContext{}'.format(i)) for i in range(200)]
+
+        assert threading.active_count() <= threads + 1
+        assert len({id(logger.logger.handlers[0]) for logger in loggers}) == 1
+
+    def test_records_should_reach_all_sinks(self):
+        first, second = CollectingSink(), CollectingSink()
+        Logger.with_sink(first)
+        logger = Logger('DispatchFanOut')
+        logger.set_level(logging.DEBUG)
+        Logger.with_sink(second)  # appended after the logger was created
+
+        for i in range(10):
+            logger.info(str(i))
+        Logger.flush()
+
+        assert [record.msg for record in first.records] == [str(i) for i in range(10)]
+        assert [record.msg for record in second.records] == [str(i) for i in range(10)]
+
+    def test_failing_sink_should_not_stop_dispatching(self):
+        sink = CollectingSink()
+        Logger.with_sinks([FailingSink(), sink])
+        logger = Logger('DispatchFailure')
+        logger.set_level(logging.DEBUG)
+
+        logger.info('first')
+        logger.info('second')
+        Logger.flush()
+
+        assert [record.msg for record in sink.records] == ['first', 'second']
+
+    def test_blocking_sink_should_not_hold_up_other_sinks(self):
+        release = threading.Event()
+
+        class BlockingSink(CollectingSink):
+            blocking = True
+
+            def emit(self, record):
+                release.wait()
+                CollectingSink.emit(self, record)
+
+        blocking, sink = BlockingSink(), CollectingSink()
+        Logger.with_sinks([blocking, sink])
+        logger = Logger('DispatchBlocking')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(10):
+            logger.info(str(i))
+        Logger.dispatcher.queue.join()
+
+        assert [record.msg for record in sink.records] == [str(i) for i in range(10)]
+        assert Logger.stats()['dispatch']['sink_queue_depth'] >= 9
+        release.set()
+        Logger.flush()
+        assert [record.msg for record in blocking.records] == [str(i) for i in range(10)]
+
+    def test_drops_of_blocking_sink_should_be_reported_with_its_name(self):
+        release = threading.Event()
+
+        class BlockingSink(CollectingSink):
+            blocking = True
+
+            def emit(self, record):
+                release.wait()
+                CollectingSink.emit(self, record)
+
+        sink = BlockingSink()
+        Logger.with_sink(sink)
+        Logger.with_queue_limits(QueueLimits(max_records=5, policy=OverflowPolicy.DropNewest, drop_report_interval=0))
+        logger = Logger('DispatchBlockingDrops')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(20):
+            logger.info(str(i))
+            Logger.dispatcher.queue.join()  # the shared queue drops nothing
+        release.set()
+        Logger.flush()
+
+        reports = [record.log_entry.payload for record in sink.records
+                   if record.log_entry.payload_type == 'Logging.DroppedRecords']
+        assert {report['queue'] for report in reports} == {'BlockingSink'}
+        assert sum(report['dropped_records'] for report in reports) == 14
+
+    def test_queue_limits_should_bound_dispatch_queue(self):
+        release = threading.Event()
+
+        class SlowSink(CollectingSink):
+            def emit(self, record):
+                release.wait()
+                CollectingSink.emit(self, record)
+
+        sink = SlowSink()
+        Logger.with_sink(sink)
+        Logger.with_queue_limits(QueueLimits(max_records=5, policy=OverflowPolicy.DropNewest, drop_report_interval=0))
+        logger = Logger('DispatchLimits')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(50):
+            logger.info(str(i))
+        release.set()
+        Logger.flush()
+
+        messages = [record.msg for record in sink.records]
+        assert len(messages) <= 7  # the record being handled, a full queue and the drop report
+        assert any('log records because the dispatch queue was full' in message for message in messages)
+
+    def test_exception_snapshot_should_be_rendered_by_dispatcher(self):
+        sink = CollectingSink()
+        Logger.with_sink(sink)
+        Logger.with_exception_snapshots(max_frames=10)
+        logger = Logger('DispatchSnapshot')
+
+        try:
+            raise ValueError('snapshot')
+        except ValueError as e:
+            logger.error('failed', exception=e)
+        Logger.flush()
+
+        entry = sink.records[0].log_entry
+        assert isinstance(entry.exception, ExceptionSnapshot)
+        dto = json.loads(sink.format(sink.records[0]))
+        assert dto['exception_info']['exception_type'] == 'ValueError'
+        assert dto['exception_info']['error_message'] == 'snapshot'
+        assert "raise ValueError('snapshot')" in dto['exception_info']['stack_trace']
+
+    def test_disabled_level_should_not_evaluate_lazy_values(self):
+        sink = CollectingSink()
+        Logger.with_sink(sink)
+        logger = Logger('DispatchLazy')
+        logger.set_level(logging.INFO)
+        calls = []
+
+        logger.debug(lambda: calls.append('message') or 'debug', payload=lambda: calls.append('payload') or {})
+        logger.info(lambda: calls.append('message') or 'info', payload_type='Lazy',
+                    payload=lambda: calls.append('payload') or {'evaluated': True})
+        Logger.flush()
+
+        assert calls == ['message', 'payload']
+        assert [record.msg for record in sink.records] == ['info']
+        assert sink.records[0].log_entry.payload == {'evaluated': True}
+
+    def test_entry_should_be_queued_without_record_if_dispatcher_is_only_handler(self):
+        sink = CollectingSink()
+        Logger.with_sink(sink)
+        logger = Logger('DispatchEntries')
+        logger.set_level(logging.DEBUG)
+        logger.logger.propagate = False  # the test runner attaches its own handlers to the root logger
+        queued = []
+        put = Logger.dispatcher.queue.put
+        Logger.dispatcher.queue.put = lambda item, *args, **kwargs: queued.append(item) or put(item, *args, **kwargs)
+
+        logger.info('direct', payload_type='Entry', payload={'a': 1})
+        logger.logger.propagate = True
+        logger.info('through logger')
+        Logger.flush()
+
+        assert [type(item).__name__ for item in queued] == ['LogEntry', 'LogRecord']
+        assert [record.msg for record in sink.records] == ['direct', 'through logger']
+        record = sink.records[0]
+        assert record.name == 'DispatchEntries' and record.levelno == logging.INFO
+        assert abs(record.created - record.log_entry.timestamp.timestamp()) < 0.001
+
+    def test_entry_should_have_no_instance_dict(self):
+        entry = LogEntry(LogLevel.Info, context='Context', payload_type='Type')
+
+        assert not hasattr(entry, '__dict__')
+        assert entry.levelno == logging.INFO
+
+
+class TestLogMany:
+
+    def setup_method(self):
+        Logger.shutdown()
+        self.sinks = list(Logger.sinks)
+        Logger.sinks.clear()
+
+    def teardown_method(self):
+        Logger.shutdown()
+        Logger.with_sampling(None)
+        Logger.with_queue_limits(None)
+        Logger.sinks[:] = self.sinks
+
+    def make_logger(self, context):
+        logger = Logger(context)
+        logger.set_level(logging.DEBUG)
+        logger.logger.propagate = False  # the test runner attaches its own handlers to the root logger
+        return logger
+
+    def test_entries_should_be_queued_in_batches(self):
+        sink = CollectingSink()
+        Logger.with_sink(sink)
+        logger = self.make_logger('Batch')
+        queued = []
+        put = Logger.dispatcher.queue.put
+        Logger.dispatcher.queue.put = lambda item, *args, **kwargs: queued.append(item) or put(item, *args, **kwargs)
+
+        logger.log_many(LogLevel.Info, 'Item', ({'index': i} for i in range(LOG_MANY_BATCH_SIZE + 5)), message='done')
+        Logger.flush()
+
+        assert [len(item) for item in queued] == [LOG_MANY_BATCH_SIZE, 5]
+        assert [record.log_entry.payload['index'] for record in sink.records] == list(range(LOG_MANY_BATCH_SIZE + 5))
+        dto = json.loads(sink.format(sink.records[0]))
+        assert (dto['context'], dto['payload_type'], dto['message']) == ('Batch', 'Batch.Item', 'done')
+        assert Logger.dispatcher.stats()['dispatched'] == LOG_MANY_BATCH_SIZE + 5
+
+    def test_batches_should_respect_record_limit(self):
+        release = threading.Event()
+
+        class SlowSink(CollectingSink):
+            def emit(self, record):
+                release.wait()
+                CollectingSink.emit(self, record)
+
+        sink = SlowSink()
+        Logger.with_sink(sink)
+        Logger.with_queue_limits(QueueLimits(max_records=5, policy=OverflowPolicy.DropNewest, drop_report_interval=0))
+        logger = self.make_logger('BatchLimits')
+
+        logger.log_many(LogLevel.Info, 'Item', ({'index': i} for i in range(20000)))
+        queued = sum(len(item) for item in list(Logger.dispatcher.queue.queue.records))
+        release.set()
+        Logger.flush()
+
+        assert queued <= 5
+
+        reports = [record.log_entry.payload['dropped_records'] for record in sink.records
+                   if record.log_entry.payload_type == 'Logging.DroppedRecords']
+        items = [record for record in sink.records if record.log_entry.payload_type == 'BatchLimits.Item']
+        assert len(items) <= 10  # the batch being handled and a full queue
+        assert len(items) + sum(reports) == 20000
+
+    def test_batches_should_reach_sinks_without_batch_support(self):
+        sink = CollectingSink()
+        Logger.with_sinks([FailingSink(), sink])
+        logger = self.make_logger('BatchFallback')
+
+        logger.log_many(LogLevel.Info, 'Item', [{'index': 0}, lambda: {'index': 1}])
+        Logger.flush()
+
+        assert [record.log_entry.payload for record in sink.records] == [{'index': 0}, {'index': 1}]
+        assert Logger.dispatcher.stats()['sink_errors'] == 1
+
+    def test_entries_should_be_logged_one_by_one_through_other_handlers(self):
+        sink = CollectingSink()
+        Logger.with_sink(sink)
+        logger = Logger('BatchPropagated')
+        logger.set_level(logging.DEBUG)
+
+        logger.log_many(LogLevel.Info, 'Item', [{'index': i} for i in range(3)])
+        logger.log_many(LogLevel.Debug, '', [{'untyped': True}])
+        Logger.flush()
+
+        assert [record.log_entry.payload_type for record in sink.records][:3] == ['BatchPropagated.Item'] * 3
+        assert sink.records[3].log_entry.payload_type.startswith('BatchPropagated.MissingPayloadType')
+        assert 'lacks a payload type' in sink.records[4].msg
+
+    def test_disabled_level_should_not_consume_payloads(self):
+        sink = CollectingSink()
+        Logger.with_sink(sink)
+        logger = self.make_logger('BatchDisabled')
+        logger.set_level(logging.INFO)
+        payloads = iter([{'index': 0}])
+
+        logger.log_many(LogLevel.Debug, 'Item', payloads)
+        Logger.flush()
+
+        assert sink.records == [] and next(payloads) == {'index': 0}
+
+    def test_sampled_entries_should_be_left_out_of_batches(self):
+        sink = CollectingSink()
+        Logger.with_sink(sink)
+        Logger.with_sampling(Sampler([SamplingRule(SamplingKey.PayloadType, rate=0.001, burst=3)],
+                                     report=SuppressionReport.NextEntry))
+        logger = self.make_logger('BatchSampled')
+
+        logger.log_many(LogLevel.Info, 'Item', [{'index': i} for i in range(10)])
+        Logger.flush()
+
+        assert [record.log_entry.payload['index'] for record in sink.records] == [0, 1, 2]
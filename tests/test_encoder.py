@@ -0,0 +1,94 @@
+import datetime
+import decimal
+import enum
+import json
+import uuid
+
+import pytest
+
+from loggingpy.encoder import JsonEncoder, orjson
+from loggingpy.log import JsonFormatter, LogLevel
+
+
+class Point:
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self._hidden = 'hidden'
+        self.callback = lambda: None
+
+
+class Tree:
+
+    def _ast(self):
+        return {'node': 'root', 'children': [Point(1, 2)]}
+
+
+class Tag(str):
+    pass
+
+
+class IntLevel(enum.IntEnum):
+    Info = 20
+
+
+class Slotted:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return 'Slotted({})'.format(self.value)
+
+
+PAYLOADS = [
+    {'message': 'plain', 'count': 3, 'ratio': 0.25, 'ok': True, 'missing': None},
+    {'nested': {'list': [1, 2, [3, {'deep': 'ü'}]], 'tuple': (1, 'two'), 'empty': {}, 'none': []}},
+    {'text': 'Grüezi 日本 "quoted" \\ \n\t'},
+    {'id': uuid.UUID('12345678-1234-5678-1234-567812345678'), 'ids': [uuid.uuid4() for _ in range(2)]},
+    {'timestamp': datetime.datetime(2020, 1, 2, 3, 4, 5, 6, tzinfo=datetime.timezone.utc),
+     'date': datetime.date(2020, 1, 2)},
+    {'amount': decimal.Decimal('1.10'), 'level': LogLevel.Info, 'slotted': Slotted(3)},
+    {'point': Point(1, Point(2, 3)), 'tree': Tree(), 'bytes': b'ab', 'set': {1}},
+    {'floats': [float('nan'), float('inf'), float('-inf'), 1e100, -0.0]},
+    {1: 'int key', 2.5: 'float key', False: 'bool key', None: 'none key'},
+    {'generator': (i * i for i in range(3)), 'range': range(3)},
+]
+
+
+class TestJsonEncoder:
+
+    @pytest.mark.parametrize('payload', PAYLOADS)
+    def test_output_should_match_to_dict_and_json_dumps(self, payload):
+        formatter = JsonFormatter()
+        if any(hasattr(value, '__next__') for value in payload.values()):
+            expected = json.dumps(formatter.to_dict(dict(payload, generator=[0, 1, 4])), default=str)
+        else:
+            expected = json.dumps(formatter.to_dict(payload), default=str)
+
+        assert JsonEncoder().encode(payload) == expected
+
+    def test_dispatch_table_should_be_filled_per_type(self):
+        encoder = JsonEncoder()
+        encoder.encode({'points': [Point(1, 2), Point(3, 4)], 'id': uuid.uuid4()})
+
+        assert set(encoder._converters) == {Point, uuid.UUID}
+
+    def test_subclasses_of_scalars_should_be_encoded_as_value(self):
+        assert JsonEncoder().encode({'tag': Tag('tag'), 'level': IntLevel.Info}) == '{"tag": "tag", "level": 20}'
+
+    def test_unsupported_key_should_fail_like_json_dumps(self):
+        with pytest.raises(TypeError):
+            JsonEncoder().encode({(1, 2): 'tuple key'})
+
+    def test_unknown_backend_should_fail(self):
+        with pytest.raises(ValueError):
+            JsonEncoder('yaml')
+
+    @pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+    def test_orjson_backend_should_encode_same_values(self):
+        payload = {'point': Point(1, 2), 'tree': Tree(), 'id': uuid.UUID(int=1), 'set': {1}, 'text': 'Grüezi'}
+
+        assert json.loads(JsonEncoder('orjson').encode(payload)) == json.loads(JsonEncoder().encode(payload))
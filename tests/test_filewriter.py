@@ -0,0 +1,136 @@
+import gzip
+import json
+import logging
+import os
+import time
+
+from loggingpy.filewriter import FileWriter, FsyncPolicy
+from loggingpy.log import Logger, LogLevel
+from loggingpy.queues import QueueLimits, OverflowPolicy
+from loggingpy.sink import BundlingFileSink
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as file:
+        return file.read().decode('utf-8').splitlines()
+
+
+class TestFileWriter:
+
+    def test_records_should_be_written_in_one_chunk(self, tmpdir):
+        writer = FileWriter(str(tmpdir.join('app.log')), flush_interval=60)
+        for i in range(100):
+            writer.append(str(i))
+        writer.close()
+
+        assert read_lines(writer.path) == [str(i) for i in range(100)]
+        stats = writer.stats()
+        assert (stats['records_written'], stats['chunks_written'], stats['fsyncs']) == (100, 1, 1)
+
+    def test_records_should_be_written_after_flush_interval(self, tmpdir):
+        writer = FileWriter(str(tmpdir.join('app.log')), flush_interval=0.05, fsync=FsyncPolicy.Never)
+        writer.append('late')
+        time.sleep(0.5)
+
+        assert read_lines(writer.path) == ['late']
+        writer.close()
+        assert writer.stats()['fsyncs'] == 0
+
+    def test_flush_should_write_pending_records(self, tmpdir):
+        writer = FileWriter(str(tmpdir.join('app.log')), flush_interval=60)
+        writer.append('flushed')
+        writer.flush()
+
+        assert read_lines(writer.path) == ['flushed']
+        assert writer.stats()['fsyncs'] == 1
+        writer.close()
+
+    def test_file_should_be_rotated_and_compressed(self, tmpdir):
+        writer = FileWriter(str(tmpdir.join('app.log')), max_bytes=20, backup_count=2, compression='gzip',
+                            flush_interval=60)
+        for i in range(5):
+            writer.append('record {:03d}'.format(i))  # 11 bytes with the newline, so one record per file
+            writer.flush()
+        writer.close()
+
+        rotated = writer.rotated_files()
+        assert len(rotated) == 2 and all(path.endswith('.gz') for path in rotated)
+        assert [read_lines(path) for path in rotated] == [['record 002'], ['record 003']]
+        assert read_lines(writer.path) == ['record 004']
+        assert writer.stats()['rotations'] == 4
+
+    def test_file_should_be_rotated_by_age(self, tmpdir):
+        writer = FileWriter(str(tmpdir.join('app.log')), max_bytes=None, max_age=0.05, flush_interval=60)
+        writer.append('old')
+        writer.flush()
+        time.sleep(0.1)
+        writer.append('new')
+        writer.close()
+
+        assert [read_lines(path) for path in writer.rotated_files()] == [['old']]
+        assert read_lines(writer.path) == ['new']
+
+    def test_overflow_should_drop_and_report(self, tmpdir):
+        writer = FileWriter(str(tmpdir.join('app.log')), flush_interval=60,
+                            limits=QueueLimits(max_records=2, policy=OverflowPolicy.DropNewest,
+                                               drop_report_interval=0),
+                            drop_reporter=lambda dropped: 'dropped {}'.format(dropped))
+        for i in range(4):
+            writer.append(str(i))
+        writer.close()
+
+        assert read_lines(writer.path) == ['0', '1', 'dropped 2']
+        assert writer.stats()['records_dropped'] == 2
+
+    def test_unsupported_compression_should_be_rejected(self, tmpdir):
+        try:
+            FileWriter(str(tmpdir.join('app.log')), compression='lz4')
+            assert False
+        except ValueError:
+            pass
+
+
+class TestBundlingFileSink:
+
+    def setup_method(self):
+        Logger.shutdown()
+        self.sinks = list(Logger.sinks)
+        Logger.sinks.clear()
+
+    def teardown_method(self):
+        Logger.shutdown()
+        Logger.sinks[:] = self.sinks
+
+    def test_entries_should_be_written_as_json_lines(self, tmpdir):
+        path = str(tmpdir.join('logs', 'app.log'))
+        sink = BundlingFileSink('app', 'test', path)
+        Logger.with_sink(sink)
+        logger = Logger('File')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(10):
+            logger.info(str(i))
+        Logger.flush()
+        sink.close()
+
+        records = [json.loads(line) for line in read_lines(path)]
+        assert [record['message'] for record in records] == [str(i) for i in range(10)]
+        assert records[0]['app_name'] == 'app' and records[0]['env'] == 'TEST'
+        assert os.path.getsize(path) == sink.stats()['bytes_written']
+
+    def test_batch_should_be_written_as_json_lines(self, tmpdir):
+        path = str(tmpdir.join('app.log'))
+        sink = BundlingFileSink('app', 'test', path)
+        Logger.with_sink(sink)
+        logger = Logger('FileBatch')
+        logger.set_level(logging.DEBUG)
+        logger.logger.propagate = False  # the test runner attaches its own handlers to the root logger
+
+        logger.log_many(LogLevel.Info, 'Item', ({'index': i} for i in range(10)))
+        Logger.flush()
+        sink.close()
+
+        records = [json.loads(line) for line in read_lines(path)]
+        assert [record['file_batch_item']['index'] for record in records] == list(range(10))
+        assert sink.stats()['chunks_written'] == 1
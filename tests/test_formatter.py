@@ -0,0 +1,101 @@
+import datetime
+import json
+
+from loggingpy.log import JsonFormatter, LogEntry, LogEntryParser, LogLevel, Logger
+from loggingpy.sink import BundlingHttpSink
+
+
+def make_record():
+    return Logger.make_record(LogEntry(LogLevel.Info, context='Context', payload_type='Type', message='Grüezi',
+                                       payload={'stuff': 1}))
+
+
+class TestJsonFormatter:
+
+    def test_spliced_fields_should_match_full_serialization(self):
+        record = make_record()
+        fields = JsonFormatter.encode_fields({'app_name': 'app', 'env': 'PROD'})
+
+        formatted = JsonFormatter().format_with_fields(record, fields)
+
+        dto = LogEntryParser.parse_log_entry(record.log_entry)
+        dto['app_name'] = 'app'
+        dto['env'] = 'PROD'
+        assert formatted == json.dumps(JsonFormatter().to_dict(dto), default=str)
+
+    def test_record_should_be_serialized_once_for_all_formatters(self, monkeypatch):
+        calls = []
+        serialize = JsonFormatter.serialize
+        monkeypatch.setattr(JsonFormatter, 'serialize',
+                            lambda self, record: calls.append(record) or serialize(self, record))
+        record = make_record()
+
+        outputs = [JsonFormatter().format_with_fields(record, JsonFormatter.encode_fields({'app_name': str(i)}))
+                   for i in range(3)]
+
+        assert len(calls) == 1
+        assert [json.loads(output)['app_name'] for output in outputs] == ['0', '1', '2']
+
+    def test_sink_should_not_set_its_fields_on_shared_record(self):
+        sink = BundlingHttpSink('app', 'test', 'http://localhost:1')
+        sink.setFormatter(JsonFormatter())
+        record = make_record()
+
+        dto = json.loads(sink._format(record))
+        sink.http_sender.close()
+
+        assert dto['app_name'] == 'app'
+        assert dto['env'] == 'TEST'
+        assert not hasattr(record, 'app_name')
+        assert 'app_name' not in json.loads(JsonFormatter().format(record))
+
+
+class TestEntryEncoding:
+
+    def entries(self):
+        try:
+            raise ValueError('broken')
+        except ValueError as e:
+            exception = e
+
+        yield LogEntry(LogLevel.Info, context='Context', payload_type='Context.OrderPlaced', payload={'id': 1})
+        yield LogEntry(LogLevel.Warning, context=None, payload_type='Type', payload='text', message='Grüezi')
+        yield LogEntry(LogLevel.Error, context='Context', payload_type='', message='no payload type',
+                       exception=exception)
+        yield LogEntry(LogLevel.Debug, context='Context', payload_type=None, payload={'ignored': True})
+        yield LogEntry(LogLevel.Fatal, context='Context', payload_type='Type', message=None)
+
+    def test_encoded_entry_should_match_dto_serialization(self):
+        formatter = JsonFormatter()
+        for entry in self.entries():
+            dto = LogEntryParser.parse_log_entry(entry)
+            assert formatter.encode_entry(entry) == json.dumps(formatter.to_dict(dto), default=str)
+
+    def test_derived_names_should_be_cached(self):
+        formatter = JsonFormatter()
+        formatter.encode_entry(LogEntry(LogLevel.Info, context='Cache', payload_type='Cache.Hit', payload={}))
+        before = LogEntryParser.cache_info()
+
+        for _ in range(10):
+            formatter.encode_entry(LogEntry(LogLevel.Info, context='Cache', payload_type='Cache.Hit', payload={}))
+            LogEntryParser.qualified_payload_type('Cache', 'Hit')
+        after = LogEntryParser.cache_info()
+
+        assert after['header_fragment'].hits - before['header_fragment'].hits == 10
+        assert after['header_fragment'].misses == before['header_fragment'].misses
+        assert LogEntryParser.property_name('Cache.HitCount') == 'cache_hit_count'
+
+    def test_timestamp_should_render_like_str_of_datetime(self):
+        for timestamp_ns in (0, 1577934245000006000, 1577934245123456789, 1577934245000000000, 1577934246999999999):
+            entry = LogEntry(LogLevel.Info, context='Context', payload_type='Type')
+            entry.timestamp_ns = timestamp_ns
+
+            assert LogEntryParser.format_timestamp(timestamp_ns) == str(entry.timestamp)
+
+    def test_captured_timestamp_should_be_utc_datetime(self):
+        before = datetime.datetime.now(datetime.timezone.utc)
+        entry = LogEntry(LogLevel.Info, context='Context', payload_type='Type')
+
+        assert entry.timestamp_ns is not None
+        assert entry.timestamp.utcoffset() == datetime.timedelta(0)
+        assert before - datetime.timedelta(seconds=1) <= entry.timestamp <= datetime.datetime.now(datetime.timezone.utc)
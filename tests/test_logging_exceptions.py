@@ -1,4 +1,7 @@
-from loggingpy.log import LogEntry, LogEntryParser, LogLevel
+import traceback
+
+from loggingpy.exceptions import ExceptionSnapshot
+from loggingpy.log import LogEntry, LogEntryParser, LogLevel, EXCEPTION_CACHE_SIZE
 
 
 class TestLoggingExceptions:
@@ -34,6 +37,59 @@ class TestLoggingExceptions:
 
         assert dto1['exception_info']['exception_hash'] != dto2['exception_info']['exception_hash']
 
+    def test_exception_fingerprint_should_be_cached_by_code_location(self):
+        LogEntryParser.hash_exception(TestLoggingExceptions.create_exception(True, 'first'))
+        before = LogEntryParser.cache_info()['exception_fingerprint']
+
+        for message in ('second', 'third'):
+            exception = TestLoggingExceptions.create_exception(True, message)
+            assert LogEntryParser.exception_to_string(exception).endswith(message)
+        after = LogEntryParser.cache_info()['exception_fingerprint']
+
+        assert after.hits - before.hits == 2
+        assert after.misses == before.misses
+
+    def test_cached_stack_trace_should_match_traceback(self):
+        exception = TestLoggingExceptions.create_exception(False, 'message')
+        LogEntryParser.exception_to_string(exception)
+
+        expected = ''.join(traceback.format_list(traceback.extract_tb(exception.__traceback__)))
+        assert LogEntryParser.exception_to_string(exception) == expected + '\n  {} {}'.format(
+            ZeroDivisionError, 'message')
+
+    def test_exception_fingerprint_cache_should_be_bounded(self):
+        for i in range(EXCEPTION_CACHE_SIZE + 10):
+            code = compile('def fail():\n' + '\n' * i + '    raise ValueError()', '<generated>', 'exec')
+            namespace = {}
+            exec(code, namespace)
+            try:
+                namespace['fail']()
+            except ValueError as e:
+                LogEntryParser.hash_exception(e)
+
+        assert LogEntryParser.cache_info()['exception_fingerprint'].currsize == EXCEPTION_CACHE_SIZE
+
+    def test_snapshot_should_parse_like_exception(self):
+        exception = TestLoggingExceptions.create_exception(False, 'snapshot')
+
+        assert LogEntryParser.parse_exception(ExceptionSnapshot(exception)) == LogEntryParser.parse_exception(exception)
+
+    def test_snapshot_should_keep_innermost_frames(self):
+        def fail(depth):
+            if depth:
+                fail(depth - 1)
+            raise KeyError('deep')
+
+        try:
+            fail(5)
+        except KeyError as e:
+            exception = e
+
+        snapshot = ExceptionSnapshot(exception, max_frames=2)
+        assert len(snapshot.locations) == 2
+        assert [frame.name for frame in snapshot.stack_summary()] == ['fail', 'fail']
+        assert 'test_snapshot_should_keep_innermost_frames' not in LogEntryParser.exception_to_string(snapshot)
+
     # helper methods
     @staticmethod
     def create_dto(alternate_stack_trace: bool=False, message: str=error_message):
@@ -0,0 +1,141 @@
+import logging
+
+from benchmarks.stub_server import StubServer
+from loggingpy.log import Logger
+from loggingpy.metrics import Histogram
+from loggingpy.queues import QueueLimits, OverflowPolicy
+from loggingpy.sender import HttpSender, get_logger
+from loggingpy.sink import BundlingHttpSink
+from loggingpy.spool import DiskSpool
+from tests.helpers import CollectingSink
+
+
+class TestHistogram:
+
+    def test_observations_should_be_counted_in_buckets(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        assert snapshot['buckets'] == {'1': 2, '10': 1, 'inf': 1}
+        assert (snapshot['count'], snapshot['sum'], snapshot['max']) == (4, 56.5, 50)
+
+
+class TestSenderMetrics:
+
+    def setup_method(self):
+        self.server = StubServer().start()
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_stats_should_count_records_and_batches(self):
+        sender = HttpSender(self.server.url, flush_max_records=10)
+        for i in range(25):
+            sender.append(str(i))
+        sender.close()
+
+        stats = sender.stats()
+        assert stats['records_appended'] == 25
+        assert stats['records_sent'] == 25
+        assert stats['batches_sent'] == 3
+        assert stats['bytes_sent'] == stats['batch_bytes']['sum']
+        assert stats['upload_latency']['count'] == 3
+        assert stats['queue_depth'] == 0
+
+    def test_stats_should_count_failures(self, tmpdir):
+        self.server.status_code = 503
+        sender = HttpSender(self.server.url, max_tries=2, retry_base_delay=0.01, spool=DiskSpool(str(tmpdir)))
+        sender.append('failed')
+        sender.flush()
+        sender.close()
+
+        stats = sender.stats()
+        assert stats['failed_attempts'] == 2
+        assert stats['retries'] == 1
+        assert (stats['batches_given_up'], stats['records_given_up'], stats['records_spooled']) == (1, 1, 1)
+        assert stats['spool_bytes'] > 0
+
+    def test_stats_should_count_drops(self):
+        sender = HttpSender(self.server.url, logs_drain_timeout=60,
+                            limits=QueueLimits(max_records=1, policy=OverflowPolicy.DropNewest))
+        sender.append('kept')
+        sender.append('dropped')
+
+        stats = sender.stats()
+        sender.close()
+        assert (stats['queue_depth'], stats['records_dropped']) == (1, 1)
+
+    def test_senders_should_share_single_stdout_handler(self):
+        for _ in range(3):
+            get_logger(False)
+
+        assert len(logging.getLogger('loggingpy.sender').handlers) == 1
+
+
+class TestLoggerStats:
+
+    def setup_method(self):
+        Logger.shutdown()
+        self.sinks = list(Logger.sinks)
+        Logger.sinks.clear()
+        self.server = StubServer().start()
+
+    def teardown_method(self):
+        Logger.shutdown()
+        Logger.with_stats_reporting(None)
+        Logger.sinks[:] = self.sinks
+        self.server.stop()
+
+    def test_stats_should_cover_dispatcher_and_sinks(self):
+        sink = BundlingHttpSink('app', 'test', self.server.url)
+        Logger.with_sinks([sink, CollectingSink(decode=True)])
+        logger = Logger('Stats')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(10):
+            logger.info(str(i))
+        Logger.flush()
+        stats = Logger.stats()
+        sink.close()
+
+        assert stats['dispatch']['dispatched'] == 10
+        assert stats['dispatch']['queue_depth'] == 0
+        assert [sink_stats['sink'] for sink_stats in stats['sinks']] == ['BundlingHttpSink']
+        assert stats['sinks'][0]['records_sent'] == 10
+        assert Logger.stats()['dispatch']['enqueue_rate'] == 0
+
+    def test_stats_should_be_reported_periodically(self):
+        sink = CollectingSink(decode=True)
+        Logger.with_sink(sink)
+        logger = Logger('StatsReport')
+        logger.set_level(logging.DEBUG)
+        Logger.with_stats_reporting(0)
+
+        logger.info('first')
+        Logger.with_stats_reporting(3600)
+        logger.info('second')
+        Logger.flush()
+
+        assert [entry.get('message') for entry in sink.records] == [None, 'first', 'second']
+        assert sink.records[0]['payload_type'] == 'Logging.Stats'
+        assert 'dispatch' in sink.records[0]['logging_stats']
+
+    def test_stats_should_be_reported_through_other_handlers_above_info(self):
+        sink = CollectingSink(decode=True)
+        Logger.with_sink(sink)
+        logger = Logger('StatsWarning')
+        logger.set_level(logging.WARNING)
+        root_handler = logging.NullHandler()
+        logging.getLogger().addHandler(root_handler)
+        Logger.with_stats_reporting(0)
+
+        try:
+            logger.warning('first')
+            Logger.flush()
+        finally:
+            logging.getLogger().removeHandler(root_handler)
+
+        assert sink.records[0]['payload_type'] == 'Logging.Stats'
+        assert [entry.get('message') for entry in sink.records].count('first') == 1
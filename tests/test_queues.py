@@ -0,0 +1,80 @@
+import json
+import logging
+
+from loggingpy.queues import BoundedQueue, OverflowPolicy, QueueLimits, RecordBuffer
+from loggingpy.log import Logger, JsonFormatter, LogBatch
+
+
+def fill(buffer, levels):
+    for index, level in enumerate(levels):
+        if buffer.has_room() or buffer.make_room(level) >= 0:
+            buffer.append(index, level)
+
+
+class TestRecordBuffer:
+
+    def test_drop_newest_should_keep_first_records(self):
+        buffer = RecordBuffer(QueueLimits(max_records=3, policy=OverflowPolicy.DropNewest))
+        fill(buffer, [logging.INFO] * 5)
+
+        assert list(buffer.records) == [0, 1, 2]
+        assert buffer.dropped.total == 2
+
+    def test_drop_oldest_should_keep_last_records(self):
+        buffer = RecordBuffer(QueueLimits(max_records=3, policy=OverflowPolicy.DropOldest))
+        fill(buffer, [logging.INFO] * 5)
+
+        assert list(buffer.records) == [2, 3, 4]
+        assert buffer.dropped.total == 2
+
+    def test_drop_below_level_should_keep_warnings(self):
+        buffer = RecordBuffer(QueueLimits(max_records=3, policy=OverflowPolicy.DropBelowLevel))
+        fill(buffer, [logging.INFO, logging.WARNING, logging.INFO, logging.ERROR, logging.DEBUG, logging.WARNING])
+
+        assert list(buffer.records) == [1, 3, 5]
+        assert buffer.dropped.total == 3
+
+    def test_byte_limit_should_apply_to_record_sizes(self):
+        buffer = RecordBuffer(QueueLimits(max_bytes=10, policy=OverflowPolicy.DropOldest), sizeof=len)
+        for record in (b'1234', b'5678', b'90ab'):
+            if buffer.has_room(len(record)) or buffer.make_room(logging.INFO, len(record)) >= 0:
+                buffer.append(record, logging.INFO)
+
+        assert list(buffer.records) == [b'5678', b'90ab']
+        assert buffer.size == 8
+
+
+class TestBoundedQueue:
+
+    def test_dropped_records_should_be_reported_by_synthetic_entry(self):
+        limits = QueueLimits(max_records=2, policy=OverflowPolicy.DropNewest, drop_report_interval=0)
+        log_queue = BoundedQueue(limits, drop_reporter=lambda dropped: Logger.drop_report_record(dropped, 'test'))
+        for index in range(5):
+            log_queue.put_nowait(logging.makeLogRecord({'msg': str(index), 'levelno': logging.INFO}))
+
+        report = log_queue.get()
+        dto = json.loads(JsonFormatter().format(report))
+        assert dto['payload_type'] == 'Logging.DroppedRecords'
+        assert dto['logging_dropped_records']['dropped_records'] == 3
+        assert [log_queue.get().msg, log_queue.get().msg] == ['0', '1']
+
+    def test_block_should_drop_after_timeout(self):
+        limits = QueueLimits(max_records=1, policy=OverflowPolicy.Block, block_timeout=0.05)
+        log_queue = BoundedQueue(limits)
+        log_queue.put_nowait(logging.makeLogRecord({'msg': '0'}))
+        log_queue.put_nowait(logging.makeLogRecord({'msg': '1'}))
+
+        assert log_queue.qsize() == 1
+        assert log_queue.queue.dropped.total == 1
+
+    def test_batch_should_count_its_records(self):
+        limits = QueueLimits(max_records=5, policy=OverflowPolicy.DropOldest)
+        log_queue = BoundedQueue(limits)
+        for first in (0, 3, 6):
+            batch = LogBatch(logging.INFO)
+            batch.extend(range(first, first + 3))
+            log_queue.put_nowait(batch)
+
+        assert log_queue.get() == [6, 7, 8]
+        assert log_queue.queue.dropped.total == 6
+        assert log_queue.queue.count == 0
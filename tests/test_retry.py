@@ -0,0 +1,83 @@
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy.retry import CircuitBreaker, CircuitState, RetryScheduler, backoff_delay
+from loggingpy.sender import HttpSender
+from loggingpy.spool import DiskSpool
+
+
+def wait_for_records(server, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while server.records < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return server.records
+
+
+class TestRetryScheduling:
+
+    def test_backoff_should_be_jittered_and_capped(self):
+        delays = [backoff_delay(3, base_delay=1, max_delay=60) for _ in range(100)]
+        assert all(0 <= delay <= 4 for delay in delays)
+        assert len(set(delays)) > 1
+        assert all(backoff_delay(20, base_delay=1, max_delay=5) <= 5 for _ in range(100))
+
+    def test_scheduler_should_only_hand_out_due_items(self):
+        scheduler = RetryScheduler()
+        scheduler.schedule('later', 60)
+        scheduler.schedule('now', 0)
+
+        assert scheduler.pop_due() == ['now']
+        assert scheduler.pop_due(everything=True) == ['later']
+
+    def test_circuit_should_open_and_probe_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.Open
+        assert not breaker.allow_request()
+
+        time.sleep(0.06)
+        assert breaker.allow_request()  # the probe
+        assert not breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == CircuitState.Closed
+
+
+class TestSenderRetries:
+
+    def setup_method(self):
+        self.server = StubServer().start()
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_failed_batch_should_not_block_fresh_batches(self, monkeypatch):
+        monkeypatch.setattr('loggingpy.sender.backoff_delay', lambda attempt, base_delay, max_delay: 1)  # no jitter
+        self.server.status_code = 503
+        sender = HttpSender(self.server.url, logs_drain_timeout=0.05, max_tries=10)
+        sender.append('first')
+        time.sleep(0.2)  # the first batch failed and is parked
+
+        self.server.status_code = 200
+        sender.append('second')
+        assert wait_for_records(self.server, 1, timeout=0.5) == 1  # well before the first retry is due
+        assert wait_for_records(self.server, 2) == 2
+        sender.close()
+
+    def test_open_circuit_should_spool_and_resume_after_probe(self, tmpdir):
+        self.server.status_code = 503
+        sender = HttpSender(self.server.url, logs_drain_timeout=0.05, retry_base_delay=0.01, max_tries=10,
+                            circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.3),
+                            spool=DiskSpool(str(tmpdir)))
+        for i in range(5):
+            sender.append('log %s' % i)
+            time.sleep(0.1)
+        assert sender.circuit_breaker.state != CircuitState.Closed
+        assert not sender.spool.is_empty()
+
+        self.server.status_code = 200
+        assert wait_for_records(self.server, 5) == 5
+        sender.close()
+        assert sender.circuit_breaker.state == CircuitState.Closed
+        assert sender.spool.is_empty()
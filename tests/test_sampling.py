@@ -0,0 +1,135 @@
+import logging
+
+from loggingpy.log import Logger
+from loggingpy.sampling import Sampler, SamplingKey, SamplingRule, SuppressionReport, TokenBucket
+from tests.helpers import CollectingSink, fail
+
+
+class TestSampler:
+
+    def test_token_bucket_should_allow_burst(self):
+        bucket = TokenBucket(rate=0.001, burst=3)
+
+        assert [bucket.take() for _ in range(5)] == [True, True, True, False, False]
+
+    def test_rate_limit_should_apply_per_key_value(self):
+        sampler = Sampler([SamplingRule(SamplingKey.PayloadType, rate=0.001, burst=2)])
+
+        first = [sampler.sample({SamplingKey.PayloadType: 'A'}) for _ in range(4)]
+        second = [sampler.sample({SamplingKey.PayloadType: 'B'}) for _ in range(2)]
+
+        assert first == [0, 0, None, None]
+        assert second == [0, 0]
+
+    def test_entries_without_key_value_should_not_be_sampled(self):
+        sampler = Sampler([SamplingRule(SamplingKey.ExceptionHash, rate=0.001, burst=1)])
+
+        assert [sampler.sample({SamplingKey.Level: 'Error'}) for _ in range(3)] == [0, 0, 0]
+
+    def test_probability_should_sample_share_of_entries(self):
+        sampler = Sampler([SamplingRule(SamplingKey.Level, probability=0.1)])
+
+        kept = sum(sampler.sample({SamplingKey.Level: 'Info'}) is not None for _ in range(10000))
+
+        assert 700 < kept < 1300
+
+    def test_summary_should_collect_suppressed_entries(self):
+        sampler = Sampler([SamplingRule(SamplingKey.Level, rate=0.001, burst=1)], report=SuppressionReport.Summary)
+        for _ in range(4):
+            sampler.sample({SamplingKey.Level: 'Error'})
+
+        assert sampler.take_summary() == []
+        assert sampler.take_summary(force=True) == [{'key': 'level', 'value': 'Error', 'count': 3}]
+        assert sampler.take_summary(force=True) == []
+
+    def test_invalid_rules_should_fail(self):
+        for arguments in ({'rate': 0}, {'probability': 2}):
+            try:
+                SamplingRule(SamplingKey.Level, **arguments)
+                assert False
+            except ValueError:
+                pass
+
+
+class TestLoggerSampling:
+
+    def setup_method(self):
+        Logger.shutdown()
+        self.sinks = list(Logger.sinks)
+        Logger.sinks.clear()
+        self.sink = CollectingSink(decode=True)
+        Logger.with_sink(self.sink)
+
+    def teardown_method(self):
+        Logger.shutdown()
+        Logger.with_sampling(None)
+        Logger.sinks[:] = self.sinks
+
+    def test_suppressed_count_should_be_added_to_next_entry(self):
+        sampler = Sampler([SamplingRule(SamplingKey.PayloadType, rate=0.001, burst=1)])
+        Logger.with_sampling(sampler)
+        logger = Logger('Sampled')
+        logger.set_level(logging.DEBUG)
+
+        for _ in range(5):
+            logger.info('hot', payload_type='Hot')
+        logger.info('other', payload_type='Other')
+        sampler._buckets[0]['Sampled.Hot'].tokens = 1  # refill the bucket of Hot at once
+        logger.info('hot again', payload_type='Hot')
+        Logger.flush()
+
+        assert [entry['message'] for entry in self.sink.records] == ['hot', 'other', 'hot again']
+        assert [entry.get('suppressed_entries') for entry in self.sink.records] == [None, None, 4]
+
+    def test_suppressed_entries_should_not_be_evaluated(self):
+        Logger.with_sampling(Sampler([SamplingRule(SamplingKey.Context, rate=0.001, burst=1)]))
+        logger = Logger('SampledLazy')
+        logger.set_level(logging.DEBUG)
+        evaluated = []
+
+        for i in range(3):
+            logger.info(lambda: evaluated.append(i) or 'lazy')
+        Logger.flush()
+
+        assert evaluated == [0]
+
+    def test_exception_storm_should_be_limited_by_exception_hash(self):
+        Logger.with_sampling(Sampler([SamplingRule(SamplingKey.ExceptionHash, rate=0.001, burst=2)],
+                                     report=SuppressionReport.Summary))
+        logger = Logger('SampledStorm')
+        logger.set_level(logging.DEBUG)
+
+        for i in range(10):
+            try:
+                fail(str(i))
+            except ValueError as e:
+                logger.error('failed', exception=e)
+        logger.error('no exception')
+        Logger.flush()
+
+        messages = [entry['message'] for entry in self.sink.records]
+        assert messages[:3] == ['failed', 'failed', 'no exception']
+        summary = self.sink.records[3]
+        assert summary['payload_type'] == 'Logging.SuppressedEntries'
+        assert summary['logging_suppressed_entries']['suppressed_entries'] == 8
+        assert summary['logging_suppressed_entries']['keys'][0]['key'] == 'exception_hash'
+
+    def test_summary_should_be_reported_through_other_handlers_above_warning(self):
+        sampler = Sampler([SamplingRule(SamplingKey.Context, rate=0.001, burst=1)], report=SuppressionReport.Summary,
+                          summary_interval=0)
+        Logger.with_sampling(sampler)
+        logger = Logger('SampledError')
+        logger.set_level(logging.ERROR)
+        root_handler = logging.NullHandler()
+        logging.getLogger().addHandler(root_handler)
+
+        try:
+            for i in range(10):
+                logger.error(str(i))
+        finally:
+            logging.getLogger().removeHandler(root_handler)
+        Logger.flush()
+
+        summaries = [entry['logging_suppressed_entries']['suppressed_entries'] for entry in self.sink.records
+                     if entry['payload_type'] == 'Logging.SuppressedEntries']
+        assert sum(summaries) == 9
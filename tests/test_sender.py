@@ -0,0 +1,191 @@
+import os
+import time
+import zlib
+
+from benchmarks.stub_server import StubServer
+from loggingpy.queues import QueueLimits, OverflowPolicy
+from loggingpy.sender import HttpSender, PooledHttpTransport, SingleShotHttpTransport, PlainBatch, CompressedBatch, \
+    COMPRESSION_WBITS
+
+
+class TestTransport:
+
+    def setup_method(self):
+        self.server = StubServer().start()
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_pooled_transport_should_reuse_connection(self):
+        transport = PooledHttpTransport()
+        for _ in range(10):
+            assert transport.post(self.server.url, 'log').status_code == 200
+        transport.close()
+
+        assert self.server.requests == 10
+        assert self.server.connections == 1
+
+    def test_single_shot_transport_should_connect_per_request(self):
+        transport = SingleShotHttpTransport()
+        for _ in range(3):
+            transport.post(self.server.url, 'log')
+
+        assert self.server.connections == 3
+
+
+class TestPlainBatch:
+
+    def test_size_should_be_exact_wire_size(self):
+        batch = PlainBatch()
+        for record in ('{"message": "Grüezi"}', '{"message": "日本"}', '{"message": "plain"}'):
+            batch.add(record.encode('utf-8'))
+
+        assert batch.size == len(batch.body())
+
+    def test_batch_should_fill_limit_exactly(self):
+        batch = PlainBatch(max_size=100)
+        while batch.add(b'123456789'):
+            pass
+
+        assert batch.size == len(batch.body()) == 99
+        assert batch.is_full()
+
+    def test_oversized_record_should_be_sent_alone(self):
+        batch = PlainBatch(max_size=10)
+        assert batch.add(b'x' * 20)
+        assert not batch.add(b'x')
+        assert batch.records == [b'x' * 20]
+
+
+class TestCompressedBatch:
+
+    def test_compressed_body_should_contain_all_records(self):
+        for encoding in ('gzip', 'deflate'):
+            batch = CompressedBatch(encoding)
+            for i in range(100):
+                assert batch.add(b'{"message": "record %d"}' % i)
+
+            body = zlib.decompress(batch.body(), COMPRESSION_WBITS[encoding])
+            assert body == b'\n'.join(batch.records)
+
+    def test_compressed_size_should_never_exceed_limit(self):
+        batch = CompressedBatch('gzip', max_size=4096)
+        rejected = None
+        for i in range(10000):
+            # random payloads barely compress which makes the limit tight
+            record = b'{"message": "%s"}' % os.urandom(64)
+            if not batch.add(record):
+                rejected = record
+                break
+
+        assert rejected is not None
+        assert rejected not in batch.records
+        assert len(batch.body()) <= 4096
+
+    def test_compressed_size_should_count_first_record(self):
+        for level in (1, 9):
+            # the compressor only emits the gzip header for the first record, which it holds back completely
+            batch = CompressedBatch('gzip', level=level, max_size=2000)
+            assert batch.add(os.urandom(990))
+            while batch.add(os.urandom(990)):
+                pass
+
+            assert len(batch.records) == 1
+            assert len(batch.body()) <= 2000
+
+
+def wait_for_records(server, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while server.records < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return server.records
+
+
+class TestFlushScheduling:
+
+    def setup_method(self):
+        self.server = StubServer().start()
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_single_record_should_be_sent_after_max_age(self):
+        sender = HttpSender(self.server.url, logs_drain_timeout=0.2)
+        start = time.monotonic()
+        sender.append('log')
+
+        assert wait_for_records(self.server, 1) == 1
+        assert 0.2 <= time.monotonic() - start < 1.5
+        sender.close()
+
+    def test_complete_batch_should_be_sent_before_max_age(self):
+        sender = HttpSender(self.server.url, logs_drain_timeout=60, flush_max_records=100)
+        start = time.monotonic()
+        for _ in range(100):
+            sender.append('log')
+
+        assert wait_for_records(self.server, 100) == 100
+        assert time.monotonic() - start < 1.5
+        sender.close()
+
+    def test_burst_should_be_sent_completely(self):
+        sender = HttpSender(self.server.url, logs_drain_timeout=60, flush_max_records=500)
+        for i in range(20000):
+            sender.append('log %s' % i)
+
+        assert wait_for_records(self.server, 20000) == 20000
+        assert self.server.requests >= 20000 // 500
+        sender.close()
+
+    def test_concurrent_uploads_should_deliver_everything_on_flush(self):
+        self.server.latency = 0.05
+        sender = HttpSender(self.server.url, logs_drain_timeout=60, flush_max_records=100, concurrency=4)
+        start = time.monotonic()
+        for i in range(2000):
+            sender.append('log %s' % i)
+        sender.flush()
+
+        assert self.server.records == 2000
+        assert time.monotonic() - start < 20 * 0.05  # 20 bulks in series would take at least a second
+        assert len([t for t in sender._upload_threads if t.is_alive()]) == 4
+        sender.close()
+        assert not any(t.is_alive() for t in sender._upload_threads)
+
+    def test_extended_records_should_be_sent_in_batches(self):
+        sender = HttpSender(self.server.url, logs_drain_timeout=60, flush_max_records=100)
+        sender.extend([('log %s' % i, 20) for i in range(250)])
+
+        assert wait_for_records(self.server, 200) >= 200
+        sender.close()
+        assert self.server.records == 250
+        assert sender.stats()['records_appended'] == 250
+
+    def test_limits_should_shed_records_and_report_them(self):
+        limits = QueueLimits(max_records=10, policy=OverflowPolicy.DropOldest, drop_report_interval=0)
+        sender = HttpSender(self.server.url, logs_drain_timeout=60, limits=limits,
+                            drop_reporter=lambda dropped: 'dropped %s' % dropped)
+        for i in range(25):
+            sender.append('log %s' % i)
+        sender.flush()
+
+        # the sending thread may take the full buffer in between, whatever got dropped is reported once
+        dropped = sender._buffer.dropped.total
+        assert self.server.records == 25 - dropped + (1 if dropped else 0)
+        assert self.server.records >= 10
+        sender.close()
+
+    def test_non_ascii_records_should_be_sent_as_utf8(self):
+        sender = HttpSender(self.server.url, logs_drain_timeout=60)
+        sender.append('{"message": "Grüezi"}')
+        sender.append('{"message": "日本"}')
+        sender.close()
+
+        assert self.server.records == 2
+
+    def test_close_should_send_pending_records(self):
+        sender = HttpSender(self.server.url, logs_drain_timeout=60)
+        sender.append('log')
+        sender.close()
+
+        assert self.server.records == 1
+        assert not sender.sending_thread.is_alive()
@@ -0,0 +1,109 @@
+import os
+import time
+
+from benchmarks.stub_server import StubServer
+from loggingpy.queues import QueueLimits
+from loggingpy.sender import HttpSender
+from loggingpy.spool import DiskSpool
+
+
+def wait_for_records(server, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while server.records < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return server.records
+
+
+class TestDiskSpool:
+
+    def test_batches_should_be_read_back_in_order(self, tmpdir):
+        spool = DiskSpool(str(tmpdir))
+        spool.append([b'a', b'b'])
+        spool.append([b'c'])
+
+        batches = [batch for path in spool.closed_segments() for batch in spool.read(path)]
+        assert batches == [[b'a', b'b'], [b'c']]
+
+    def test_segments_should_rotate_and_respect_max_bytes(self, tmpdir):
+        spool = DiskSpool(str(tmpdir), max_bytes=1000, segment_bytes=100)
+        for i in range(50):
+            spool.append([b'x' * 50])
+
+        segments = spool.closed_segments()
+        assert len(segments) > 1
+        assert spool.size <= 1000
+        assert spool.dropped_bytes > 0
+        assert sum(os.path.getsize(path) for path in segments) == spool.size
+
+    def test_torn_write_should_end_segment(self, tmpdir):
+        spool = DiskSpool(str(tmpdir))
+        spool.append([b'complete'])
+        spool.append([b'torn'])
+        path = spool.closed_segments()[0]
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 2)
+
+        assert list(spool.read(path)) == [[b'complete']]
+
+    def test_spool_should_survive_restart(self, tmpdir):
+        spool = DiskSpool(str(tmpdir))
+        spool.append([b'a'])
+        spool.close()
+
+        spool = DiskSpool(str(tmpdir))
+        spool.append([b'b'])
+        batches = [batch for path in spool.closed_segments() for batch in spool.read(path)]
+        assert batches == [[b'a'], [b'b']]
+
+    def test_deleted_segment_should_have_no_batches(self, tmpdir):
+        spool = DiskSpool(str(tmpdir))
+        spool.append([b'a'])
+        path = spool.closed_segments()[0]
+        os.remove(path)
+
+        assert list(spool.read(path)) == []
+
+
+class TestSpoolReplay:
+
+    def setup_method(self):
+        self.server = StubServer().start()
+
+    def teardown_method(self):
+        self.server.stop()
+
+    def test_spool_of_previous_process_should_be_replayed_on_startup(self, tmpdir):
+        spool = DiskSpool(str(tmpdir))
+        spool.append([b'a', b'b'])
+        spool.append([b'c'])
+        spool.close()
+
+        sender = HttpSender(self.server.url, spool=DiskSpool(str(tmpdir)))
+        assert wait_for_records(self.server, 3) == 3
+        sender.close()
+        assert sender.spool.is_empty()
+
+    def test_replay_should_skip_segment_deleted_meanwhile(self, tmpdir):
+        spool = DiskSpool(str(tmpdir), segment_bytes=1)
+        spool.append([b'deleted'])
+        spool.append([b'kept'])
+        segments = spool.closed_segments()
+        # the replay lists the segments, then the oldest one is deleted to enforce the maximum size
+        spool.closed_segments = lambda: segments
+        spool._delete(segments[0])
+
+        sender = HttpSender(self.server.url, spool=spool)
+        assert wait_for_records(self.server, 1) == 1
+        sender.close()
+        assert spool.is_empty()
+
+    def test_overflow_should_be_spooled_and_replayed(self, tmpdir):
+        sender = HttpSender(self.server.url, logs_drain_timeout=60, limits=QueueLimits(max_records=10),
+                            spool=DiskSpool(str(tmpdir)))
+        for i in range(100):
+            sender.append('log %s' % i)
+        sender.flush()
+        sender.close()
+
+        assert self.server.records == 100
+        assert sender.spool.is_empty()